@@ -0,0 +1,102 @@
+import re
+from dataclasses import dataclass, field
+from ptxprint.utils import nonScriptureBooks
+import logging
+
+logger = logging.getLogger(__name__)
+
+_parlinere = re.compile(r"^\\@([a-zA-Z@]+)\s*\{(.*?)\}\s*$")
+
+@dataclass
+class PageInfo:
+    pageno:     int
+    books:      set = field(default_factory=set)
+
+@dataclass
+class SplitPart:
+    """ A run of books typeset by its own XeTeX job. totalpages is the number of pages
+        shipped before the part starts (which decides odd page alignment) and pageno the
+        page number its first page gets. """
+    index:      int
+    bookindices: list
+    totalpages: int
+    pageno:     int
+    pagereset:  bool = False
+    last:       bool = False
+    texfname:   str = None
+
+    @property
+    def first(self):
+        return self.index == 0
+
+def readPages(fname):
+    """ Returns the pages in a .parlocs file in the order they were shipped, with the
+        books that have text on each. """
+    res = []
+    try:
+        with open(fname, encoding="utf-8", errors="ignore") as inf:
+            for l in inf:
+                m = _parlinere.match(l)
+                if not m:
+                    continue
+                c = m.group(1)
+                if c == "pgstart":
+                    try:
+                        res.append(PageInfo(int(m.group(2).split("}{")[0])))
+                    except ValueError:
+                        res.append(PageInfo(res[-1].pageno + 1 if len(res) else 1))
+                elif c == "parstart" and len(res):
+                    ref = m.group(2).split("}{")[0]
+                    if len(ref) >= 3:
+                        res[-1].books.add(ref[:3].upper())
+    except FileNotFoundError:
+        return None
+    return res
+
+def planParts(pages, bookids, numparts):
+    """ Splits bookids into at most numparts runs of books, balanced by the pages they took
+        in the previous run (pages as from readPages). A part may only start with a book that
+        started on a fresh page, so that each part can be typeset on its own and give the same
+        pages. Returns a list of SplitPart, or None if the books cannot be split. """
+    if pages is None or numparts < 2 or len(bookids) < 2 or any(b == "MOD" for b in bookids):
+        return None
+    firsts = {}
+    lasts = {}
+    for i, p in enumerate(pages):
+        for b in p.books:
+            firsts.setdefault(b, i)
+            lasts[b] = i
+    if any(b not in firsts for b in bookids):
+        return None
+    # where each possible part boundary is: index of the first page after the previous book
+    starts = [0]
+    for j in range(1, len(bookids)):
+        prevend = max(lasts[b] for b in bookids[:j])
+        if min(firsts[b] for b in bookids[j:]) <= prevend:
+            starts.append(None)
+        else:
+            starts.append(prevend + 1)
+    target = len(pages) / numparts
+    cuts = [0]
+    for j in range(1, len(bookids)):
+        if starts[j] is None or len(cuts) >= numparts:
+            continue
+        if starts[j] - starts[cuts[-1]] >= target and len(pages) - starts[j] >= target / 2:
+            cuts.append(j)
+    if len(cuts) < 2:
+        return None
+    res = []
+    scripture = False
+    for i, c in enumerate(cuts):
+        end = cuts[i+1] if i + 1 < len(cuts) else len(bookids)
+        k = starts[c]
+        part = SplitPart(i, list(range(c, end)), k, pages[k].pageno, pagereset=scripture)
+        scripture = scripture or any(bookids[b] not in nonScriptureBooks for b in part.bookindices)
+        res.append(part)
+    res[-1].last = True
+    logger.debug("Split into parts: " + "; ".join(" ".join(bookids[b] for b in p.bookindices) for p in res))
+    return res
+
+def pageStartTex(part):
+    """ TeX to start a part on its page """
+    return "\\catcode`\\@=11 \\global\\totalp@ges={} \\catcode`\\@=12 \\pageno={}\n".format(part.totalpages, part.pageno)
@@ -1,6 +1,7 @@
 
 import re, os
 import regex
+from bisect import bisect_left
 from ptxprint.utils import universalopen
 from usfmtc.reference import RefList
 from functools import reduce
@@ -9,6 +10,119 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+_chapterreg = regex.compile(r"\\c\s")
+_markerreg = regex.compile(r"\\[cv]\s")
+_lastindex = None
+
+def chapterIndex(s):
+    """ Returns the positions of all the \\c markers in s. The most recent index is
+        kept, since successive at rules mostly run over the same unchanged text. """
+    global _lastindex
+    if _lastindex is None or _lastindex[0] is not s:
+        _lastindex = (s, [m.start() for m in _chapterreg.finditer(s)])
+    return _lastindex[1]
+
+
+class SpanMatch:
+    def __init__(self, s, start, end):
+        self.string = s
+        self.span = (start, end)
+
+    def group(self, i=0):
+        return self.string[self.span[0]:self.span[1]]
+
+    def start(self, i=0):
+        return self.span[0]
+
+    def end(self, i=0):
+        return self.span[1]
+
+
+class RefSpans:
+    """ Finds the text of a chapter, or of a verse in a chapter, for an at rule. This
+        stands in for the regex that would otherwise find it, by looking the chapter
+        up in an index of chapter markers and only searching that chapter for the verse.
+        verse is None for a whole chapter, "" for the chapter up to its first verse. """
+
+    def __init__(self, chapter, verse=None):
+        self.chapter = str(chapter)
+        self.verse = verse
+        if verse is None:
+            self.pattern = r"(?<=\\c {}\D).*?(?=$|\\c\s)".format(chapter)
+        elif verse == "":
+            self.pattern = r"(?<=\\c {}\D).*?(?=$|\\[cv]\s)".format(chapter)
+        else:
+            self.pattern = r"\\c {}\D(?:[^\\]|\\(?!c\s))*?\K\\v {}\D.*?(?=$|\\[cv]\s)".format(chapter, verse)
+            self.versereg = regex.compile(r"\\v {}\D".format(regex.escape(verse)))
+
+    def __repr__(self):
+        return "RefSpans({!r})".format(self.pattern)
+
+    def cacheKey(self):
+        return self.pattern
+
+    def _isChapter(self, s, i):
+        """ Is the \\c at i followed by a space, our chapter and then a non digit? """
+        e = i + 3 + len(self.chapter)
+        return s[i+2] == " " and s.startswith(self.chapter, i+3) and e < len(s) and not s[e].isdecimal()
+
+    def spans(self, s):
+        """ Returns the (start, end) of each piece of s the regex in self.pattern would
+            match, including its quirks. """
+        cpos = chapterIndex(s)
+        dollar = len(s) - 1 if s.endswith("\n") else len(s)
+        def endof(start, chapters, after=False):
+            """ Where .*?(?=$|...) ends, starting from start. If after, it may not be
+                empty (as after an empty match). """
+            if chapters:
+                j = bisect_left(cpos, start+1 if after else start)
+                res = cpos[j] if j < len(cpos) else len(s)
+            else:
+                m = _markerreg.search(s, start+1 if after else start)
+                res = m.start() if m else len(s)
+            if dollar > start or (dollar == start and not after):
+                res = min(res, dollar)
+            return res
+        res = []
+        last = 0
+        for c in cpos:
+            if not self._isChapter(s, c):
+                continue
+            start = c + len(self.chapter) + 4
+            end = None
+            if self.verse is None or self.verse == "":
+                if start < last:    # the lookbehind may overlap the last match, but not the match
+                    continue
+                end = endof(start, self.verse is None)
+                if end == start and end < len(s):
+                    # like the regex, follow an empty match with one from the same place
+                    res.append((start, end))
+                    end = endof(start, self.verse is None, after=True)
+            elif c >= last:
+                k = bisect_left(cpos, start)
+                m = self.versereg.search(s, start)
+                if m is not None and (k >= len(cpos) or m.start() < cpos[k]):
+                    start = m.start()
+                    end = endof(m.end(), False)
+            if end is None:
+                continue
+            res.append((start, end))
+            last = end
+        return res
+
+    def sub(self, repl, s):
+        res = []
+        last = 0
+        for (start, end) in self.spans(s):
+            res.append(s[last:start])
+            res.append(repl(SpanMatch(s, start, end)))
+            last = end
+        if not len(res):
+            return s
+        res.append(s[last:])
+        return "".join(res)
+
+
 def make_contextsfn(bk, *changes):
     # functional programmers eat your hearts out
     def makefn(reg, currfn):
@@ -21,17 +135,22 @@ def make_contextsfn(bk, *changes):
             def compfn(fn, b, s):
                 return reg.sub(lambda m:fn(m.group(0)), s) if bk is None or b == bk else s
         return compfn
-    return reduce(lambda currfn, are: makefn(are, currfn), reversed([c for c in changes if c is not None]), None)
+    res = reduce(lambda currfn, are: makefn(are, currfn), reversed([c for c in changes if c is not None]), None)
+    if res is not None:
+        res.book = bk       # lets runChanges only offer the change to its book
+    return res
 
 def printError(msg, **kw):
     print(msg)
 
-def readChanges(fname, bk, passes=None, get_usfm=None, doError=printError):
+def readChanges(fname, bk, passes=None, get_usfm=None, doError=printError, files=None):
     changes = {}
     if passes is None:
         passes = ["default"]
     if not os.path.exists(fname):
         return {}
+    if files is not None:
+        files.append(fname)
     logger.debug("Reading changes file: "+fname)
     usfm = None
     if get_usfm and bk:
@@ -66,7 +185,7 @@ def readChanges(fname, bk, passes=None, get_usfm=None, doError=printError):
                 continue
             m = re.match(r"^\s*include\s+(['\"])(.*?)\1", l)
             if m:
-                lchs = readChanges(os.path.join(os.path.dirname(fname), m.group(2)), bk, passes=passes, get_usfm=get_usfm)
+                lchs = readChanges(os.path.join(os.path.dirname(fname), m.group(2)), bk, passes=passes, get_usfm=get_usfm, files=files)
                 for k, v in lchs.items():
                     changes.setdefault(k, []).extend(v)
                 continue
@@ -85,9 +204,9 @@ def readChanges(fname, bk, passes=None, get_usfm=None, doError=printError):
                         continue
                     for cr in r.allchaps():
                         if cr.first.verse is None:
-                            atcontexts.append((r.book, regex.compile(r"(?<=\\c {}\D).*?(?=$|\\c\s)".format(r.chapter), flags=regex.S)))
+                            atcontexts.append((r.book, RefSpans(r.chapter)))
                         elif cr.first.verse == 0:
-                            atcontexts.append((r.book, regex.compile(r"(?<=\\c {}\D).*?(?=$|\\[cv]\s)".format(r.chapter), flags=regex.S)))
+                            atcontexts.append((r.book, RefSpans(r.chapter, "")))
                         else:
                             for cv in r:
                                 v = None
@@ -101,7 +220,7 @@ def readChanges(fname, bk, passes=None, get_usfm=None, doError=printError):
                                     outv = '{}{}'.format(cv.verse, cv.subverse or "")
                                 else:
                                     outv = "{}{}-{}{}".format(v.first.verse, v.first.subverse or "", v.last.verse, v.last.subverse or "")
-                                atcontexts.append((cv.book, regex.compile(r"\\c {}\D(?:[^\\]|\\(?!c\s))*?\K\\v {}\D.*?(?=$|\\[cv]\s)".format(cv.chapter, outv), flags=regex.S|regex.V1)))
+                                atcontexts.append((cv.book, RefSpans(cv.chapter, outv)))
                 l = l[m.end():].strip()
             else:
                 atcontexts = [None]
@@ -135,7 +254,8 @@ def readChanges(fname, bk, passes=None, get_usfm=None, doError=printError):
                     ch = (context, r, m.group(3) or m.group(4) or "", f"{fname} line {i+1}")
                     for p in passes:
                         changes.setdefault(p, []).append(ch)
-                    logger.log(7, f"{context=} {r=} {m.groups()=}")
+                    if logger.isEnabledFor(7):
+                        logger.log(7, f"{context=} {r=} {m.groups()=}")
                 continue
             elif len(l):
                 logger.warning(f"Faulty change line found in {fname} at line {i}:\n{l}")
@@ -0,0 +1,270 @@
+import os, json, hashlib, types
+from shutil import copyfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TrackingDict(dict):
+    """ A dict that can record which keys are looked up or set, so that we know
+        which settings a conversion depended on. """
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.tracked = None
+
+    def track(self, on=True):
+        """ Starts (or stops) recording keys. Returns the keys recorded so far. """
+        res = self.tracked
+        self.tracked = set() if on else None
+        return res
+
+    def __getitem__(self, k):
+        if self.tracked is not None:
+            self.tracked.add(k)
+        return super().__getitem__(k)
+
+    def __setitem__(self, k, v):
+        if self.tracked is not None:
+            self.tracked.add(k)
+        super().__setitem__(k, v)
+
+    def __contains__(self, k):
+        if self.tracked is not None:
+            self.tracked.add(k)
+        return super().__contains__(k)
+
+    def get(self, k, default=None):
+        if self.tracked is not None:
+            self.tracked.add(k)
+        return super().get(k, default)
+
+    def setdefault(self, k, default=None):
+        if self.tracked is not None:
+            self.tracked.add(k)
+        return super().setdefault(k, default)
+
+
+def textDigest(*txts):
+    m = hashlib.sha1()
+    for t in txts:
+        m.update(str(t).encode("utf-8", errors="surrogatepass"))
+        m.update(b"\0")
+    return m.hexdigest()
+
+def valueDigest(v):
+    """ Returns a text that stands for v, or None if what v does cannot be told from
+        its value (e.g. an object holding the state of a job) """
+    if v is None or isinstance(v, (bool, int, float, str, bytes)):
+        return repr(v)
+    if isinstance(v, (tuple, list)):
+        res = [valueDigest(x) for x in v]
+        return None if None in res else "({})".format(",".join(res))
+    if isinstance(v, frozenset):
+        return valueDigest(sorted(v, key=repr))
+    if isinstance(v, types.CodeType):
+        res = [valueDigest(x) for x in v.co_consts]
+        return None if None in res else textDigest(v.co_code, v.co_names, *res)
+    if hasattr(v, "cacheKey"):
+        return textDigest(type(v).__qualname__, v.cacheKey())
+    if isinstance(v, types.FunctionType):
+        return callableDigest(v)
+    if hasattr(v, "pattern") and hasattr(v, "flags") and hasattr(v, "sub"):
+        return textDigest(type(v).__module__, v.pattern, v.flags)
+    return None
+
+def callableDigest(fn):
+    """ Fingerprints a function by its code and by the values it has captured, so that
+        two closures made by the same code with different values differ. Returns None
+        if that cannot be done. """
+    if hasattr(fn, "cacheKey"):
+        return valueDigest(fn)
+    if not isinstance(fn, types.FunctionType):
+        return None
+    parts = [fn.__module__, fn.__qualname__, valueDigest(fn.__code__), valueDigest(fn.__defaults__)]
+    for c in fn.__closure__ or []:
+        try:
+            parts.append(valueDigest(c.cell_contents))
+        except ValueError:      # an empty cell
+            parts.append("")
+    for k, v in sorted(fn.__dict__.items()):
+        parts.extend([k, valueDigest(v)])
+    return None if None in parts else textDigest(*parts)
+
+def rulesDigest(changes):
+    """ Fingerprints a list of changes as (context, regex, replacement, location).
+        Returns None if a context or replacement function cannot be fingerprinted. """
+    res = []
+    for c in changes:
+        ctxt = c[0] if c[0] is None or isinstance(c[0], str) else callableDigest(c[0])
+        repl = c[2] if isinstance(c[2], str) else callableDigest(c[2])
+        if ctxt is None and c[0] is not None or repl is None:
+            return None
+        res.append((ctxt, c[1].pattern, c[1].flags, repl, c[3]))
+    return textDigest(*res)
+
+def fileDigest(fpath, memo=None):
+    """ Returns the sha1 of a file's contents, or None if there is no such file. memo
+        remembers digests by path, modification time and size. """
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return None
+    k = (fpath, st.st_mtime_ns, st.st_size)
+    if memo is None or k not in memo:
+        m = hashlib.sha1()
+        with open(fpath, "rb") as inf:
+            for b in iter(lambda: inf.read(1 << 20), b""):
+                m.update(b)
+        if memo is None:
+            return m.hexdigest()
+        memo[k] = m.hexdigest()
+    return memo[k]
+
+def linkorcopy(srcpath, tgtpath):
+    """ Hard links tgtpath to srcpath, or copies it where links are not possible. Any
+        existing tgtpath is removed first rather than written through. """
+    try:
+        os.remove(tgtpath)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(srcpath, tgtpath)
+    except OSError:
+        copyfile(srcpath, tgtpath)
+
+
+class ConversionCache:
+    """ Keeps each converted book along with a record of what it was made from (source
+        text, changes, adjlist, hyphenation and the settings the conversion read) so
+        that a book whose inputs are unchanged can be copied rather than converted. """
+
+    version = 1
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.hits = 0
+        self.misses = 0
+        self.filedigests = {}
+
+    def fileDigest(self, fpath):
+        return fileDigest(fpath, self.filedigests)
+
+    def takeCounts(self):
+        """ Returns (hits, misses) since the last call, for a worker to hand back """
+        res = (self.hits, self.misses)
+        self.hits = self.misses = 0
+        return res
+
+    def addCounts(self, counts):
+        self.hits += counts[0]
+        self.misses += counts[1]
+
+    def _paths(self, key):
+        base = os.path.join(self.cachedir, key)
+        return (base + ".json", base + ".usfm")
+
+    def fetch(self, key, deps, settings, outfpath):
+        """ If the cache entry for key was made from deps and the same values of the
+            settings it read, copies its text to outfpath and returns the entry's extra
+            data (a dict). Otherwise returns None. """
+        (manifest, textpath) = self._paths(key)
+        try:
+            with open(manifest, encoding="utf-8") as inf:
+                entry = json.load(inf)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if entry.get("version") != self.version or entry.get("deps") != deps \
+                or any(repr(settings.get(k)) != v for k, v in entry.get("settings", {}).items()) \
+                or not os.path.exists(textpath):
+            logger.debug(f"Conversion cache miss for {key}")
+            self.misses += 1
+            return None
+        copyfile(textpath, outfpath)
+        logger.debug(f"Conversion cache hit for {key}")
+        self.hits += 1
+        return entry.get("extras", {})
+
+    def store(self, key, deps, settings, keys, outfpath, extras=None):
+        (manifest, textpath) = self._paths(key)
+        entry = {"version": self.version, "deps": deps, "extras": extras or {},
+                 "settings": {k: repr(settings.get(k)) for k in sorted(keys, key=str) if isinstance(k, str)}}
+        try:
+            os.makedirs(self.cachedir, exist_ok=True)
+            copyfile(outfpath, textpath)
+            with open(manifest, "w", encoding="utf-8") as outf:
+                json.dump(entry, outf, ensure_ascii=False, indent=1)
+        except OSError as e:
+            logger.warning(f"Failed to cache conversion of {outfpath}: {e}")
+
+
+class ImageCache:
+    """ Keeps processed illustrations, each named by a digest of its source file and of
+        how it was processed (page ratio, cropping, colour space), so that an unchanged
+        picture is linked or copied into place rather than processed again. Entries not
+        used by a job are pruned at its end, so the cache only holds the current pictures. """
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.hits = 0
+        self.misses = 0
+        self.filedigests = {}
+        self.used = set()
+
+    def key(self, srcpath, *params):
+        """ Returns the cache key for processing srcpath with params, or None if srcpath
+            cannot be read """
+        digest = fileDigest(srcpath, self.filedigests)
+        if digest is None:
+            return None
+        return textDigest(digest, *params)
+
+    def _path(self, key, ext):
+        return os.path.join(self.cachedir, key + ext.lower())
+
+    def fetch(self, key, tgtpath):
+        """ Puts the cached picture for key at tgtpath. Returns False if there is none. """
+        cpath = self._path(key, os.path.splitext(tgtpath)[1])
+        if not os.path.exists(cpath):
+            self.misses += 1
+            return False
+        try:
+            linkorcopy(cpath, tgtpath)
+        except OSError as e:
+            logger.warning(f"Failed to fetch {tgtpath} from the picture cache: {e}")
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.used.add(os.path.basename(cpath))
+        return True
+
+    def store(self, key, tgtpath):
+        cpath = self._path(key, os.path.splitext(tgtpath)[1])
+        try:
+            os.makedirs(self.cachedir, exist_ok=True)
+            # link via a temporary name so a half written entry is never seen
+            tmppath = "{}.{}.tmp".format(cpath, os.getpid())
+            linkorcopy(tgtpath, tmppath)
+            os.replace(tmppath, cpath)
+        except OSError as e:
+            logger.warning(f"Failed to cache picture {tgtpath}: {e}")
+            return
+        self.used.add(os.path.basename(cpath))
+
+    def prune(self):
+        """ Removes the entries that have not been fetched or stored since the cache was
+            made. Returns how many were removed. """
+        try:
+            fnames = os.listdir(self.cachedir)
+        except FileNotFoundError:
+            return 0
+        res = 0
+        for f in fnames:
+            if f in self.used:
+                continue
+            try:
+                os.remove(os.path.join(self.cachedir, f))
+                res += 1
+            except OSError as e:
+                logger.warning(f"Failed to remove {f} from the picture cache: {e}")
+        return res
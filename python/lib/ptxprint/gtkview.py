@@ -4795,8 +4795,9 @@ class GtkViewModel(ViewModel):
             val = 0.10 if val < 0.1 else (1. + 19 * val) / 20
         wid.set_progress_fraction(val)
 
-    def incrementProgress(self, inproc=False, stage="pr", run=0):
-        GLib.idle_add(self._incrementProgress)
+    def incrementProgress(self, inproc=False, stage="pr", run=0, detail=None, advance=True):
+        if advance:
+            GLib.idle_add(self._incrementProgress)
         currMsg = self.builder.get_object("t_find").get_placeholder_text()
         if stage == 'lo' and run > 0:
             msg = _(f"Redoing layout {run}...")
@@ -4804,9 +4805,12 @@ class GtkViewModel(ViewModel):
             msg = ""
         else:
             msg = _progress[stage]
+        if detail is not None:
+            msg = "{} {}".format(msg, detail)
         GLib.idle_add(lambda: self.builder.get_object("t_find").set_placeholder_text(msg))
         if inproc:
-            self._incrementProgress()
+            if advance:
+                self._incrementProgress()
             while (Gtk.events_pending()):
                 Gtk.main_iteration_do(False)
 
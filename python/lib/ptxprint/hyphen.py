@@ -126,6 +126,11 @@ class Hyphenation:
         self.has2010 = False
         self.has2011 = False
         self.chars = None
+        # hyphenated form of each word seen, by hyphen char, shared by all the books in a job
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.time = 0.
 
     def __len__(self):
         return len(self.wordlist)
@@ -164,23 +169,42 @@ class Hyphenation:
     def hyphenate(self, t, hyphenchar):
         t = t.replace("-", hyphenchar)
         bits = self.splitre.split(t)
-        for i in range(0, len(bits), 2):
-            s = bits[i].replace("-", hyphenchar)
-            if s.lower() in self:
-                h = self.get(s.lower()).lower()
-                if s.lower() != s:
-                    hbits = h.split("-")
-                    hpos = list(accumulate([len(x) for x in hbits]))
-                    r = [s[x:y] for x, y in zip([0] + hpos, hpos)]
-                    bits[i] = "\u00AD".join(r)
-                    logger.log(6,f"hyphenating {s} at {hpos} giving {'-'.join(r)}")
-                else:
-                    logger.log(6,f"hyphenating {s} giving {h}")
-                    bits[i] = h.replace("-", "\u00AD")
-            else:
-                bits[i] = s
+        cache = self.cache.setdefault(hyphenchar, {})
+        words = bits[::2]
+        res = [cache.get(w, None) for w in words]
+        if None in res:
+            for i, w in enumerate(words):
+                if res[i] is None:
+                    res[i] = cache.get(w, None)     # may have been earlier in this text
+                    if res[i] is None:
+                        self.misses += 1
+                        res[i] = cache[w] = self.hyphenateWord(w)
+                        continue
+                self.hits += 1
+        else:
+            self.hits += len(res)
+        bits[::2] = res
         return "".join(bits)
 
+    def hyphenateWord(self, s):
+        if s.lower() in self:
+            h = self.get(s.lower()).lower()
+            if s.lower() != s:
+                hbits = h.split("-")
+                hpos = list(accumulate([len(x) for x in hbits]))
+                r = [s[x:y] for x, y in zip([0] + hpos, hpos)]
+                logger.log(6,f"hyphenating {s} at {hpos} giving {'-'.join(r)}")
+                return "\u00AD".join(r)
+            else:
+                logger.log(6,f"hyphenating {s} giving {h}")
+                return h.replace("-", "\u00AD")
+        return s
+
+    def stats(self):
+        """ Describes how well the cache of hyphenated words is doing """
+        total = self.hits + self.misses
+        return _("{} words, {:.0%} from the cache, {:.2f}s").format(total, self.hits / total if total else 0, self.time)
+
 
 class Hunspell:
 
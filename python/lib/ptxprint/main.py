@@ -72,6 +72,11 @@ def main(doitfn=None):
     parser.add_argument('--logfile', default='ptxprint.log', help='Set log file (default: ptxprint.log) or "none"')
     parser.add_argument('--timeout', type=int, default=1200, help="XeTeX runtime timeout (seconds)")
     parser.add_argument('--debug', action="store_true", help="Enable debug output")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of worker processes for parallel stages (-1 = all cores)")
+    parser.add_argument('--noconvcache', action="store_true", help="Always reconvert books rather than reusing unchanged ones")
+    parser.add_argument('--nopiccache', action="store_true", help="Always reprocess illustrations rather than reusing unchanged ones")
+    parser.add_argument('--format', action="store_true", help="Run XeTeX from a dumped format of the TeX macros rather than inputting them every run (experimental)")
+    parser.add_argument('--split', action="store_true", help="Typeset runs of books as parallel XeTeX jobs, placed by the previous run, and join the PDFs")
     parser.add_argument('-C', '--capture', help="Capture interaction events (not yet used)")
 
     # Font Settings
@@ -19,11 +19,6 @@ import re, os
 def simplefloat(s, dp=3):
     return ("{:."+str(dp)+"f}").format(s).rstrip("0").rstrip(".")
 
-def parsestrtok(s):
-    if not isinstance(s, str):
-        return s
-    return PdfObject(s)
-
 def rgb_to_cmyk(r, g, b, maxsat=0.):
     k = 1 - max(r, g, b)
     if k < 1.0:
@@ -47,7 +42,33 @@ def cmyk_to_rgb(c, m, y, k):
     return [r, g, b]
 
 
+_delims = r"\s()<>\[\]{}/%"
+_tokre = re.compile(r"(?:\s+|%[^\r\n]*)*(?:(?P<name>/[^{0}]*)|(?P<open><<|\[)|(?P<close>>>|\])"
+                    r"|(?P<hex><[^>]*>)|(?P<str>\()|(?P<kw>[^{0}]+)|(?P<other>.))".format(_delims), re.S)
+_numstarts = set("0123456789+-.")
+_strre = re.compile(r"[()\\]")
+_eire = re.compile(r"\sEI(?=\s|$)")
+
+def _endstring(strm, pos):
+    """ Returns the position after the literal string whose ( is before pos """
+    depth = 1
+    while depth:
+        m = _strre.search(strm, pos)
+        if m is None:
+            return len(strm)
+        c = m.group()
+        pos = m.end()
+        if c == "\\":
+            pos += 1
+        elif c == "(":
+            depth += 1
+        else:
+            depth -= 1
+    return pos
+
+
 class PdfStreamParser:
+    opmap = {}
 
     def __init__(self, imgcache=None):
         self.cache = set()
@@ -92,34 +113,57 @@ class PdfStreamParser:
             i.stream = strm
 
     def parsestream(self, rdr, strm, **kw):
+        """ Passes the text of the stream through untouched, except for the operators
+            that this class has a method for, which are replaced by what it returns. """
         self.kw = kw
+        handlers = getattr(self, "handlers", None)
+        if handlers is None:
+            handlers = self.handlers = {}
         res = []
-        operands = []
-        toks = PdfTokens(strm)
-        for t in toks:
-            func = rdr.special.get(t)
-            if func is not None:
-                val = func(toks)
-                if isinstance(val, PdfArray):
-                    val = PdfArray([parsestrtok(x) for x in val])
-                elif isinstance(val, PdfDict):
-                    val = PdfDict({k: parsestrtok(v) for k, v in val.items()})
-                operands.append(val)
-        
-            elif isinstance(t, (PdfString, BasePdfName)):
-                operands.append(t)
-            elif re.match(r"^[+-]?(\d+(\.\d*)?|\.\d+)", t):
-                operands.append(t)
-            elif t in ("true", "false", "null"):
-                operands.append(t)
-            else:       # must be an operator
-                fn = getattr(self, self.opmap.get(t, t), None)
-                if fn is None:
-                    res.append(" ".join(str(x) for x in (operands + [t])))
-                else:
-                    res.append(" ".join(fn(t, operands, **kw)))
-                operands = []
-        return "\r\n".join(res)
+        done = 0            # end of the text already in res
+        operands = []       # (start, end) of each operand of the coming operator
+        depth = 0           # nesting of arrays and dictionaries
+        pos = 0
+        while True:
+            m = _tokre.match(strm, pos)
+            if m is None:
+                break
+            kind = m.lastgroup
+            s = m.start(kind)
+            pos = m.end()
+            if kind == "str":
+                pos = _endstring(strm, pos)
+            elif kind == "open":
+                if not depth:
+                    opstart = s
+                depth += 1
+                continue
+            elif kind == "close":
+                if depth:
+                    depth -= 1
+                    if not depth:
+                        operands.append((opstart, pos))
+                continue
+            if depth:
+                continue
+            if kind != "kw" or strm[s] in _numstarts or strm[s:pos] in ("true", "false", "null"):
+                operands.append((s, pos))
+                continue
+            op = strm[s:pos]
+            if op == "ID":
+                m = _eire.search(strm, pos + 1)
+                pos = m.end() if m is not None else len(strm)
+            if op not in handlers:
+                handlers[op] = getattr(self, self.opmap.get(op, op), None)
+            fn = handlers[op]
+            if fn is not None:
+                cut = operands[0][0] if len(operands) else s
+                res.append(strm[done:cut])
+                res.append(" ".join(fn(op, [strm[a:b] for a, b in operands], **kw)))
+                done = pos
+            operands = []
+        res.append(strm[done:])
+        return "".join(res)
 
     def processImg(self, img):
         return img.asXobj()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+from ptxprint.pdfrw import PdfReader
+from ptxprint.pdfrw.objects import PdfDict, PdfArray, PdfName, PdfObject, IndirectPdfDict
+from ptxprint.pdf.pdfsig import buildPagesTree
+import logging
+
+logger = logging.getLogger(__name__)
+
+_inheritables = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+def _nametree(node, res):
+    """ Collects the (key, value) pairs of a name tree into res, earlier keys winning """
+    if node is None:
+        return
+    names = node.Names
+    if names is not None:
+        for i in range(0, len(names) - 1, 2):
+            k = names[i].to_bytes()
+            if k not in res:
+                res[k] = (names[i], names[i+1])
+    for k in node.Kids or []:
+        _nametree(k, res)
+
+def _makenametree(entries, n=256):
+    if len(entries) <= n:
+        return IndirectPdfDict(Names=PdfArray([x for e in entries for x in e]))
+    kids = []
+    for i in range(0, len(entries), n):
+        chunk = entries[i:i+n]
+        kids.append(IndirectPdfDict(Names=PdfArray([x for e in chunk for x in e]),
+                                    Limits=PdfArray([chunk[0][0], chunk[-1][0]])))
+    return IndirectPdfDict(Kids=PdfArray(kids))
+
+def _outlineitems(outlines):
+    if outlines is None:
+        return
+    o = outlines.First
+    while o is not None:
+        yield o
+        o = o.Next
+
+def stitch_pdfs(infiles):
+    """ Joins the PDFs in infiles, in order, into one, merging their outlines, named
+        destinations and page labels. Returns the trailer of the result. """
+    trailers = [PdfReader(f) if isinstance(f, str) else f for f in infiles]
+    res = trailers[0]
+    root = res.Root.copy()
+    allpages = []
+    dests = {}
+    olddests = PdfDict()
+    outlines = IndirectPdfDict(Type=PdfName.Outlines)
+    outcount = 0
+    lastitem = None
+    labels = []
+    for t in trailers:
+        pages = t.pages
+        plabels = t.Root.PageLabels
+        if plabels is not None and plabels.Nums is not None:
+            nums = plabels.Nums
+            for i in range(0, len(nums) - 1, 2):
+                labels.extend([PdfObject(int(nums[i]) + len(allpages)), nums[i+1]])
+        for p in pages:
+            for a in _inheritables:
+                if getattr(p, a) is None:
+                    v = getattr(p.inheritable, a)
+                    if v is not None:
+                        setattr(p, a, v)
+            allpages.append(p)
+        names = t.Root.Names
+        if names is not None:
+            _nametree(names.Dests, dests)
+        if t.Root.Dests is not None:
+            for k, v in t.Root.Dests.items():
+                if k not in olddests:
+                    olddests[k] = v
+        if t.Root.Outlines is not None:
+            for o in _outlineitems(t.Root.Outlines):
+                o.Parent = outlines
+                o.Prev = lastitem
+                if lastitem is None:
+                    outlines.First = o
+                else:
+                    lastitem.Next = o
+                lastitem = o
+            outcount += abs(int(t.Root.Outlines.Count or 0))
+    if lastitem is not None:
+        lastitem.Next = None
+        outlines.Last = lastitem
+        outlines.Count = PdfObject(outcount)
+        root.Outlines = outlines
+    else:
+        root.Outlines = None
+    root.Pages = buildPagesTree(allpages)
+    if len(dests):
+        names = root.Names.copy() if root.Names is not None else PdfDict()
+        names.Dests = _makenametree([dests[k] for k in sorted(dests.keys())])
+        root.Names = IndirectPdfDict(names)
+    if len(olddests):
+        root.Dests = olddests
+    if len(labels):
+        root.PageLabels = PdfDict(Nums=PdfArray(labels))
+    res.Root = root
+    res.private.pages = allpages
+    logger.debug(f"Stitched {len(trailers)} PDFs into {len(allpages)} pages with {len(dests)} destinations")
+    return res
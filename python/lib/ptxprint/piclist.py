@@ -35,6 +35,77 @@ def newBase(fpath):
         return re.sub(r'[()&+,.;: \-]', '_', f.lower())
 
 
+class FigureIndex:
+    """ Remembers the files and subdirectories of each directory searched for figures, so
+        that they are only listed again when the directory's mtime changes """
+
+    def __init__(self):
+        self.dirs = {}
+
+    def listdir(self, path):
+        """ Returns (files, subdirs) of path, in listing order """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return ([], [])
+        entry = self.dirs.get(path)
+        if entry is None or entry[0] != mtime:
+            files = []
+            subdirs = []
+            try:
+                with os.scandir(path) as it:
+                    for e in it:
+                        (subdirs if e.is_dir() else files).append(e.name)
+            except OSError:
+                pass
+            entry = self.dirs[path] = (mtime, files, subdirs)
+        return entry[1:]
+
+    def walk(self, path, recurse=True, seen=None):
+        """ Yields (dirpath, files) as os.walk(followlinks=True) would, without
+            looping through linked directories """
+        if seen is None:
+            seen = set()
+        rpath = os.path.realpath(path)
+        if rpath in seen:
+            return
+        seen.add(rpath)
+        (files, subdirs) = self.listdir(path)
+        yield (path, files)
+        if recurse:
+            for d in subdirs:
+                yield from self.walk(os.path.join(path, d), seen=seen)
+
+    def sources(self, srchdirs, filt, recurse=True):
+        """ Returns ({filt(name): [(filepath, ext)]}, stamps) for the files in srchdirs, in
+            search order, where ext is the lower case extension without the dot. stamps is
+            for current() to check whether the result still holds. """
+        res = {}
+        stamps = []
+        for srchdir in srchdirs:
+            if srchdir is None:
+                continue
+            for subdir, files in self.walk(srchdir, recurse=recurse):
+                stamps.append((subdir, self.dirs.get(subdir, (None,))[0]))
+                for f in files:
+                    nB = filt(f) if filt is not None else f
+                    doti = f.rfind(".")
+                    res.setdefault(nB, []).append((os.path.join(subdir, f), f[doti+1:].lower() if doti >= 0 else ""))
+        return (res, stamps)
+
+    def current(self, stamps):
+        for path, mtime in stamps:
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                if mtime is not None:
+                    return False
+        return True
+
+figureIndex = FigureIndex()
+
+
 _checks = {
     "r_picclear":       "unknown",
     "fcb_picaccept":    "Unknown",
@@ -408,6 +479,7 @@ class Piclist:
                 self.config = model.cfgid
         self.loaded = False
         self.srchlist = []
+        self.srcindex = None
 
     def __delitem__(self, k):
         del self.pics[k]
@@ -619,6 +691,7 @@ class Piclist:
 
     def build_searchlist(self, figFolder=None, exclusive=False, imgorder="", lowres=True):
         self.srchlist = [figFolder] if figFolder is not None else []
+        self.srcindex = None
         chkpaths = []
         for d in ("local", ""):
             if sys.platform.startswith("win"):
@@ -664,39 +737,37 @@ class Piclist:
             newk = filt(f['src']) if filt is not None else f['src']
             newfigs.setdefault(newk, []).append(f)
         logger.debug(f"{newfigs=}")
-        for srchdir in self.srchlist:
-            if srchdir is None or not os.path.exists(srchdir):
-                continue
-            if exclusive:
-                search = [(srchdir, [], os.listdir(srchdir))]
-            else:
-                search = os.walk(srchdir, followlinks=True, topdown=True)
-            for subdir, dirs, files in search:
-                for f in files:
-                    nB = filt(f) if filt is not None else f
-                    # logger.debug(f"{nB=} {nB in newfigs} {f=}")
-                    if nB not in newfigs:
-                        continue
-                    doti = f.rfind(".")
-                    origExt = f[doti:].lower()
-                    if origExt[1:] not in self.extensions:
-                        continue
-                    filepath = os.path.join(subdir, f)
-                    for p in newfigs[nB]:
-                        if 'destfile' in p and key in p:
-                            if mode == self.mode:
-                                continue
-                            else:
-                                del p['destfile']
-                        if key in p:
-                            old = self.extensions.get(os.path.splitext(p[key])[1].lower()[1:], 10000)
-                            new = self.extensions.get(os.path.splitext(filepath)[1].lower()[1:], 10000)
-                            if new < old:
-                                p[key] = filepath
-                            elif old == new and lowres != bool(os.path.getsize(p[key]) < os.path.getsize(filepath)):
-                                p[key] = filepath
+        # list the search directories once for all the calls (one per book) that use them
+        indexkey = (tuple(self.srchlist), exclusive, filt)
+        if getattr(self, 'srcindex', None) is None or self.srcindex[0] != indexkey \
+                    or not figureIndex.current(self.srcindex[2]):
+            self.srcindex = (indexkey, ) + figureIndex.sources(self.srchlist, filt, recurse=not exclusive)
+        srcs = self.srcindex[1]
+        sizes = {}
+        def getsize(fpath):
+            if fpath not in sizes:
+                sizes[fpath] = os.path.getsize(fpath)
+            return sizes[fpath]
+        for nB, figs in newfigs.items():
+            for filepath, origExt in srcs.get(nB, []):
+                if origExt not in self.extensions:
+                    continue
+                for p in figs:
+                    if 'destfile' in p and key in p:
+                        if mode == self.mode:
+                            continue
                         else:
+                            del p['destfile']
+                    if key in p:
+                        old = self.extensions.get(os.path.splitext(p[key])[1].lower()[1:], 10000)
+                        new = self.extensions.get(os.path.splitext(filepath)[1].lower()[1:], 10000)
+                        if new < old:
                             p[key] = filepath
+                        elif old == new and lowres != bool(getsize(p[key]) < getsize(filepath)):
+                            p[key] = filepath
+                    else:
+                        p[key] = filepath
+                    if logger.isEnabledFor(5):
                         logger.log(5, f"setsrcpath({mode}=={self.mode}) of {str(p)} to {filepath}")
         self.mode = mode
         return data
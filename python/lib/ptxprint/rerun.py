@@ -0,0 +1,207 @@
+import re, time
+from collections import namedtuple, Counter
+from ptxprint.utils import _
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How much a change to an auxiliary file matters to the next XeTeX run
+NOCHANGE, INERT, VALUES, LAYOUT = range(4)
+kindnames = ("none", "inert", "values", "layout")
+
+AuxChange = namedtuple("AuxChange", ["ext", "kind", "detail"])
+
+_toclinere = re.compile(r"\\doTOCline\{(.*)\}\{(.*)\}\{(.*)\}\{(.*)\}\{(.*)\}")
+_delayedre = re.compile(r"\\(\w+)\{([^}]*)\}")
+
+def readaux(fpath):
+    try:
+        with open(fpath, encoding="utf-8", errors="ignore") as inf:
+            return inf.read()
+    except FileNotFoundError:
+        return ""
+
+
+class AuxFile:
+    """ An auxiliary file that XeTeX writes during one run and reads in the next. Subclasses
+        parse it into something that can be compared structurally and say how much a
+        difference matters. """
+    ext = None
+    rerun = True
+    kind = LAYOUT
+
+    def __init__(self, desc):
+        self.desc = desc
+
+    def read(self, basepath):
+        return self.parse(readaux(basepath + "." + self.ext))
+
+    def parse(self, txt):
+        return [l.rstrip() for l in txt.splitlines() if l.strip()]
+
+    def compare(self, old, new):
+        if old == new:
+            return None
+        return (self.kind, _("{} lines differ").format(_linediff(old, new)))
+
+
+class TocAux(AuxFile):
+    """ A .toc is a list of entries, each ending in the page number. If only the page numbers
+        change and none of them change length, the table is the same size and the next run
+        only has to print the new numbers. """
+    ext = "toc"
+
+    def parse(self, txt):
+        res = []
+        for l in txt.splitlines():
+            m = _toclinere.match(l)
+            if m:
+                res.append(m.groups())
+        return res
+
+    def compare(self, old, new):
+        if old == new:
+            return None
+        if len(old) != len(new) or any(o[:-1] != n[:-1] for o, n in zip(old, new)):
+            return (LAYOUT, _("{} entries, was {}").format(len(new), len(old)))
+        pages = [(o[-1], n[-1]) for o, n in zip(old, new) if o[-1] != n[-1]]
+        if any(len(o) != len(n) for o, n in pages):
+            return (LAYOUT, _("{} page numbers changed length").format(len(pages)))
+        return (VALUES, _("{} page numbers changed").format(len(pages)))
+
+
+class ParlocsAux(AuxFile):
+    """ The .parlocs is only read back at the end of the run that writes it, to make the
+        .delayed file, which is what the next run reads. So positions moving matters only
+        if the delayed settings change. Each \\Rerun line is a request for another run and
+        \\HistoricDelays is bookkeeping on how often an item has been moved. """
+    ext = "parlocs"
+    ignored = ("Rerun", "HistoricDelays")
+
+    def read(self, basepath):
+        return (super().read(basepath), self.parsedelayed(readaux(basepath + ".delayed")))
+
+    def parsedelayed(self, txt):
+        res = set()
+        for l in txt.splitlines():
+            m = _delayedre.match(l)
+            if m is None:
+                if l.strip():
+                    res.add(l.strip())
+            elif m.group(1) not in self.ignored:
+                res.add(l.strip())
+        return res
+
+    def compare(self, old, new):
+        if old == new:
+            return None
+        if old[1] != new[1]:
+            return (LAYOUT, _("{} delayed settings differ").format(len(old[1] ^ new[1])))
+        if old[0] == new[0]:
+            return None
+        return (INERT, _("{} positions moved").format(_linediff(old[0], new[0])))
+
+
+class MarginNotesAux(AuxFile):
+    """ Margin notes sit outside the text block, so moving them does not move the text """
+    ext = "marginnotes"
+    kind = VALUES
+
+
+class PicPagesAux(AuxFile):
+    """ Rerunning for the image copyrights is left to the user """
+    ext = "picpages"
+    rerun = False
+    kind = VALUES
+
+
+def _linediff(old, new):
+    (o, n) = (Counter(old), Counter(new))
+    return max(sum((o - n).values()), sum((n - o).values()))
+
+
+class RerunPlanner:
+    """ Decides whether another XeTeX pass is needed by comparing the auxiliary files
+        left by each run with those the run started from. It also keeps a record of each
+        run: how long it took, what changed, why it reran and whether the changes were
+        expected to leave the pagination alone, so a job that takes many passes can be
+        explained. """
+
+    def __init__(self, basepath, auxfiles=None, ignore=()):
+        self.basepath = basepath
+        if auxfiles is None:
+            auxfiles = [TocAux(_("table of contents")),
+                        PicPagesAux(_("image copyrights")),
+                        ParlocsAux(_("chapter positions")),
+                        MarginNotesAux(_("margin note positions"))]
+        self.auxfiles = [a for a in auxfiles if a.ext not in ignore]
+        self.data = {a.ext: a.read(basepath) for a in self.auxfiles}
+        self.runs = []
+        self.starttime = None
+
+    def startrun(self):
+        self.starttime = time.time()
+
+    def endrun(self, logrerun=False, tidied=False, final=False):
+        """ Compares the auxiliary files with those the run started from. Call it once the
+            .toc has been regenerated, since that is what the next run reads. Returns
+            (rerun, reasons) where reasons are the descriptions of changes that call for a
+            rerun that is not going to happen, either because this is the final run or because
+            that file does not trigger a rerun. """
+        stats = {"run": len(self.runs) + 1, "time": time.time() - (self.starttime or time.time()),
+                 "changes": [], "triggers": [], "layout": False}
+        reasons = []
+        if logrerun:
+            stats["changes"].append(AuxChange("log", LAYOUT, _("the log asked for a rerun")))
+            stats["triggers"].append("log")
+        if tidied:
+            stats["changes"].append(AuxChange("marginnotes", VALUES, _("margin notes were tidied")))
+            stats["triggers"].append("tidied")
+        for a in self.auxfiles:
+            newdata = a.read(self.basepath)
+            res = a.compare(self.data[a.ext], newdata)
+            self.data[a.ext] = newdata
+            if res is None:
+                continue
+            stats["changes"].append(AuxChange(a.ext, *res))
+            if res[0] < VALUES:
+                continue
+            elif final or not a.rerun:
+                reasons.append(a.desc)
+            else:
+                stats["triggers"].append(a.ext)
+        if any(l.startswith(r"\Rerun{") for l in readaux(self.basepath + ".delayed").splitlines()):
+            stats["changes"].append(AuxChange("delayed", LAYOUT, _("the delayed file asked for a rerun")))
+            stats["triggers"].append("delayed")
+        stats["layout"] = any(c.kind == LAYOUT for c in stats["changes"] if c.ext in stats["triggers"]) \
+                            or "log" in stats["triggers"]
+        stats["rerun"] = len(stats["triggers"]) > 0 and not final
+        if len(self.runs) and self.runs[-1]["rerun"] and not self.runs[-1]["layout"]:
+            # the previous run was only to fix values, so we expected this one to be the last
+            stats["predicted"] = not stats["rerun"]
+        self.runs.append(stats)
+        for c in stats["changes"]:
+            logger.debug(f"Run {stats['run']}: {c.ext} {kindnames[c.kind]}: {c.detail}")
+        return (stats["rerun"], reasons)
+
+    def rerunmessage(self):
+        """ Describes why the last run is to be followed by another """
+        descs = {a.ext: a.desc for a in self.auxfiles}
+        for t in self.runs[-1]["triggers"]:
+            if t in descs:
+                return _("Rerunning because the {} changed").format(descs[t])
+            elif t == "delayed":
+                return _("Rerunning because the delayed file asked us to")
+        return None
+
+    def summary(self):
+        """ One line per run saying how long it took and what changed """
+        res = []
+        for r in self.runs:
+            changes = ", ".join("{} ({}: {})".format(c.ext, kindnames[c.kind], c.detail)
+                                for c in r["changes"]) or _("nothing changed")
+            line = "{}: {:.1f}s {}".format(r["run"], r["time"], changes)
+            if r.get("predicted") is False:
+                line += " " + _("[expected to converge]")
+            res.append(line)
+        return res
@@ -1,26 +1,31 @@
-import os, sys, re, subprocess, time
+import os, sys, re, subprocess, time, multiprocessing, codecs
 from PIL import Image
 from io import BytesIO as cStringIO
 from shutil import copyfile, rmtree, copy2, copystat
 from threading import Thread
-from ptxprint.runner import call, checkoutput
+from multiprocessing.pool import ThreadPool
+from ptxprint.runner import call, checkoutput, popen
 from ptxprint.texmodel import TexModel
+from ptxprint.convcache import ConversionCache, ImageCache, textDigest
 from ptxprint.ptsettings import ParatextSettings
 from ptxprint.view import ViewModel, VersionStr, refKey
 from ptxprint.font import getfontcache, fontconfig_template_nofc
 from ptxprint.usfmerge import usfmerge2
-from ptxprint.texlog import summarizeTexLog
+from ptxprint.texlog import summarizeTexLog, LogMonitor
 from ptxprint.utils import _, universalopen, print_traceback, coltoonemax, nonScriptureBooks, \
         saferelpath, runChanges, convert2mm, pycodedir, _outputPDFtypes, startfile, pt_bindir, runChanges
 from ptxprint.pdf.fixcol import fixpdffile, compress, outpdf
 from ptxprint.pdf.pdfsig import make_signatures, buildPagesTree
 from ptxprint.pdf.pdfsanitise import split_pages
 from ptxprint.pdf.procpdf import procpdf
+from ptxprint.pdf.pdfstitch import stitch_pdfs
 from ptxprint.pdfrw import PdfReader, PdfWriter
 from ptxprint.pdfrw.errors import PdfError, log
 from ptxprint.pdfrw.objects import PdfDict, PdfString, PdfArray, PdfName, IndirectPdfDict, PdfObject
 from ptxprint.toc import TOC, generateTex
 from ptxprint.marginnotes import tidymarginnotes
+from ptxprint.rerun import RerunPlanner
+from ptxprint.booksplit import readPages, planParts, pageStartTex
 from ptxprint.unicode.ducet import tailored
 from usfmtc.reference import RefList
 from ptxprint.transcel import transcel, outtriggers
@@ -135,12 +140,79 @@ def isLocked():
     global _joblock
     return _joblock is not None
 
+_xetexversion = None
+def xetexversion():
+    global _xetexversion
+    if _xetexversion is None:
+        try:
+            _xetexversion = checkoutput(["xetex", "--version"], path="xetex").split("\n")[0]
+        except (OSError, subprocess.CalledProcessError):
+            _xetexversion = ""
+    return _xetexversion
+
+# Dumps the macros loaded so far, making \everyjob redo the bits of paratext2.tex that
+# depend on the job name and time. {timestamp} is the c_timestamp section of paratext2.tex
+_formattail = r"""\begingroup\catcode`\@=11
+\gdef\ptxformatjob{{\edef\t@mp{{\jobname}}%
+\xdef\j@bname{{\x@\x@\x@\stripqu@tes\x@\t@mp\x@"\t@mp"\relax}}%
+{timestamp}}}
+\endgroup
+\global\everyjob\expandafter{{\the\everyjob\ptxformatjob}}
+\dump
+"""
+_failedformats = set()
+
+_pooljobs = None
+def _convertPoolBook(i):
+    """ Runs in a forked worker: converts one book from _pooljobs and returns what the
+        parent needs to carry on as if it had done the conversion itself """
+    (info, bk, chaprange, outdir, prjdir, isbk, infpath, outfname) = _pooljobs[i]
+    errors = []
+    info.printer.doError = lambda *a, **kw: errors.append((a, kw))
+    info.tablespans = set()
+    info.conversionStats = {}
+    if info.convcache is not None:
+        info.convcache.takeCounts()     # only count this book
+    out = None
+    if infpath is not None:
+        try:
+            out = info.convertBook(bk, chaprange, outdir, prjdir, isbk, bkindex=i, infpath=infpath, outfname=outfname)
+        except FileNotFoundError as e:
+            errors.append(((str(e),), {}))
+    counts = info.convcache.takeCounts() if info.convcache is not None else None
+    return (out, info.tablespans, errors, counts, info.conversionStats)
+
+def _digPoolBook(i):
+    """ Runs in a forked worker: converts and merges all the columns of one diglot book from
+        _pooljobs and returns what the parent needs to carry on """
+    (runjob, b, j, info, diginfos, kw) = _pooljobs[i]
+    errors = []
+    models = [info] + list(diginfos.values())
+    for m in models + [runjob]:
+        m.printer.doError = lambda *a, **ekw: errors.append((a, ekw))
+    for m in models:
+        m.tablespans = set()
+        m.conversionStats = {}
+    if info.convcache is not None:
+        info.convcache.takeCounts()     # the models share the cache, so only count this book
+    res = runjob.digconvertBook(b, j, info, diginfos, **kw)
+    counts = info.convcache.takeCounts() if info.convcache is not None else None
+    return (res, [m.tablespans for m in models], errors, counts, [m.conversionStats for m in models])
+
+_picjobs = None
+def _convertPoolPic(i):
+    """ Runs in a forked worker: converts one picture from _picjobs """
+    (runjob, ratio, srcpath, tgtpath, cropme, key) = _picjobs[i]
+    runjob.convertToJPGandResize(ratio, srcpath, tgtpath, cropme)
+    return i
+
 class RunJob:
 
     def __init__(self, printer, scriptsdir, macrosdir, args, inArchive=False):
         self.scriptsdir = scriptsdir
         self.printer = printer
         self.macrosdir = macrosdir
+        self.ptxmacrospath = None
         self.tempFiles = []
         self.picfiles = []
         self.tmpdir = "."
@@ -159,7 +231,10 @@ class RunJob:
         # self.onlydiffs = True
         # self.diffPdf = None
         self.rerunReasons = []
+        self.runStats = []
         self.coverfile = None
+        self.imagecache = None
+        self.picjobs = None
 
     def fail(self, txt):
         self.printer.set("l_statusLine", txt)
@@ -187,6 +262,14 @@ class RunJob:
             return
         self.tmpdir = self.printer.project.printPath(configid)
         os.makedirs(self.tmpdir, exist_ok=True)
+        convcache = None
+        if not self.inArchive and not getattr(self.args, "noconvcache", False):
+            convcache = ConversionCache(os.path.join(self.tmpdir, "tmpConvCache"))
+        info.convcache = convcache
+        if not self.inArchive and not getattr(self.args, "nopiccache", False):
+            self.imagecache = ImageCache(os.path.join(self.tmpdir, "tmpPicCache"))
+        else:
+            self.imagecache = None
         bks = self.printer.getBooks(files=True)
         jobs = []       # [(bkid/module_path, False) or (RefList, True)] 
         logger.debug(f"{self.printer.bookrefs=}")
@@ -244,6 +327,7 @@ class RunJob:
                 digprjdir = dv.project.path
                 digptsettings = ParatextSettings(digprjdir)
                 diginfos[k] = TexModel(dv, digptsettings, dv.prjid, inArchive=self.inArchive, diglotbinfo=info, digcfg=digcfg)
+                diginfos[k].convcache = convcache
                 reasons = diginfos[k].prePrintChecks()
                 if len(reasons):
                     self.fail(", ".join(reasons) + " in diglot secondary")
@@ -268,19 +352,81 @@ class RunJob:
         self.printer.tempFiles = self.texfiles  # Always do this now - regardless!
         return self.res
 
-    def dojob(self, jobs, info):
-        donebooks = []
-        # import pdb; pdb.set_trace()
+    def numWorkers(self, numjobs=None):
+        workers = getattr(self.args, "jobs", None) or 1
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        return max(1, min(workers, numjobs) if numjobs is not None else workers)
+
+    def convertBooks(self, jobs, info):
+        """ Yields (index, book, outfname) for each job, in job order. Converts
+            books in a pool of forked worker processes when possible. """
+        workers = self.numWorkers(len(jobs))
+        if workers < 2 or not info.canConvertInParallel() \
+                    or "fork" not in multiprocessing.get_all_start_methods():
+            for i, j in enumerate(jobs):
+                b = j[0][0].first.book if j[1] else j[0]
+                logger.debug(f"Converting {b} in {self.tmpdir} from {self.prjdir}")
+                try:
+                    out = info.convertBook(b, j[0], self.tmpdir, self.prjdir, j[1], bkindex=i)
+                except FileNotFoundError as e:
+                    self.printer.doError(str(e))
+                    out = None
+                yield (i, b, out)
+            return
+
+        global _pooljobs
+        # Anything that changes job state (changes files, module flattening, output filenames)
+        # is done here so that each worker only converts its own book.
+        info.loadChanges(jobs[0][0][0].first.book if jobs[0][1] else jobs[0][0])
+        info.checkCustomSty(self.prjdir)
+        _pooljobs = []
         for i, j in enumerate(jobs):
-            if len(jobs) >= 5 and i % (len(jobs) // 5) == 0:
-                info.printer.incrementProgress(True, stage="pr")
             b = j[0][0].first.book if j[1] else j[0]
-            logger.debug(f"Converting {b} in {self.tmpdir} from {self.prjdir}")
             try:
-                out = info.convertBook(b, j[0], self.tmpdir, self.prjdir, j[1], bkindex=i)
+                infpath = info.bookInputPath(b, self.tmpdir, self.prjdir)
             except FileNotFoundError as e:
                 self.printer.doError(str(e))
-                out = None
+                infpath = None
+            outfname = info.bookOutputName(infpath) if infpath is not None else None
+            _pooljobs.append((info, b, j[0], self.tmpdir, self.prjdir, j[1], infpath, outfname))
+        # makelocalChanges also sets job settings (e.g. snippets), so leave them as a serial run would
+        info.makelocalChanges(self.printer, b, chaprange=(j[0] if j[1] else None))
+        logger.debug(f"Converting {len(jobs)} books with {workers} workers")
+        pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            for i, (out, tablespans, errors, counts, stats) in enumerate(pool.imap(_convertPoolBook, range(len(_pooljobs)))):
+                for a, kw in errors:
+                    self.printer.doError(*a, **kw)
+                info.tablespans.update(tablespans)
+                info.conversionStats.update(stats)
+                if counts is not None:
+                    info.convcache.addCounts(counts)
+                yield (i, _pooljobs[i][1], out)
+        finally:
+            pool.close()
+            pool.join()
+            _pooljobs = None
+
+    def logConversions(self, models):
+        """ Logs how much work converting the books took, for each of models """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        if models[0].convcache is not None:
+            logger.debug(f"Conversion cache: {models[0].convcache.hits} hits, {models[0].convcache.misses} misses")
+        for m in models:
+            stats = m.conversionStats
+            if len(stats):
+                logger.debug("Converted {} books with {} parses and {} unparses: {}".format(len(stats),
+                        sum(p for p, u in stats.values()), sum(u for p, u in stats.values()),
+                        " ".join(f"{bk}={p}/{u}" for bk, (p, u) in stats.items())))
+
+    def dojob(self, jobs, info):
+        donebooks = []
+        # import pdb; pdb.set_trace()
+        for i, b, out in self.convertBooks(jobs, info):
+            if len(jobs) >= 5 and i % (len(jobs) // 5) == 0:
+                info.printer.incrementProgress(True, stage="pr")
             if out is None:
                 continue
             outpath = os.path.join(self.tmpdir, out)
@@ -302,6 +448,7 @@ class RunJob:
                 except FileNotFoundError:
                     pass
             donebooks.append(out)
+        self.logConversions([info])
         if not len(donebooks):
             unlockme()
             return []
@@ -369,55 +516,19 @@ class RunJob:
             if vf is not None:
                 versification = Versification(os.path.join(info.printer.project.path, vf))
             reversifyinfo = (versification, info.dict['texpert/showvpvrse'], info.dict['texpert/showvpchap'])
-        for j in jobs:
-            b = j[0][0].first.book if j[1] else j[0]
-            # logger.debug(f"Diglot[{k}]({b}): f{self.tmpdir} from f{self.prjdir}") # broken (missing k)
-            inputfiles = []
-            left = None
-            for k, diginfo in diginfos.items():
-                digprjdir = diginfo.printer.project.path
-                try:
-                    out = None
-                    if not len(inputfiles):
-                        out = info.convertBook(b, j[0], self.tmpdir, self.prjdir, j[1])
-                        left = os.path.join(self.tmpdir, out)
-                        inputfiles.append(left)
-                        texfiles.append(left)
-                    digout = diginfo.convertBook(b, j[0], self.tmpdir, digprjdir, j[1], reversify=reversifyinfo)
-                    right = os.path.join(self.tmpdir, digout)
-                    inputfiles.append(right)
-                    texfiles.append(right)
-                except FileNotFoundError as e:
-                    self.printer.doError(str(e))
-                    out = None
-                    digout = None
-                if out is not None:
-                    donebooks.append(out)
-                if digout is None:
-                    continue
-                else:
-                    diginfo["project/books"].append(digout)
-                    self.books.append(digout)
-            if left and b not in nonScriptureBooks:
-                # Now merge the secondary text (right) into the primary text (left) 
-                outFile = re.sub(r"^([^.]*).(.*)$", r"\1-diglot.\2", left)
-                if len(donebooks):
-                    donebooks[-1] = os.path.basename(outFile)
-                logFile = os.path.join(self.tmpdir, "ptxprint-merge.log")
-
-                mode = info["document/diglotmergemode"]
-                if mode in ('True', 'False') or not mode:
-                    mode = "doc"
-                sync = "normal"
-                if "-" in mode:
-                    (mode, sync) = mode.split("-")
-                logger.debug(f"usfmerge2({inputfiles}) -> {outFile} with {logFile=} {mode=} {sync=}")
-                # Do we ask the merge process to write verification files? (use diff -Bws to confirm they are they same as the input)
-                debugmerge = logger.getEffectiveLevel() <= 5 
-                usfmerge2(inputfiles, keyarr, outFile, stylesheets=sheets, mode=mode, synchronise=sync, debug=debugmerge, changes=info.changes.get("merged", []), book=b)
-                texfiles += [outFile, logFile]
+        # Do we ask the merge process to write verification files? (use diff -Bws to confirm they are they same as the input)
+        debugmerge = logger.getEffectiveLevel() <= 5 
+        serialbooks = set((info['document/diglotserialbooks'] or "").split())
+        for b, out, digouts, files in self.digconvertBooks(jobs, info, diginfos, keyarr=keyarr, sheets=sheets,
+                                    reversifyinfo=reversifyinfo, serialbooks=serialbooks, debugmerge=debugmerge):
+            texfiles += files
+            if out is not None:
+                donebooks.append(out)
+            for k, digout in digouts.items():
+                diginfos[k]["project/books"].append(digout)
+                self.books.append(digout)
+        self.logConversions([info] + list(diginfos.values()))
 
-        
         if not len(donebooks): # or not len(digdonebooks):
             unlockme()
             return []
@@ -441,6 +552,122 @@ class RunJob:
         texfiles += res
         return texfiles
 
+    def digconvertBooks(self, jobs, info, diginfos, **kw):
+        """ Yields (book, out, digouts, files) for each job, in job order, as digconvertBook
+            returns them. Converts and merges books in a pool of forked worker processes when
+            possible, each worker doing all the columns of a book. """
+        models = [(info, self.prjdir)] + [(d, d.printer.project.path) for d in diginfos.values()]
+        workers = self.numWorkers(len(jobs))
+        if workers < 2 or not all(m.canConvertInParallel() for m, d in models) \
+                    or "fork" not in multiprocessing.get_all_start_methods():
+            for j in jobs:
+                b = j[0][0].first.book if j[1] else j[0]
+                yield (b, ) + self.digconvertBook(b, j, info, diginfos, **kw)
+            return
+
+        global _pooljobs
+        # As for convertBooks, anything that changes job state is done here
+        firstbk = jobs[0][0][0].first.book if jobs[0][1] else jobs[0][0]
+        for m, prjdir in models:
+            m.loadChanges(firstbk)
+            m.checkCustomSty(prjdir)
+        _pooljobs = []
+        for j in jobs:
+            b = j[0][0].first.book if j[1] else j[0]
+            paths = []
+            for m, prjdir in models:
+                try:
+                    infpath = m.bookInputPath(b, self.tmpdir, prjdir)
+                except FileNotFoundError as e:
+                    self.printer.doError(str(e))
+                    infpath = None
+                paths.append((infpath, m.bookOutputName(infpath) if infpath is not None else None))
+            _pooljobs.append((self, b, j, info, diginfos, dict(kw, paths=paths)))
+        for m, prjdir in models:
+            m.makelocalChanges(m.printer, b, chaprange=(j[0] if j[1] else None))
+        logger.debug(f"Converting and merging {len(jobs)} books in {len(models)} columns with {workers} workers")
+        pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            for i, (res, tablespans, errors, counts, stats) in enumerate(pool.imap(_digPoolBook, range(len(_pooljobs)))):
+                for a, ekw in errors:
+                    self.printer.doError(*a, **ekw)
+                for (m, prjdir), t, st in zip(models, tablespans, stats):
+                    m.tablespans.update(t)
+                    m.conversionStats.update(st)
+                if counts is not None:
+                    info.convcache.addCounts(counts)
+                yield (_pooljobs[i][1], ) + res
+        finally:
+            pool.close()
+            pool.join()
+            _pooljobs = None
+
+    def digconvertBook(self, b, j, info, diginfos, keyarr=None, sheets=None, reversifyinfo=None,
+                       serialbooks=(), debugmerge=False, paths=None):
+        """ Converts book b, from job j, for the primary and each secondary column and merges
+            them. paths, if given, holds the (input path, output name) for each column as
+            worked out in advance. Returns (out, digouts, files): the file to typeset (or
+            None), the converted file for each secondary column and the files made. """
+        files = []
+        digouts = {}
+        inputfiles = []
+        inputdocs = []
+        out = None
+        left = None
+        # Merged books are handed to usfmerge2 as parsed docs, so their converted
+        # files are only needed if typeset serially, for debugging or in an archive.
+        merging = b not in nonScriptureBooks
+        writefile = not merging or b in serialbooks or debugmerge or self.inArchive
+        def convert(model, i, prjdir, **kw):
+            if paths is not None:
+                if paths[i][0] is None:
+                    return (None, None)
+                kw.update(infpath=paths[i][0], outfname=paths[i][1])
+            if merging:
+                return model.convertBook(b, j[0], self.tmpdir, prjdir, j[1], retdoc=True, writefile=writefile, **kw)
+            return (model.convertBook(b, j[0], self.tmpdir, prjdir, j[1], **kw), None)
+        for i, (k, diginfo) in enumerate(diginfos.items(), 1):
+            digprjdir = diginfo.printer.project.path
+            try:
+                if left is None:
+                    (out, doc) = convert(info, 0, self.prjdir)
+                    if out is None:
+                        continue
+                    left = os.path.join(self.tmpdir, out)
+                    inputfiles.append(left)
+                    inputdocs.append(doc)
+                    if doc is None or writefile:
+                        files.append(left)
+                (digout, doc) = convert(diginfo, i, digprjdir, reversify=reversifyinfo)
+            except FileNotFoundError as e:
+                self.printer.doError(str(e))
+                digout = None
+            if digout is None:
+                continue
+            right = os.path.join(self.tmpdir, digout)
+            inputfiles.append(right)
+            inputdocs.append(doc)
+            if doc is None or writefile:
+                files.append(right)
+            digouts[k] = digout
+        if left is not None and merging:
+            # Now merge the secondary text (right) into the primary text (left) 
+            outFile = re.sub(r"^([^.]*).(.*)$", r"\1-diglot.\2", left)
+            out = os.path.basename(outFile)
+            logFile = os.path.join(self.tmpdir, "ptxprint-merge.log")
+
+            mode = info["document/diglotmergemode"]
+            if mode in ('True', 'False') or not mode:
+                mode = "doc"
+            sync = "normal"
+            if "-" in mode:
+                (mode, sync) = mode.split("-")
+            logger.debug(f"usfmerge2({inputfiles}) -> {outFile} with {logFile=} {mode=} {sync=}")
+            usfmerge2(inputfiles, keyarr, outFile, stylesheets=sheets, mode=mode, synchronise=sync, debug=debugmerge,
+                      changes=info.changes.get("merged", []), book=b, docs=inputdocs)
+            files += [outFile, logFile]
+        return (out, digouts, files)
+
     def sharedjob(self, jobs, info, prjid=None, prjdir=None, extra="", diglots=False):
         logger.debug(f"in runjob sharedjob usesysfonts: {info['texpert/usesysfonts']}")
         nosysfonts = not info['texpert/usesysfonts'] or self.args.nofontcache
@@ -479,6 +706,9 @@ class RunJob:
         with open(os.path.join(self.tmpdir, outfname), "w", encoding="utf-8") as texf:
             texf.write(texfiledat)
         genfiles += [os.path.join(self.tmpdir, outfname.replace(".tex", x)) for x in (".tex", ".xdv")]
+        parts = None if diglots else self.splitParts(outfname, info, extra=extra)
+        if parts is not None:
+            genfiles += [os.path.join(self.tmpdir, p.texfname.replace(".tex", x)) for p in parts for x in (".tex", ".xdv")]
         if self.inArchive:
             return genfiles
         os.putenv("hyph_size", "65521")     # always run with maximum prime hyphenated words size (xetex is still tiny ~200MB resident)
@@ -531,6 +761,7 @@ class RunJob:
             else:
                 os.putenv("MISCFONTS", pathjoiner.join(miscfonts))
         logger.debug(f"MISCFONTS={pathjoiner.join(miscfonts)}")
+        self.ptxmacrospath = ptxmacrospath
         logger.debug("TEXINPUTS={} becomes {}".format(os.getenv('TEXINPUTS'), pathjoiner.join(texinputs)))
         logger.debug(f"{pathjoiner.join(miscfonts)=}")
         os.putenv('TEXINPUTS', pathjoiner.join(texinputs))
@@ -556,10 +787,14 @@ class RunJob:
                         copystat(ipdffile, opdffile)
                     except OSError as e:
                         log.error(f"Failed to copy: {ipdffile} to {opdffile}")
+        if parts is not None:
+            (runner, runargs) = (self.run_split, (outfname, pdffile, info, parts))
+        else:
+            (runner, runargs) = (self.run_xetex, (outfname, pdffile, info))
         if self.nothreads:
-            self.run_xetex(outfname, pdffile, info)
+            runner(*runargs)
         else:
-            self.thread = Thread(target=self.run_xetex, args=(outfname, pdffile, info))
+            self.thread = Thread(target=runner, args=runargs)
             self.busy = True
             logger.debug("sharedjob: Starting thread to run xetex")
             self.thread.start()
@@ -567,6 +802,165 @@ class RunJob:
         self.done_job(outfname, pdffile, info)
         return genfiles
 
+    def splitParts(self, outfname, info, extra=""):
+        """ If asked to, splits the books into parts to be typeset at the same time, using
+            where the books fell in the previous run, and writes a .tex file for each part.
+            Returns the list of parts or None to typeset the books as one job. """
+        if not getattr(self.args, "split", False) or info['cover/makecoverpage'] != '%':
+            return None
+        bookids = info["project/bookids"]
+        pages = readPages(os.path.join(self.tmpdir, outfname.replace(".tex", ".parlocs")))
+        parts = planParts(pages, bookids, self.numWorkers(len(bookids)))
+        if parts is None:
+            logger.info(f"Not splitting {outfname}: no previous run to split it by, or no place to split it")
+            return None
+        for p in parts[1:]:
+            for i in p.bookindices:
+                txt = self.readfile(os.path.join(self.tmpdir, info["project/books"][i]))
+                if "\\ztoc" in txt:
+                    logger.info(f"Not splitting {outfname}: {bookids[i]} has a table of contents")
+                    return None
+        # Every part ends as the last file of its job, which is when the end of job material
+        # is output. So only split if there is none besides the colophon.
+        if not info.asBool("texpert/neachbook"):
+            logger.info(f"Not splitting {outfname}: endnotes are placed at the end of the job")
+            return None
+        for k, p in (("project/ifusepremodstex", "/premodspath"), ("project/ifusemodstex", "/modspath")):
+            if info[k] == "" and re.search(r"book(?:end|after)-final", self.readfile(os.path.join(self.tmpdir, info[p]))):
+                logger.info(f"Not splitting {outfname}: {info[p]} adds to the end of the job")
+                return None
+        saved = {k: info[k] for k in ("project/frontfile", "document/toc", "project/ifcolophon")}
+        try:
+            for p in parts:
+                p.texfname = outfname.replace(".tex", "_part{}.tex".format(p.index))
+                info["document/splitpart_"] = p
+                info["project/frontfile"] = saved["project/frontfile"] if p.first else ""
+                info["document/toc"] = saved["document/toc"] if p.first else "%"
+                info["project/ifcolophon"] = saved["project/ifcolophon"] if p.last else "%"
+                texfiledat = info.asTex(filedir=self.tmpdir, jobname=p.texfname[:-4], extra=extra)
+                with open(os.path.join(self.tmpdir, p.texfname), "w", encoding="utf-8") as texf:
+                    texf.write(texfiledat)
+        finally:
+            info.dict.pop("document/splitpart_", None)
+            for k, v in saved.items():
+                info[k] = v
+        return parts
+
+    def run_split(self, outfname, pdffile, info, parts):
+        """ Typesets the parts all at once, then reruns any part whose starting page, or
+            whose table of contents, turns out different from what it was given, until they
+            agree. Then joins their PDFs into one. """
+        jobbase = os.path.join(self.tmpdir, outfname[:-4])
+        partbases = [os.path.join(self.tmpdir, p.texfname[:-4]) for p in parts]
+        usestoc = info["document/toc"] != "%"
+        for i, p in enumerate(parts):
+            for f in (partbases[i] + ".toc", (partbases[i] + ".toc").replace(".", "_org.")):
+                if os.path.exists(f):
+                    os.remove(f)
+            if not p.first:
+                with open(partbases[i] + ".pagestart", "w", encoding="utf-8") as outf:
+                    outf.write(pageStartTex(p))
+        tocextra = None
+        if usestoc:
+            orgtoc = (jobbase + ".toc").replace(".", "_org.")
+            firstbooks = set(info["project/bookids"][i] for i in parts[0].bookindices)
+            tocextra = [e for e in TOC(orgtoc).tocentries if e[0][:3] not in firstbooks] if os.path.exists(orgtoc) else []
+            if os.path.exists(jobbase + ".toc"):
+                copyfile(jobbase + ".toc", partbases[0] + ".toc")
+        fmts = [self.xetexformat(p.texfname) for p in parts]
+        results = [None] * len(parts)
+        pending = list(range(len(parts)))
+        unsettled = []
+        def dopart(i):
+            return self.xetexpasses(parts[i].texfname, info, fmts[i], showlog=False, progress=(i == 0),
+                                    tocextra=(tocextra if i == 0 else None), readstoc=(usestoc and i == 0))
+        pool = ThreadPool(len(parts))
+        try:
+            for attempt in range(self.maxRuns):
+                logger.debug(f"Typesetting parts {pending}")
+                for i, r in zip(pending, pool.map(dopart, pending)):
+                    results[i] = r
+                if any(r[0] for r in results):
+                    break
+                pending = []
+                # each part must start where the one before it finished
+                for i in range(1, len(parts)):
+                    pages = readPages(partbases[i-1] + ".parlocs")
+                    if not pages:
+                        continue
+                    start = (parts[i-1].totalpages + len(pages), pages[-1].pageno + 1)
+                    if start != (parts[i].totalpages, parts[i].pageno):
+                        logger.info(f"Part {i} starts on page {start[1]} not {parts[i].pageno}")
+                        (parts[i].totalpages, parts[i].pageno) = start
+                        with open(partbases[i] + ".pagestart", "w", encoding="utf-8") as outf:
+                            outf.write(pageStartTex(parts[i]))
+                        pending.append(i)
+                if usestoc:
+                    newextra = []
+                    for b in partbases[1:]:
+                        orgtoc = (b + ".toc").replace(".", "_org.")
+                        if os.path.exists(orgtoc):
+                            newextra.extend(TOC(orgtoc).tocentries)
+                    if newextra != tocextra:
+                        tocextra = newextra
+                        orgtoc = (partbases[0] + ".toc").replace(".", "_org.")
+                        if not os.path.exists(orgtoc):
+                            with open(orgtoc, "w", encoding="utf-8") as outf:
+                                outf.write(generateTex({"main": []}))
+                        self.regenTOC(partbases[0] + ".toc", extra=tocextra, fromorg=True)
+                        if 0 not in pending:
+                            pending.insert(0, 0)
+                if not len(pending):
+                    break
+            else:
+                unsettled = [_("page numbers across parts")]
+        finally:
+            pool.close()
+            pool.join()
+
+        done = [r for r in results if r is not None]
+        self.res = max(r[0] for r in done)
+        self.loglines = next((r[1] for r in done if r[0]), done[-1][1])
+        self.rerunReasons = sorted(set(unsettled + sum((r[2] for r in done), [])))
+        self.runStats = []
+        for i, r in enumerate(done):
+            for s in r[3]:
+                s["part"] = i
+                self.runStats.append(s)
+        # Leave the job's own log, parlocs and toc as if it had been typeset in one go
+        for ext in (".log", ".parlocs"):
+            with open(jobbase + ext, "w", encoding="utf-8") as outf:
+                for b in partbases:
+                    outf.write(self.readfile(b + ext))
+        info.printer.editFile_delayed(outfname.replace(".tex", ".log"), "wrk", "tb_XeTeXlog", False)
+        if not self.res and usestoc:
+            alltoc = []
+            for b in partbases:
+                orgtoc = (b + ".toc").replace(".", "_org.")
+                if os.path.exists(orgtoc):
+                    alltoc.extend(TOC(orgtoc).tocentries)
+            with open(jobbase + ".toc", "w", encoding="utf-8") as outf:
+                outf.write(generateTex({"main": alltoc}))
+            self.regenTOC(jobbase + ".toc")
+
+        if not self.res:
+            self.printer.incrementProgress(stage="xp")
+            tmppdf = self.procpdfFile(outfname, pdffile, info)
+            partpdfs = [p.texfname.replace(".tex", ".pdf") for p in parts]
+            pool = ThreadPool(len(parts))
+            try:
+                self.res = max(pool.map(lambda i: self.xdvipdfmx(parts[i].texfname, partpdfs[i], info, xdvjobs=1),
+                                        range(len(parts))))
+            finally:
+                pool.close()
+                pool.join()
+            if not self.res:
+                outpdf(stitch_pdfs([os.path.join(self.tmpdir, f) for f in partpdfs]), os.path.join(self.tmpdir, tmppdf))
+            self.printer.incrementProgress(stage="fn")
+            if self.res == 0 and not self.procpdf(outfname, pdffile, info, cover=info['cover/makecoverpage'] != '%'):
+                self.res = 3
+        print("Done")
+
     def wait(self):
         logger.debug("Waiting for thread: {}, {}".format(self.busy, isLocked()))
         if self.busy:
@@ -581,129 +975,268 @@ class RunJob:
             res = texfname.replace(".tex", ".xdv")
         return res
 
-    def processxdv(self, inxdv, outxdv, info):
-        procxdv(inxdv, outxdv)
+    def processxdv(self, inxdv, outxdv, info, jobs=None):
+        procxdv(inxdv, outxdv, jobs=jobs or self.numWorkers())
+
+    def _macrofiles(self):
+        """ Lists the size and time of each macro file, and of any file in the working
+            directory that could be found instead of one of them """
+        res = []
+        names = set()
+        for dp, dn, fn in os.walk(self.ptxmacrospath):
+            for f in sorted(fn):
+                if f.endswith((".tex", ".sty")):
+                    names.add(f)
+                    st = os.stat(os.path.join(dp, f))
+                    res.append("{}:{}:{}".format(os.path.relpath(os.path.join(dp, f), self.ptxmacrospath), st.st_size, st.st_mtime_ns))
+        for dp, dn, fn in os.walk(self.tmpdir):
+            for f in sorted(fn):
+                if f in names:
+                    st = os.stat(os.path.join(dp, f))
+                    res.append("{}:{}:{}".format(os.path.join(dp, f), st.st_size, st.st_mtime_ns))
+        return res
+
+    def xetexformat(self, outfname):
+        """ Returns (format name, tex file) to run outfname using a dumped format that
+            holds everything up to and including its \\input paratext2.tex, building the
+            format if need be. The format is named by a hash of that setup, the macro
+            files and the XeTeX version, so a stale one is never used. Returns None if
+            outfname should be run as it is, which is always so unless --format is given. """
+        if not getattr(self.args, "format", False) or self.ptxmacrospath is None:
+            return None
+        with open(os.path.join(self.tmpdir, outfname), encoding="utf-8") as inf:
+            lines = inf.readlines()
+        for i, l in enumerate(lines):
+            if l.strip() == r"\input paratext2.tex":
+                break
+        else:
+            return None
+        setup = [l for l in lines[:i] if not l.lstrip().startswith("%")]
+        if any(r"\input" in l or r"\include" in l for l in setup):
+            return None         # depends on files we do not track
+        version = xetexversion()
+        if not version:
+            return None
+        try:
+            key = textDigest(version, "".join(setup), *self._macrofiles())[:16]
+            with open(os.path.join(self.ptxmacrospath, "paratext2.tex"), encoding="utf-8") as inf:
+                m = re.search(r"^%\+c_timestamp\n(.*?)^%-c_timestamp", inf.read(), flags=re.M|re.S)
+        except OSError:
+            return None
+        fmtname = "ptxp_" + key
+        if m is None or self.formatfailed(key):
+            return None
+        texfname = outfname.replace(".tex", "_body.tex")
+        with open(os.path.join(self.tmpdir, texfname), "w", encoding="utf-8") as outf:
+            outf.writelines(lines[i+1:])
+        if os.path.exists(os.path.join(self.tmpdir, fmtname+".fmt")):
+            return (fmtname, texfname)
+        for f in os.listdir(self.tmpdir):
+            if f.startswith("ptxp_") and os.path.splitext(f)[1] in (".fmt", ".tex", ".log", ".failed"):
+                os.remove(os.path.join(self.tmpdir, f))
+        with open(os.path.join(self.tmpdir, fmtname+".tex"), "w", encoding="utf-8") as outf:
+            outf.writelines(setup + [lines[i]])
+            outf.write(_formattail.format(timestamp=m.group(1)))
+        cmd = ["xetex", "-ini", "-halt-on-error", "-interaction=batchmode", "-jobname="+fmtname, "&xetex", fmtname+".tex"]
+        logger.debug(f"Building format: {cmd}")
+        runner = call(cmd, cwd=self.tmpdir)
+        res = runner.returncode if isinstance(runner, (subprocess.Popen, subprocess.CompletedProcess)) else runner
+        if isinstance(runner, subprocess.Popen):
+            res = runner.wait()
+        if res or not os.path.exists(os.path.join(self.tmpdir, fmtname+".fmt")):
+            logger.info(f"Failed to build {fmtname}.fmt, see {fmtname}.log. Inputting macros instead")
+            self.formatfailed(key, True)
+            return None
+        return (fmtname, texfname)
+
+    def formatfailed(self, key, failed=False):
+        """ Returns whether the format for key is known not to work, first recording
+            that it does not if failed. The record is a ptxp_{key}.failed file beside
+            its log, so later runs do not try to build it again. """
+        marker = os.path.join(self.tmpdir, "ptxp_{}.failed".format(key))
+        if failed:
+            _failedformats.add(key)
+            try:
+                with open(marker, "w", encoding="utf-8") as outf:
+                    outf.write(xetexversion() or "")
+            except OSError:
+                pass
+        elif key not in _failedformats and os.path.exists(marker):
+            _failedformats.add(key)
+        return key in _failedformats
 
     def run_xetex(self, outfname, pdffile, info):
+        fmt = self.xetexformat(outfname)
+        (self.res, self.loglines, self.rerunReasons, self.runStats) = self.xetexpasses(outfname, info, fmt)
+        if not self.res:
+            self.printer.incrementProgress(stage="xp")
+            tmppdf = self.procpdfFile(outfname, pdffile, info)
+            self.res = self.xdvipdfmx(outfname, tmppdf, info)
+            self.printer.incrementProgress(stage="fn") #Suspect that this was causing it to SegFault (but no idea why)
+            if self.res == 0 and not self.procpdf(outfname, pdffile, info, cover=info['cover/makecoverpage'] != '%'):
+                self.res = 3
+        print("Done")
+
+    def xetexpasses(self, outfname, info, fmt=None, tocextra=None, showlog=True, readstoc=True, progress=True):
+        """ Runs XeTeX on outfname until its auxiliary files settle or we run out of runs.
+            tocextra is a list of table of contents entries from books typeset elsewhere.
+            readstoc is False if the job does not read its table of contents. progress is
+            False if the job is not to report progress, as for all but one of a set of parts.
+            Returns (result, last log lines, reasons a further run was wanted, run stats) """
         numruns = 0
-        cachedata = {}
-        cacheexts = {"toc":         (_("table of contents"), True), 
-                    "picpages":     (_("image copyrights"), False), 
-                    "parlocs":      (_("chapter positions"), True),
-                    "marginnotes":  (_("margin note positions"), True)}
+        maxruns = self.maxRuns
+        res = 0
+        loglines = []
+        rerunreasons = []
         marginnotesfname = os.path.join(self.tmpdir, outfname.replace(".tex", ".marginnotes"))
         if os.path.exists(marginnotesfname):
             os.unlink(marginnotesfname)
-        for a in cacheexts.keys():
-            cachedata[a] = self.readfile(os.path.join(self.tmpdir, outfname.replace(".tex", "."+a)))
-        while numruns < self.maxRuns:
-            self.printer.incrementProgress(stage="lo", run=numruns)
+        planner = RerunPlanner(os.path.join(self.tmpdir, outfname[:-4]), ignore=(() if readstoc else ("toc",)))
+        parlocsfname = os.path.join(self.tmpdir, outfname.replace(".tex", ".parlocs"))
+        maxpages = None
+        while numruns < maxruns:
+            if progress:
+                self.printer.incrementProgress(stage="lo", run=numruns)
+            starttime = time.time()
+            planner.startrun()
             commentstr = " ".join([
                     "date="+datetime.today().isoformat(),
                     "ptxprint_version="+VersionStr,
                     "run="+str(numruns)])
             cmd = ["xetex", "-halt-on-error", "-interaction=nonstopmode",
                    '-output-comment="'+commentstr+'"', "-no-pdf"]
+            texfname = outfname
+            if fmt is not None:
+                cmd += ["-fmt="+fmt[0], "-jobname="+outfname[:-4]]
+                texfname = fmt[1]
             if self.forcedlooseness is None:
-                action = outfname
+                action = texfname
             else:
-                action = r"\def\ForcedLooseness{{{}}}\input {}".format(self.forcedlooseness, outfname)
+                action = r"\def\ForcedLooseness{{{}}}\input {}".format(self.forcedlooseness, texfname)
             logger.debug(f"Running: {cmd} {action}")
-            runner = call(cmd + [action], cwd=self.tmpdir)
-            if isinstance(runner, subprocess.Popen) and runner is not None:
-                try:
-                    #runner.wait(self.args.timeout)
-                    runner.wait()
-                except subprocess.TimeoutExpired:
-                    print("Timed out!")
-                self.res = runner.returncode
-            elif isinstance(runner, subprocess.CompletedProcess):
-                self.res = runner.returncode
-                logger.debug(f"{runner.stdout.decode('UTF-8')}")
-            else:
-                self.res = runner
-            print("cd {}; xetex {} -> {}".format(self.tmpdir, outfname, self.res))
+            (res, abort) = self.monitorxetex(cmd + [action], outfname, numruns, progress, maxpages=maxpages)
+            print("cd {}; xetex {} -> {}".format(self.tmpdir, outfname, res))
             logfname = outfname.replace(".tex", ".log")
-            (self.loglines, rerun) = self.parselog(os.path.join(self.tmpdir, logfname), rerunp=True, lines=300)
-            info.printer.editFile_delayed(logfname, "wrk", "tb_XeTeXlog", False)
+            logpath = os.path.join(self.tmpdir, logfname)
+            if fmt is not None and res and abort is None and (not os.path.exists(logpath) or os.path.getmtime(logpath) < starttime):
+                # xetex could not load the format, so go back to inputting the macros
+                logger.info(f"Could not run with {fmt[0]}.fmt, inputting macros instead")
+                self.formatfailed(fmt[0][5:], True)
+                fmt = None
+                continue
+            (loglines, rerun) = self.parselog(logpath, rerunp=True, lines=300)
+            if abort is not None:
+                loglines.extend(["! " + _("Stopped XeTeX early, it seems to have run away") + "\n", abort + "\n", "\n"])
+            if showlog:
+                info.printer.editFile_delayed(logfname, "wrk", "tb_XeTeXlog", False)
             numruns += 1
-            self.rerunReasons = []
+            rerunreasons = []
             tocfname = os.path.join(self.tmpdir, outfname.replace(".tex", ".toc"))
-            if self.res > 0:
-                rerun = False
+            if res > 0:
                 if os.path.exists(tocfname):
                     os.remove(tocfname)
                 break
-            rererun = rerun
+            tidied = False
             if os.path.exists(marginnotesfname):
                 (tsize, ttop, tbot) = info.getTextBlockSize()
                 if tidymarginnotes(marginnotesfname, psize=tsize, top=ttop, bot=tbot):
-                    rererun = True
-                    if self.maxRuns == 1:
-                        self.maxRuns = 2
-            for a in cacheexts.keys():
-                testdata = cachedata[a]
-                fpath = os.path.join(self.tmpdir, outfname.replace(".tex", "."+a))
-                cachedata[a] = self.readfile(fpath)
-                if testdata != cachedata[a]:
-                    if numruns >= self.maxRuns or not cacheexts[a][1]:
-                        self.rerunReasons.append(cacheexts[a][0])
-                    else:
-                        print(_("Rerunning because the {} changed").format(cacheexts[a][0]))
-                        rererun = True
-                        break
-            delayed = os.path.join(self.tmpdir, outfname.replace(".tex", ".delayed"))
-            if not rerun and os.path.exists(delayed):
-                with open(delayed, encoding="utf-8") as inf:
-                    for l in inf.readlines():
-                        if l.startswith(r"\Rerun{"):
-                            rerun = True
-                            print(_("Rerunning because the delayed file asked us to"))
-                            break
+                    tidied = True
+                    if maxruns == 1:
+                        maxruns = 2
             if os.path.exists(tocfname):
-                tailoring = self.printer.ptsettings.getCollation()
-                ducet = tailored(tailoring.text) if tailoring else None
-                bklist = self.printer.getBooks()
-                copyfile(tocfname, tocfname.replace(".", "_org."))
-                toc = TOC(tocfname)
-                newtoc = generateTex(toc.createtocvariants(bklist, ducet=ducet))
-                with open(tocfname, "w", encoding="utf-8") as outf:
-                    outf.write(newtoc)
+                self.regenTOC(tocfname, extra=tocextra)
+            # Only a .parlocs this run wrote says how long the next run should be
+            if os.path.exists(parlocsfname) and os.path.getmtime(parlocsfname) >= starttime:
+                pages = readPages(parlocsfname)
+                maxpages = max(2 * len(pages), len(pages) + 200) if pages else None
+            else:
+                maxpages = None
+            (rererun, rerunreasons) = planner.endrun(logrerun=rerun, tidied=tidied, final=numruns >= maxruns)
             if not rererun:
                 break
+            msg = planner.rerunmessage()
+            if msg is not None:
+                print(msg)
+        if numruns > 1:
+            logger.info("XeTeX runs for {}:\n  {}".format(outfname, "\n  ".join(planner.summary())))
+        return (res, loglines, rerunreasons, planner.runs)
 
-        if not self.res:
-            self.printer.incrementProgress(stage="xp")
-            tmppdf = self.procpdfFile(outfname, pdffile, info)
-            if info["finishing/extraxdvproc"]:
-                self.processxdv(outfname.replace(".tex", ".xdv"), self.getxdvname(outfname, info), info)
-            cmd = ["xdvipdfmx", "-E", "-V", str(self.args.pdfversion / 10.), "-C", "16", "-v", "-o", tmppdf]
-            #if self.ispdfxa == "PDF/A-1":
-            #    cmd += ["-z", "0"]
-            if self.args.extras & 7:
-                cmd.insert(-2, "-" + ("v" * (self.args.extras & 7)))
-            with open(outfname.replace(".tex", ".xdvi_log"), "w") as outf:
-                runner = call(cmd + [self.getxdvname(outfname, info)], cwd=self.tmpdir, stdout=outf, stderr=outf)
-            logger.debug(f"Running: {cmd} for {outfname}")
-            if self.args.extras & 1:
-                print(f"Subprocess return value: {runner}")
-            if isinstance(runner, subprocess.Popen) and runner is not None:
-                try:
-                    runner.wait()
-                    #runner.wait(self.args.timeout)
-                except subprocess.TimeoutExpired:
-                    print("Timed out!")
-                self.res = 4 if runner.returncode else 0
-                logger.debug(f"{runner.stdout.decode('UTF-8')}")
-            elif isinstance(runner, subprocess.CompletedProcess):
-                self.res = 4 if runner.returncode else 0
-                logger.debug(f"{runner.stdout}")
-            else:
-                self.res = 4 if runner else 0
-            self.printer.incrementProgress(stage="fn") #Suspect that this was causing it to SegFault (but no idea why)
-            if self.res == 0 and not self.procpdf(outfname, pdffile, info, cover=info['cover/makecoverpage'] != '%'):
-                self.res = 3
-        print("Done")
+    def monitorxetex(self, cmd, outfname, run, showprogress=True, maxpages=None):
+        """ Runs XeTeX, following its output to report progress and to stop it if it runs
+            away. maxpages is how many pages it may ship before that counts as running
+            away, None to only watch for repeated messages.
+            Returns (result, why it was stopped or None) """
+        def progress(mon):
+            detail = _("{} page {}").format(mon.book, mon.pageno) if mon.book else _("page {}").format(mon.pageno)
+            self.printer.incrementProgress(stage="lo", run=run, detail=detail, advance=False)
+        monitor = LogMonitor(maxpages=maxpages, progress=(progress if showprogress else None))
+        try:
+            runner = popen(cmd, cwd=self.tmpdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            logger.error(f"Failed to run xetex: {e}")
+            return (1, None)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        while True:
+            data = runner.stdout.read1(4096)
+            if not data:
+                monitor.close()
+                break
+            if monitor.feed(decoder.decode(data)) is not None:
+                logger.warning(f"Stopping xetex on {outfname}: {monitor.abort}")
+                runner.terminate()
+                break
+        runner.stdout.close()
+        res = runner.wait()
+        if monitor.abort is not None and res <= 0:
+            res = 1
+        logger.debug(f"xetex shipped {monitor.pages} pages, messages: {monitor.counts}")
+        return (res, monitor.abort)
+
+    def regenTOC(self, tocfname, extra=None, fromorg=False):
+        """ Turns the table of contents XeTeX wrote into all the variants the macros can
+            use, adding in any extra entries (for books typeset in another job) """
+        orgfname = tocfname.replace(".", "_org.")
+        if not fromorg:
+            copyfile(tocfname, orgfname)
+        tailoring = self.printer.ptsettings.getCollation()
+        ducet = tailored(tailoring.text) if tailoring else None
+        bklist = self.printer.getBooks()
+        toc = TOC(orgfname)
+        if extra is not None:
+            others = set(e[0] for e in extra)
+            toc.tocentries = [e for e in toc.tocentries if e[0] not in others] + [e[:] for e in extra]
+        newtoc = generateTex(toc.createtocvariants(bklist, ducet=ducet))
+        with open(tocfname, "w", encoding="utf-8") as outf:
+            outf.write(newtoc)
+
+    def xdvipdfmx(self, outfname, pdfname, info, xdvjobs=None):
+        """ Turns the .xdv from outfname into pdfname. Returns 4 on failure, else 0 """
+        if info["finishing/extraxdvproc"]:
+            self.processxdv(outfname.replace(".tex", ".xdv"), self.getxdvname(outfname, info), info, jobs=xdvjobs)
+        cmd = ["xdvipdfmx", "-E", "-V", str(self.args.pdfversion / 10.), "-C", "16", "-v", "-o", pdfname]
+        #if self.ispdfxa == "PDF/A-1":
+        #    cmd += ["-z", "0"]
+        if self.args.extras & 7:
+            cmd.insert(-2, "-" + ("v" * (self.args.extras & 7)))
+        with open(outfname.replace(".tex", ".xdvi_log"), "w") as outf:
+            runner = call(cmd + [self.getxdvname(outfname, info)], cwd=self.tmpdir, stdout=outf, stderr=outf)
+        logger.debug(f"Running: {cmd} for {outfname}")
+        if self.args.extras & 1:
+            print(f"Subprocess return value: {runner}")
+        if isinstance(runner, subprocess.Popen) and runner is not None:
+            try:
+                runner.wait()
+                #runner.wait(self.args.timeout)
+            except subprocess.TimeoutExpired:
+                print("Timed out!")
+            res = 4 if runner.returncode else 0
+            logger.debug(f"{runner.stdout.decode('UTF-8')}")
+        elif isinstance(runner, subprocess.CompletedProcess):
+            res = 4 if runner.returncode else 0
+            logger.debug(f"{runner.stdout}")
+        else:
+            res = 4 if runner else 0
+        return res
 
     def done_job(self, outfname, pdfname, info):
         # Work out what the resulting PDF was called
@@ -998,11 +1531,16 @@ class RunJob:
         imgorder  = self.printer.get("t_imageTypeOrder")
         lowres    = self.printer.get("r_pictureRes") == "Low"
         picinfos.srchlist = None
-        for j in books:
-            logger.debug(f"getsrc&dest for {j}")
-            picinfos.getFigureSources(keys=j, exclusive=exclusive, mode=self.ispdfxa,
-                                      figFolder=fldr, imgorder=imgorder, lowres=lowres)
-            picinfos.set_destinations(fn=carefulCopy, keys=j, cropme=cropme)
+        self.picjobs = {}
+        try:
+            for j in books:
+                logger.debug(f"getsrc&dest for {j}")
+                picinfos.getFigureSources(keys=j, exclusive=exclusive, mode=self.ispdfxa,
+                                          figFolder=fldr, imgorder=imgorder, lowres=lowres)
+                picinfos.set_destinations(fn=carefulCopy, keys=j, cropme=cropme)
+            self.convertPictures(list(self.picjobs.values()))
+        finally:
+            self.picjobs = None
         logger.debug(f"{books=}, {[x.fields for x in picinfos.pics.values()]}")
         missingPics = [v['src'] for v in picinfos.get_pics() if v['anchor'][:3] in books and 'destfile' not in v and 'src' in v]
         res = [os.path.join("tmpPics", v['destfile']) for v in picinfos.get_pics() if 'destfile' in v]
@@ -1033,46 +1571,51 @@ class RunJob:
         else:
             self.printer.set("l_missingPictureCount", _("(0 Missing)"))
             self.printer.set("l_missingPictureString", "")
+        if self.imagecache is not None:
+            pruned = self.imagecache.prune()
+            logger.debug(f"Picture cache: {self.imagecache.hits} hits, {self.imagecache.misses} misses, {pruned} removed")
         self.printer.incrementProgress(stage="lo")
         logger.debug("Illustrations gathered")
         return res
 
-    def getBorder(self, box, start, end, fn):
-        if start > end:
-            it = range(box[start]-1, box[end]-1, -1)
-        else:
-            it = range(box[start], box[end])
-        otheri = 0 if (start & 1) else 1
-        others = box[otheri]
-        othere = box[otheri+2]
-        for t in it:
-            score = sum(fn(t, i) for i in range(others, othere))
-            # 8 = 256 * 5% (approx)
-            if score > 8 * (othere - others):
-                break
-        return t
+    @staticmethod
+    def getBorder(sums, start, end, limit):
+        """ Returns the index of the first line from start, going towards end, whose sum
+            is over limit. If there is none, returns the line next to end. """
+        hits = np.flatnonzero(sums > limit)
+        if not len(hits):
+            return end + 1 if start > end else end - 1
+        return start + hits[0] if start < end else start - (len(sums) - 1 - hits[-1])
 
     def cropBorder(self, im):
         try:
-            bwim = im.convert("L").load()
+            bwim = np.asarray(im.convert("L"), dtype=np.uint32)
         except OSError:
             return im
         box = im.getbbox()
-        cbox = []
-        cbox.append(self.getBorder(box, 0, 2, lambda x, y: bwim[x, y]))
-        cbox.append(self.getBorder(box, 1, 3, lambda y, x: bwim[x, y]))     # top is 0
-        cbox.append(self.getBorder(box, 2, 0, lambda x, y: bwim[x, y]))
-        cbox.append(self.getBorder(box, 3, 1, lambda y, x: bwim[x, y]))
-        cbox = tuple(cbox)
+        if box is None:
+            return im
+        (l, t, r, b) = box
+        bwim = bwim[t:b, l:r]
+        cols = bwim.sum(axis=0)
+        rows = bwim.sum(axis=1)
+        # 8 = 256 * 5% (approx)
+        cbox = (self.getBorder(cols, l, r, 8 * (b - t)),
+                self.getBorder(rows, t, b, 8 * (r - l)),    # top is 0
+                self.getBorder(cols, r-1, l-1, 8 * (b - t)),
+                self.getBorder(rows, b-1, t-1, 8 * (r - l)))
+        cbox = tuple(int(x) for x in cbox)
         if cbox != box:
             return im.crop(cbox)
         return im
 
-    def convertToJPGandResize(self, ratio, infile, outfile, cropme):
+    def imageFormat(self):
         if self.ispdfxa in _pdfmodes['cmyk'] and not self.printer.get("c_figplaceholders"):
-            fmt = "CMYK"
-        else:
-            fmt = "RGB"
+            return "CMYK"
+        return "RGB"
+
+    def convertToJPGandResize(self, ratio, infile, outfile, cropme):
+        fmt = self.imageFormat()
         with open(infile,"rb") as inf:
             rawdata = inf.read()
         newinf = cStringIO(rawdata)
@@ -1135,11 +1678,18 @@ class RunJob:
         tmpPicPath = os.path.join(self.printer.project.printPath(self.printer.cfgid), "tmpPics")
         tgtpath = os.path.join(tmpPicPath, tgtfile)
         if os.path.splitext(srcpath)[1].lower().startswith(".pdf"):
+            key = self.imagecache.key(srcpath, "pdf") if self.imagecache is not None else None
+            if key is not None and self.imagecache.fetch(key, tgtpath):
+                return os.path.basename(tgtpath)
             log.setLevel(logging.CRITICAL)
             trailer = PdfReader(srcpath)
+            if os.path.exists(tgtpath):     # it may be linked to a cached copy
+                os.remove(tgtpath)
             writer = PdfWriter(tgtpath)
             writer.trailer = trailer
             writer.write()
+            if key is not None:
+                self.imagecache.store(key, tgtpath)
             return os.path.basename(tgtpath)
         try:
             im = Image.open(srcpath)
@@ -1152,19 +1702,59 @@ class RunJob:
         if cropme or (ratio is not None and iw/ih < ratio) \
                   or os.path.splitext(srcpath)[1].lower() in (".tif", ".tiff", ".png"):
             tgtpath = os.path.splitext(tgtpath)[0]+".jpg"
+            key = None
+            if self.imagecache is not None:
+                key = self.imagecache.key(srcpath, "jpg", ratio, bool(cropme), self.imageFormat())
+                if key is not None and self.imagecache.fetch(key, tgtpath):
+                    return os.path.basename(tgtpath)
+            if os.path.exists(tgtpath):     # it may be linked to a cached copy
+                os.remove(tgtpath)
+            if self.picjobs is not None:
+                # converted all together once gatherIllustrations has them all
+                self.picjobs[tgtpath] = (ratio, srcpath, tgtpath, cropme, key)
+                return os.path.basename(tgtpath)
             #try:
             self.convertToJPGandResize(ratio, srcpath, tgtpath, cropme)
+            if key is not None:
+                self.imagecache.store(key, tgtpath)
             #except: # MH: Which exception should I try to catch?
             #    print(_("Error: Unable to convert/resize image!\nImage skipped:"), srcpath)
             #    return os.path.basename(tgtpath)
         else:
             try:
+                # copy rather than write through a link to a cached picture
+                if os.path.exists(tgtpath):
+                    os.remove(tgtpath)
                 copyfile(srcpath, tgtpath)
             except OSError:
                 print(_("Error: Unable to copy {}\n       image to {} in tmpPics folder"), srcpath, tgtpath)
                 return os.path.basename(tgtpath)
         return os.path.basename(tgtpath)
 
+    def convertPictures(self, jobs):
+        """ Converts each (ratio, srcpath, tgtpath, cropme, key) in jobs, in a pool of
+            forked worker processes when possible. Each worker holds one picture at a time. """
+        workers = self.numWorkers(len(jobs))
+        if workers < 2 or "fork" not in multiprocessing.get_all_start_methods():
+            for (ratio, srcpath, tgtpath, cropme, key) in jobs:
+                self.convertToJPGandResize(ratio, srcpath, tgtpath, cropme)
+                if key is not None:
+                    self.imagecache.store(key, tgtpath)
+            return
+        global _picjobs
+        _picjobs = [(self, ) + j for j in jobs]
+        logger.debug(f"Converting {len(jobs)} pictures with {workers} workers")
+        pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            for i in pool.imap_unordered(_convertPoolPic, range(len(jobs))):
+                (ratio, srcpath, tgtpath, cropme, key) = jobs[i]
+                if key is not None:
+                    self.imagecache.store(key, tgtpath)
+        finally:
+            pool.close()
+            pool.join()
+            _picjobs = None
+
     def usablePageRatios(self, info):
         pageHeight = convert2mm(info.dict["paper/height"])
         pageWidth = convert2mm(info.dict["paper/width"])
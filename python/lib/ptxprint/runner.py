@@ -23,6 +23,9 @@ if sys.platform == "linux":
     def call(*a, **kw):
         return subprocess.call(*a, **kw)
 
+    def popen(*a, **kw):
+        return subprocess.Popen(*a, **kw)
+
 elif sys.platform == "darwin":
 
     def fclist(family, pattern):
@@ -55,6 +58,12 @@ elif sys.platform == "darwin":
         res = subprocess.run(*newa, **kw)
         return res
 
+    def popen(*a, **kw):
+        path = os.path.join(pt_bindir(), "xetex", "bin", bindir, a[0][0]).replace("\\", "/")
+        newa = [[path] + a[0][1:]] + list(a)[1:]
+        logger.debug(f"{path=} {newa=}")
+        return subprocess.Popen(*newa, **kw)
+
 elif sys.platform == "win32":
     CREATE_NO_WINDOW = 0x08000000
 
@@ -88,3 +97,9 @@ elif sys.platform == "win32":
         res = subprocess.run(*newa, creationflags=CREATE_NO_WINDOW, **kw)
         return res
 
+    def popen(*a, **kw):
+        path = os.path.join(pt_bindir(), "xetex", "bin", bindir, a[0][0]+".exe").replace("/", "\\")
+        newa = [[path] + a[0][1:]] + list(a)[1:]
+        logger.debug(f"{path=} {newa=}")
+        return subprocess.Popen(*newa, creationflags=CREATE_NO_WINDOW, **kw)
+
@@ -1,4 +1,4 @@
-import regex, traceback
+import regex, traceback, functools
 from ptxprint.minidialog import MiniCheckButton
 from usfmtc.reference import Environment
 from ptxprint.utils import _
@@ -7,6 +7,36 @@ def makeChange(pattern, to, flags=0, context=None):
     frame =  traceback.extract_stack(limit=2)[0]
     return (context, regex.compile(pattern, flags), to, f"{frame.filename} line {frame.lineno}")
 
+class Syllabifier:
+    """ Applies a list of (pattern, replacement) syllable breaking rules a word at a time.
+        The rules only look at a word and at what is either side of it, so each distinct
+        word is broken once and remembered. """
+
+    def __init__(self, rules):
+        self.rules = [(regex.compile(p), t) for p, t in rules]
+        self.breakword = functools.lru_cache(maxsize=1 << 16)(self._breakword)
+
+    def _breakword(self, word, follows):
+        # A following non-word character is all the rules can see beyond the word
+        s = word + " " if follows else word
+        for r, t in self.rules:
+            s = r.sub(t, s)
+        return s[:-1] if follows else s
+
+    def cacheKey(self):
+        return [(r.pattern, t) for r, t in self.rules]
+
+    def __call__(self, m):
+        return self.breakword(m.group(0), m.end() < len(m.string))
+
+_syllabifiers = {}
+def syllabifier(rules):
+    """ Returns the Syllabifier for rules, keeping it (and what it has learnt) between jobs """
+    rules = tuple(rules)
+    if rules not in _syllabifiers:
+        _syllabifiers[rules] = Syllabifier(rules)
+    return _syllabifiers[rules]
+
 class ScriptSnippet:
     dialogstruct = None
     refenv = Environment
@@ -46,12 +76,20 @@ class ScriptSnippet:
         syllPattern3 = "(?:[" + cls.indVowels + "][" + cls.vmodifiers + "]*)"
         gSyllPattern = "(" + syllPattern1 + "|" + syllPattern2 + "|" + syllPattern3 + ")"
 
-        res += [makeChange(gSyllPattern, cls.hyphenChar + r'\1', context=onlybody)]                  # Begin by inserting a break before EVERY syllable
-        res += [makeChange(gNonWordChar + cls.hyphenChar, r'\1', context=onlybody)]                  # Remove break at start of word
-        res += [makeChange(gNonWordChar + gSyllPattern + cls.hyphenChar, r'\1\2', context=onlybody)] # Remove break after 1st syllable (need 2 syll before break.)
-        res += [makeChange(cls.hyphenChar + gSyllPattern + gNonWordChar, r'\1\2', context=onlybody)] # Remove break before last syllable (need 2 syll after break.)
-        res += [makeChange(cls.hyphenChar + r"(?=[\u0d7a-\u0d7f])", '', context=onlybody)]           # Remove break before MAL atomic chillu  \u0d7a-\u0d7f
-        res += [makeChange(cls.hyphenChar + r"(?=[\u0d23\u0d28\u0d30\u0d32\u0d33\u0d15]\u0d4d\u200d)", '', context=onlybody)] # Remove break before MAL old-style chillu 
+        rules = []
+        rules += [(gSyllPattern, cls.hyphenChar + r'\1')]                  # Begin by inserting a break before EVERY syllable
+        rules += [(gNonWordChar + cls.hyphenChar, r'\1')]                  # Remove break at start of word
+        rules += [(gNonWordChar + gSyllPattern + cls.hyphenChar, r'\1\2')] # Remove break after 1st syllable (need 2 syll before break.)
+        rules += [(cls.hyphenChar + gSyllPattern + gNonWordChar, r'\1\2')] # Remove break before last syllable (need 2 syll after break.)
+        rules += [(cls.hyphenChar + r"(?=[\u0d7a-\u0d7f])", '')]           # Remove break before MAL atomic chillu  \u0d7a-\u0d7f
+        rules += [(cls.hyphenChar + r"(?=[\u0d23\u0d28\u0d30\u0d32\u0d33\u0d15]\u0d4d\u200d)", '')] # Remove break before MAL old-style chillu 
+
+        # A word is a run of anything the rules can match other than a non-word character
+        # on its edge, so the rules give the same result on each word alone.
+        wordPattern = "[\u003d" + cls.hyphenChar + cls.wordChars + cls.cons + cls.cmodifiers + cls.viramas \
+                        + cls.matras + cls.vmodifiers + cls.indVowels \
+                        + r"\u200c\u200d\u0324\u0d7a-\u0d7f\u0d23\u0d28\u0d30\u0d32\u0d33\u0d15\u0d4d]+"
+        res += [makeChange(wordPattern, syllabifier(rules), context=onlybody)]
         return res
 
 #nonbodymarkers = ("id", "h", "h1", "toc1", "toc2", "toc3", "mt1", "mt2")
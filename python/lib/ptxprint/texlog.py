@@ -143,23 +143,198 @@ messages = [
 # Compile all message patterns into a single regular expression
 message_regex = '|'.join(f'({pattern})' for _,_, pattern in messages)
 
+# Messages that, if they keep coming, mean the job is going round in circles and will not finish
+runawaymsgs = {
+    r"No space for text on page!",
+    r"UNPRINTABLE PAGE CONTENTS! Image too big? Somewhere near .+",
+    r"Abandoning ship with nothing on the page",
+    r"Trying to continue by breaking rules"
+}
+
+def _namedpattern(i, pattern):
+    if pattern.startswith("(?s)"):
+        return f"(?P<m{i}>(?s:{pattern[4:]}))"
+    return f"(?P<m{i}>{pattern})"
+
+# One pattern to find any of the messages, with the group name giving the index into messages
+_messagere = re.compile("|".join(_namedpattern(i, m[2]) for i, m in enumerate(messages)))
+# A page being shipped out, which TeX shows as [pageno], but not when it is part of a message
+_shipoutre = re.compile(r"(?:^|(?<=[\s\]]))\[(-?\d+)(?=[\]\s.<{(]|$)")
+# A book being read, as in (./41MATWSG-Default.SFM
+_bookfilere = re.compile(r"\((?:[^()\s]*[/\\])?\d\d([A-Z0-9]{3})[^()\s/\\]*\.(?i:u?sfm)\b")
+
+class LogMonitor:
+    """ Follows the terminal output of a XeTeX run as it happens, counting the pages shipped
+        out, noting which book is being read and counting the messages seen. Since TeX puts
+        page numbers and messages on one line until it reaches max_print_line, pages and
+        books are looked for in the text as it comes, but messages only once their line is
+        complete. progress is called with the monitor whenever a page is shipped or a new
+        book started. feed() returns why the run should be abandoned, once it has run away:
+        more than maxpages pages, or one of the runawaymsgs reported repeats times. """
+
+    def __init__(self, maxpages=None, repeats=20, progress=None):
+        self.maxpages = maxpages
+        self.repeats = repeats
+        self.progress = progress
+        self.pages = 0
+        self.pageno = None
+        self.book = None
+        self.counts = {"I": 0, "W": 0, "E": 0}
+        self.seen = {}
+        self.abort = None
+        self.pending = ""
+        self.scanned = 0
+
+    def feed(self, text):
+        """ Takes the next chunk of output, which need not end at a line end """
+        if self.abort is not None:
+            return self.abort
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()
+        changed = False
+        for l in lines:
+            changed = self._scanpages(l, self.scanned, len(l)) or changed
+            self._scanmessages(l)
+            self.scanned = 0
+        # only look up to the last space, so as not to cut a page number or file name in two
+        cut = max(self.pending.rfind(" "), self.pending.rfind("\t")) + 1
+        if cut > self.scanned:
+            changed = self._scanpages(self.pending, self.scanned, cut) or changed
+            self.scanned = cut
+        if self.abort is None and self.maxpages is not None and self.pages > self.maxpages:
+            self.abort = f"{self.pages} pages is more than the {self.maxpages} expected"
+        if changed and self.progress is not None:
+            self.progress(self)
+        return self.abort
+
+    def close(self):
+        """ Scans whatever is left at the end of the output """
+        if len(self.pending):
+            self.feed("\n")
+
+    def _scanpages(self, line, start, end):
+        changed = False
+        for m in _bookfilere.finditer(line, start, end):
+            if m.group(1) != self.book:
+                self.book = m.group(1)
+                changed = True
+        for m in _shipoutre.finditer(line, start, end):
+            if line[:m.start()].rstrip().endswith(":"):
+                continue
+            self.pages += 1
+            self.pageno = m.group(1)
+            changed = True
+        return changed
+
+    def _scanmessages(self, line):
+        for m in _messagere.finditer(line):
+            i = int(m.lastgroup[1:])
+            category, _, pattern = messages[i]
+            self.counts[category[0]] += 1
+            n = self.seen[i] = self.seen.get(i, 0) + 1
+            if pattern in runawaymsgs and n >= self.repeats and self.abort is None:
+                self.abort = f"'{m.group(0)}' reported {n} times"
+
 # Function to summarize issues in a log file
 def summarize_log_file(log_file_path):
     # Read the log file
     with open(log_file_path, 'r', encoding='utf-8') as log_file:
         log_contents = log_file.read()
-    summarizeTexLog(log_contents)
+    category_counts, messageSummary, _ = summarizeTexLog(log_contents)
+    print(category_counts, '\n'.join(messageSummary))
 
-# Function to summarize issues in the log text
-def summarizeTexLog(logText):
+def _literal(pattern):
+    """ Returns the longest run of plain text in a pattern that any match must contain,
+        or None if there is nothing long enough to be worth looking for. """
+    best = cur = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        lit = None
+        if c == "\\":
+            if not pattern[i].isalnum():
+                lit = pattern[i]
+            i += 1
+        elif c == "[":
+            if pattern[i] == "^":
+                i += 1
+            if pattern[i] == "]":
+                i += 1
+            while pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return None
+        elif c not in ".^$*+?{}":
+            lit = c
+        quant = pattern[i] if i < len(pattern) else ""
+        if lit is not None and depth == 0 and (quant == "" or quant not in "*?{"):
+            cur += lit
+            if quant != "+":
+                continue
+        if len(cur) > len(best):
+            best = cur
+        cur = ""
+    if len(cur) > len(best):
+        best = cur
+    return best if len(best) > 3 else None
+
+_underfill = r'Underfill\[(A|B)\]: \[(\d+)\]'
+# Each message (and the underfill report last) with the text it must contain and whether it
+# can match across lines
+_scanpatterns = [p for _, _, p in messages] + [_underfill]
+_scanres = [re.compile(p) for p in _scanpatterns]
+_anchors = [_literal(p) for p in _scanpatterns]
+_spanning = [r"\s" in p or "(?s)" in p or "[^" in p for p in _scanpatterns]
+# Which patterns to look at when a given text is found. Any shorter text found at the same
+# place is a prefix of the one reported, so the patterns for those are included too.
+_anchored = {a: [i for i, b in enumerate(_anchors) if b is not None and a.startswith(b)]
+                for a in set(_anchors) if a is not None}
+_anchorre = re.compile("|".join(re.escape(a) for a in sorted(_anchored.keys(), key=len, reverse=True)))
+
+def _scanlog(logText):
+    """ Finds, in one pass, the start of each line that each pattern might match in """
+    found = {}
+    pos = 0
+    linestart = 0
+    while True:
+        m = _anchorre.search(logText, pos)
+        if m is None:
+            break
+        linestart = logText.rfind("\n", pos - 1 if pos else 0, m.start()) + 1 or linestart
+        for i in _anchored[m.group(0)]:
+            lines = found.setdefault(i, [])
+            if not len(lines) or lines[-1] != linestart:
+                lines.append(linestart)
+        pos = m.start() + 1
+    return found
+
+def _matches(i, logText, found):
+    if _anchors[i] is None:
+        yield from _scanres[i].finditer(logText)
+    elif i not in found:
+        return
+    elif _spanning[i]:
+        yield from _scanres[i].finditer(logText)
+    else:
+        for s in found[i]:
+            e = logText.find("\n", s)
+            yield from _scanres[i].finditer(logText, s, len(logText) if e < 0 else e)
+
+def _summarize(messagematches, uf_matches):
     # Create dictionaries to count occurrences of each category
     category_counts = {"I": 0, "W": 0, "E": 0}
     messageSummary = []
     allmsgs = set()
 
     # Iterate through the messages and check for matches
-    for category, response, pattern in messages:
-        matches = re.finditer(pattern, logText)
+    for (category, response, pattern), matches in zip(messages, messagematches):
         for i, match in enumerate(matches):
             category_counts[category[0]] += 1
             # print(f"{category}:{pattern}") # good for figuring out which message is causing it to crash!
@@ -174,18 +349,29 @@ def summarizeTexLog(logText):
                         messageSummary.append(f"  Try {j}. {responses[r]}")
 
     # Look for Unbalanced or Unfilled pages
-    uf_matches = re.findall(r'Underfill\[(A|B)\]: \[(\d+)\]', logText)
     unique_page_numbers = []
     if len(uf_matches):
         # Extract unique page numbers and sort them in ascending order
         unique_page_numbers = sorted(set(int(match[1]) for match in uf_matches), key=int)
         category_counts["W"] += 1
         messageSummary.append(f"{len(unique_page_numbers)} underfilled pages: {shorten_ranges(unique_page_numbers)}")
+    return category_counts, messageSummary, unique_page_numbers
 
-    if __name__ == "__main__":
-        print(category_counts, '\n'.join(messageSummary))
-    else:
-        return category_counts, messageSummary, unique_page_numbers
+# Function to summarize issues in the log text
+def summarizeTexLog(logText):
+    """ Returns (counts by category, summary lines, underfilled page numbers). The log is
+        scanned once for the fixed text in each message, and the messages are only matched
+        against the lines they might be in. """
+    found = _scanlog(logText)
+    uf = len(messages)
+    return _summarize((_matches(i, logText, found) for i in range(len(messages))),
+                      [m.groups() for m in _matches(uf, logText, found)])
+
+def summarizeTexLogByPattern(logText):
+    """ Matches each message over the whole log, as summarizeTexLog used to. Kept to check
+        and time summarizeTexLog against. """
+    return _summarize((re.finditer(p, logText) for _, _, p in messages),
+                      re.findall(_underfill, logText))
 
 def shorten_ranges(numbers):
     ranges = []
@@ -226,7 +412,31 @@ def search_and_summarize_recent_logs(root_folder):
                     # print(f"\n-- {log_file_path}")
                     summarize_log_file(log_file_path)
 
+def timeLogs(fnames, number=3):
+    """ Compares summarizeTexLog with summarizeTexLogByPattern on each log """
+    from timeit import timeit
+    for f in fnames:
+        with open(f, 'r', encoding='utf-8', errors='ignore') as log_file:
+            logText = log_file.read()
+        same = summarizeTexLog(logText) == summarizeTexLogByPattern(logText)
+        scan = timeit(lambda: summarizeTexLog(logText), number=number) / number
+        bypattern = timeit(lambda: summarizeTexLogByPattern(logText), number=number) / number
+        print(f"{f} ({len(logText) / 1e6:.1f} MB): scan {scan:.3f}s, by pattern {bypattern:.3f}s"
+              + ("" if same else " RESULTS DIFFER"))
+
 # Main program (if run from commandline)
 if __name__ == "__main__":
-    root_folder = r"C:\My Paratext 9 Projects"
-    search_and_summarize_recent_logs(root_folder)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", nargs="*", help="Log files to summarize")
+    parser.add_argument("-t", "--timeit", action="store_true", help="Time the log scanners on the log files")
+    parser.add_argument("-n", "--number", type=int, default=3, help="How many times to run each scanner")
+    args = parser.parse_args()
+    if args.timeit:
+        timeLogs(args.logs, number=args.number)
+    elif len(args.logs):
+        for f in args.logs:
+            summarize_log_file(f)
+    else:
+        root_folder = r"C:\My Paratext 9 Projects"
+        search_and_summarize_recent_logs(root_folder)
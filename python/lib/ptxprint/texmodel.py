@@ -18,6 +18,7 @@ from ptxprint.pdf.pdfsanitise import sanitise
 from ptxprint.texpert import TeXpert
 from ptxprint.modelmap import ModelMap
 from ptxprint.changes import readChanges, make_contextsfn
+from ptxprint.convcache import TrackingDict, textDigest, rulesDigest
 from usfmtc.versification import Versification
 import ptxprint.modelmap as modelmap
 import logging
@@ -84,6 +85,66 @@ _periphids = {
 }
 
 
+class BookState:
+    """ Holds a book being converted as either USFM text or a parsed document, and
+        only converts between the two when a pass needs the other form. """
+
+    def __init__(self, model, bk, dat):
+        self.model = model
+        self.bk = bk
+        self.dat = dat
+        self.doc = None
+        self.parses = 0
+        self.unparses = 0
+        self.unparsed = None        # (text, doc) from the most recent unparse
+
+    def text(self, logmsg=""):
+        if self.doc is not None:
+            self.dat = self.doc.asUsfm(grammar=self.model.printer.get_usfms().grammar)
+            self.unparses += 1
+            self.unparsed = (self.dat, self.doc)
+            self.doc = None
+            logger.log(5, logmsg+self.dat)
+        else:
+            logger.log(5, logmsg)
+        return self.dat
+
+    def document(self, logmsg=""):
+        if self.doc is None and self.dat is not None:
+            if self.unparsed is not None and self.unparsed[0] == self.dat:
+                # no text pass changed anything since we last had a document, so reuse it
+                self.doc = self.unparsed[1]
+            else:
+                self.doc = self.model._makeUSFM(self.dat, self.bk, reason=logmsg)
+                self.parses += 1
+            if self.doc is not None:
+                self.dat = None
+                if logger.isEnabledFor(5):
+                    logger.log(5, logmsg+self.doc.outUsx(None))
+        else:
+            logger.log(5, logmsg)
+        self.unparsed = None
+        return self.doc
+
+    def run(self, passes):
+        for kind, logmsg, fn in passes:
+            if kind == "text":
+                self.dat = fn(self.text(logmsg=logmsg))
+            elif kind == "parse":
+                self.doc = fn(self.text(logmsg=logmsg))
+                self.dat = None
+                self.unparsed = None
+                self.parses += 1
+            else:
+                doc = self.document(logmsg=logmsg)
+                if logmsg:
+                    logger.debug(logmsg)
+                if doc is not None:
+                    res = fn(doc)
+                    if res is not None:
+                        self.doc = res
+
+
 class TexModel:
     _ptxversion = 5
     _peripheralBooks = ["FRT", "INT"]
@@ -179,14 +240,19 @@ class TexModel:
         self.inserts = {}
         self.usedfiles = {}
         self.tablespans = set()
+        self.changesfiles = []
+        self.conversionStats = {}
+        self.convcache = None
+        self._hyphdigest = None
+        self.parseErrors = []
         libpath = pycodedir()
         path = printer.project.path
         printpath = printer.project.printPath(printer.cfgid)
-        self.dict = {"/ptxpath": str(path).replace("\\","/"),
+        self.dict = TrackingDict({"/ptxpath": str(path).replace("\\","/"),
                      "/ptxprintlibpath": libpath.replace("\\","/"),
                      "/iccfpath": os.path.join(libpath, "default_cmyk.icc").replace("\\","/"),
                      "/ptx2pdf": self.printer.scriptsdir.replace("\\", "/"),
-                     "/ptxdocpath": printpath.replace("\\", "/")}
+                     "/ptxdocpath": printpath.replace("\\", "/")})
         self.prjid = prjid
         if self.prjid is not None:
             self.dict['project/id'] = self.prjid
@@ -619,10 +685,13 @@ class TexModel:
         self.dict['project/colophontext'] = re.sub(r"(?i)(\\zimagecopyrights)([A-Z]{2,3})",
                 lambda m:m.group(0).lower(), self.dict['project/colophontext'])
         self.updateStyles()
-        for a in (('FrontPDFs', 'c_inclFrontMatter', 'frontincludes_'),
-                  ('BackPDFs', 'c_inclBackMatter', 'backincludes_')):
+        splitpart = self.dict.get('document/splitpart_', None)
+        for a in (('FrontPDFs', 'c_inclFrontMatter', 'frontincludes_', 'first'),
+                  ('BackPDFs', 'c_inclBackMatter', 'backincludes_', 'last')):
             files = getattr(self.printer, a[0], None)
-            if files is not None and self.printer.get(a[1]):
+            if splitpart is not None and not getattr(splitpart, a[3]):
+                self.dict[a[2]] = ""
+            elif files is not None and self.printer.get(a[1]):
                 self.prep_pdfs(files, restag=a[2], file_dir=filedir)
             else:
                 self.dict[a[2]] = ""
@@ -643,7 +712,14 @@ class TexModel:
             for l in inf.readlines():
                 if l.startswith(r"%\ptxfile"):
                     res.append(r"\PtxFilePath={"+saferelpath(filedir, docdir).replace("\\","/")+"/}")
-                    for i, f in enumerate(self.dict['project/bookids']):
+                    bookindices = range(len(self.dict['project/bookids']))
+                    if splitpart is not None:
+                        bookindices = splitpart.bookindices
+                        resetPageDone = splitpart.pagereset
+                        if not splitpart.first:
+                            res.append(r"\includeifpresent{{{}.pagestart}}".format(jobname))
+                    for i in bookindices:
+                        f = self.dict['project/bookids'][i]
                         fname = self.dict['project/books'][i]
                         dname = None
                         beforelast = []
@@ -664,7 +740,7 @@ class TexModel:
                                                 else "\\prepusfm\\zgetperiph|{}\\*\\unprepusfm"), "", None))
                                 if diglots:
                                     res.append(r"\diglottrue")
-                        if i == len(self.dict['project/bookids']) - 1: 
+                        if i == bookindices[-1]:
                             beforelast.append(r"\lastptxfiletrue")
                             if self.dict['project/ifcolophon'] == "" and self.dict['project/pgbreakcolophon'] != '%':
                                 beforelast.append(r"\endbooknoejecttrue")
@@ -903,56 +979,32 @@ class TexModel:
                 checkoutput(cmd) # dont't pass cmd as list when shell=True
         return outfpath
 
-    def _getText(self, data, doc, bk, logmsg=""):
-        if doc is not None:
-            data = doc.asUsfm(grammar=self.printer.usfms.grammar)
-            logger.log(5, logmsg+data)
-        else:
-            logger.log(5, logmsg)
-        return (data, None)
-
-    def _getDoc(self, data, doc, bk, logmsg=""):
-        if data is not None:
-            doc = self._makeUSFM(data, bk, reason=logmsg)
-            if doc is not None:
-                logger.log(5, logmsg+doc.outUsx(None))
-        else:
-            logger.log(5, logmsg)
-        return (None if doc else data, doc)
-        
     def _changeError(self, txt):
         self.printer.doError(txt + "\n\n" +_("If this error just appeared after upgrading then check whether the USFM markers like \\p and \\v used in changes.txt rules have been 'escaped' with an additional \\ (e.g. \\\\p and \\\\v) as is required by the latest version."), title="Error in changes.txt")
         logger.warn(txt)
 
-    def convertBook(self, bk, chaprange, outdir, prjdir, isbk=True, bkindex=0, reversify=None):
-        try:
-            isCanon = int(bookcodes.get(bk, 100)) < 89
-        except ValueError:
-            isCanon = False
-        printer = self.printer
-        if not len(self.changes):
-            if self.asBool('project/usechangesfile'):
-                # print("Applying PrntDrftChgs:", os.path.join(prjdir, 'PrintDraftChanges.txt'))
-                #cpath = self.printer.configPath(self.printer.configName())
-                #self.changes = self.readChanges(os.path.join(cpath, 'changes.txt'), bk)
-                def printError(msg, **kw):
-                    self.printer.doError(msg, show=not self.printer.get("c_quickRun"))
-                self.changes = readChanges(os.path.join(printer.project.srcPath(printer.cfgid), 'changes.txt'), bk, doError=self.printer.doError)
-        #adjlistfile = printer.getAdjListFilename(bk)
-        #if adjlistfile is not None:
-        #    adjchangesfile = os.path.join(printer.project.srcPath(printer.cfgid), "AdjLists",
-        #                        adjlistfile.replace(".adj", "_changes.txt"))
-        #    chs = self.readChanges(adjchangesfile, bk, makeranges=True, passes=["adjust"])
-        #    for k, v in chs.items():
-        #        self.changes.setdefault(k, []).extend(v)
-        draft = "-" + (printer.cfgid or "draft")
-        self.makelocalChanges(printer, bk, chaprange=(chaprange if isbk else None))
+    def loadChanges(self, bk):
+        if not len(self.changes) and self.asBool('project/usechangesfile'):
+            printer = self.printer
+            # print("Applying PrntDrftChgs:", os.path.join(prjdir, 'PrintDraftChanges.txt'))
+            #cpath = self.printer.configPath(self.printer.configName())
+            #self.changes = self.readChanges(os.path.join(cpath, 'changes.txt'), bk)
+            self.changesfiles = []
+            self.changes = readChanges(os.path.join(printer.project.srcPath(printer.cfgid), 'changes.txt'), bk,
+                                       doError=self.printer.doError, files=self.changesfiles)
+        return self.changes
+
+    def checkCustomSty(self, prjdir):
         customsty = os.path.join(prjdir, 'custom.sty')
         if not os.path.exists(customsty):
             self.dict["/nocustomsty"] = "%"
         else:
             self.dict["/nocustomsty"] = ""
-        fname = printer.getBookFilename(bk)
+
+    def bookInputPath(self, bk, outdir, prjdir):
+        """ Returns the path to the source text for bk, flattening modules and running
+            any 'before' conversion script. Returns None on failure. """
+        fname = self.printer.getBookFilename(bk)
         if fname is None:
             infpath = os.path.join(prjdir, bk)  # assume module
             infpath = self.flattenModule(infpath, outdir)
@@ -966,45 +1018,180 @@ class TexModel:
             infpath = os.path.join(prjdir, fname)
         if self.dict['project/processscript'] and self.dict['project/when2processscript'] == "before":
             infpath = self.runConversion(infpath, outdir)
+        return infpath
+
+    def bookOutputName(self, infpath):
+        """ Allocates a unique output filename for infpath within this job """
+        draft = "-" + (self.printer.cfgid or "draft")
         outfname = os.path.basename(infpath)
         outindex = self.usedfiles.setdefault(outfname, 0)
         outextra = str(outindex) if outindex > 0 else ""
         self.usedfiles[outfname] = outindex + 1
-        # outfname = fname
         doti = outfname.rfind(".")
         if doti > 0:
             outfname = outfname[:doti] + draft + outextra + outfname[doti:]
+        return outfname
+
+    def canConvertInParallel(self):
+        """ Interlinear and conversion scripts hook into state that cannot be shared
+            with worker processes, so books must be converted serially """
+        return self.interlinear is None and not self.dict['project/processscript']
+
+    def isCacheable(self, bk, infpath, reversify=None):
+        """ Can the conversion of bk be reused from the conversion cache? Not if it
+            depends on anything other than its source text, changes and settings """
+        if self.convcache is None or not self.canConvertInParallel() or reversify is not None:
+            return False
+        if self.printer.getBookFilename(bk) is None or bk.lower().startswith("xx") or bk == "GLO":
+            return False
+        if self.asBool("strongsndx/showintext") or self.asBool("notes/glossaryfootnotes"):
+            return False
+        if self.asBool("document/ifinclfigs") and bk in nonScriptureBooks:
+            return False
+        # a change made by a function that holds job state cannot be fingerprinted
+        if self.rulesDigest() is None:
+            return False
+        return True
+
+    def rulesDigest(self):
+        return rulesDigest(sum(self.changes.values(), []) + (self.localChanges or []))
+
+    def conversionDeps(self, bk, infpath):
+        """ Digests of everything other than settings that a book's conversion reads """
+        printer = self.printer
+        hyph = printer.hyphenation
+        if hyph is None:
+            self._hyphdigest = None
+        elif self._hyphdigest is None or self._hyphdigest[0] is not hyph:
+            words = getattr(hyph, 'wordlist', None)
+            self._hyphdigest = (hyph, textDigest(*sorted(words.values())) if words is not None else repr(hyph))
+        adjlist = printer.get_adjlist(bk)
+        return {
+            "version": self.GitVersionStr,
+            "source": self.convcache.fileDigest(infpath),
+            "changesfiles": {f: self.convcache.fileDigest(f) for f in self.changesfiles},
+            # the USFM grammar that parses and writes the book comes from these
+            "stylesheets": {f: self.convcache.fileDigest(f) for f in printer.get_usfms().sheets.files},
+            "encoding": self.ptsettings.get('Encoding', 65001),
+            "rules": self.rulesDigest(),
+            "adjlist": textDigest(*(list(r) for r in adjlist.liststore)) if adjlist is not None else None,
+            "hyphenation": self._hyphdigest[1] if self._hyphdigest is not None else None
+        }
+
+    def convertBook(self, bk, chaprange, outdir, prjdir, isbk=True, bkindex=0, reversify=None, infpath=None,
+                    outfname=None, retdoc=False, writefile=True):
+        """ Converts a book into outdir and returns the name of the output file. If retdoc
+            then returns (name, doc) where doc is the converted book as a Usfm, or None if it
+            has to be read from the file. Then the file is only written if writefile or
+            something else needs it. """
+        if self.convcache is None:
+            return self._convertBook(bk, chaprange, outdir, prjdir, isbk, bkindex, reversify, infpath, outfname,
+                                     retdoc, writefile)
+        self.dict.track()
+        try:
+            return self._convertBook(bk, chaprange, outdir, prjdir, isbk, bkindex, reversify, infpath, outfname,
+                                     retdoc, writefile)
+        finally:
+            self.dict.track(False)
+
+    def _convertBook(self, bk, chaprange, outdir, prjdir, isbk, bkindex, reversify, infpath, outfname,
+                     retdoc=False, writefile=True):
+        try:
+            isCanon = int(bookcodes.get(bk, 100)) < 89
+        except ValueError:
+            isCanon = False
+        printer = self.printer
+        self.loadChanges(bk)
+        #adjlistfile = printer.getAdjListFilename(bk)
+        #if adjlistfile is not None:
+        #    adjchangesfile = os.path.join(printer.project.srcPath(printer.cfgid), "AdjLists",
+        #                        adjlistfile.replace(".adj", "_changes.txt"))
+        #    chs = self.readChanges(adjchangesfile, bk, makeranges=True, passes=["adjust"])
+        #    for k, v in chs.items():
+        #        self.changes.setdefault(k, []).extend(v)
+        draft = "-" + (printer.cfgid or "draft")
+        self.makelocalChanges(printer, bk, chaprange=(chaprange if isbk else None))
+        self.checkCustomSty(prjdir)
+        if infpath is None:
+            infpath = self.bookInputPath(bk, outdir, prjdir)
+            if infpath is None:
+                return (None, None) if retdoc else None
+        if outfname is None:
+            outfname = self.bookOutputName(infpath)
         os.makedirs(outdir, exist_ok=True)
         outfpath = os.path.join(outdir, outfname)
+        cachekey = None
+        if self.isCacheable(bk, infpath, reversify):
+            cachekey = "{}-{}".format(bk, textDigest(outfname, prjdir, chaprange if isbk else None)[:16])
+            deps = self.conversionDeps(bk, infpath)
+            extras = self.convcache.fetch(cachekey, deps, self.dict, outfpath)
+            if extras is not None:
+                self.tablespans.update(tuple(x) for x in extras.get("tablespans", []))
+                for e in extras.get("parseerrors", []):
+                    self._showParseErrors(e)
+                return (outfname, None) if retdoc else outfname
+            oldspans = set(self.tablespans)
+            olderrors = len(self.parseErrors)
         codepage = self.ptsettings.get('Encoding', 65001)
         with universalopen(infpath, cp=codepage) as inf:
             dat = inf.read()
-        doc = None
         logger.debug(f"Converting {bk} {chaprange=} sections{self.changes.keys()}")
+        passes = self.planConversion(bk, chaprange, infpath, outfpath, isbk, bkindex, reversify, isCanon)
+        state = BookState(self, bk, dat)
+        state.run(passes)
+        dat = state.text(logmsg="Unparsing doc to output\n")
+        logger.debug(f"Converted {bk} with {state.parses} parses and {state.unparses} unparses")
+        self.conversionStats[bk] = (state.parses, state.unparses)
+        postscript = self.dict['project/processscript'] and self.dict['project/when2processscript'] == "after"
+        doc = None
+        if retdoc and not postscript:
+            # the unparsed doc is kept, so this only parses if a text pass came last
+            doc = state.document()
+        if doc is None or writefile or cachekey is not None:
+            with open(outfpath, "w", encoding="utf-8") as outf:
+                outf.write(dat)
+        if cachekey is not None:
+            self.convcache.store(cachekey, deps, self.dict, self.dict.tracked or [], outfpath,
+                                 extras={"tablespans": sorted(self.tablespans - oldspans),
+                                         "parseerrors": self.parseErrors[olderrors:]})
+        if postscript:
+            bn = os.path.basename(self.runConversion(outfpath, outdir))
+        else:
+            bn = os.path.basename(outfpath)
+
+        if '-conv' in bn:
+            newname = re.sub(r"(\{}\-conv|\-conv\{}|\-conv)".format(draft, draft), draft, bn)
+            if os.path.exists(os.path.join(outdir, bn)):
+                copyfile(os.path.join(outdir, bn), os.path.join(outdir, newname))
+                os.remove(os.path.join(outdir, bn))
+            bn = newname
+        return (bn, doc) if retdoc else bn
+            
+    def planConversion(self, bk, chaprange, infpath, outfpath, isbk, bkindex, reversify, isCanon):
+        """ Returns the list of passes that convert bk, in order, as (kind, logmsg, fn).
+            kind is "text" for fn(str) -> str, "doc" for fn(doc) -> doc or None (to keep
+            the same doc) and "parse" for fn(str) -> doc """
+        printer = self.printer
+        passes = []
+        errorfn = self._changeError if bkindex == 0 else None
+        def changespass(changes, **kw):
+            return lambda dat: runChanges(changes, bk, dat, **kw)
 
         if 'initial' in self.changes:
-            (dat, doc) = self._getText(dat, doc, bk, logmsg="Unparsing doc to run user changes\n")
-            dat = runChanges(self.changes['initial'], bk, dat, errorfn=self._changeError if bkindex == 0 else None)
+            passes.append(("text", "Unparsing doc to run user changes\n", changespass(self.changes['initial'], errorfn=errorfn)))
 
         if chaprange is None and self.dict["project/bookscope"] == "single":
             chaprange = RefList((RefRange(Ref(book=bk, chapter=int(float(self.dict["document/chapfrom"])), verse=0),
                                  Ref(book=bk, chapter=int(float(self.dict["document/chapto"])), verse=200)), ))
 
-        if chaprange is None or not isbk or not len(chaprange) or chaprange[0].first.chapter is None \
+        if not (chaprange is None or not isbk or not len(chaprange) or chaprange[0].first.chapter is None \
             or chaprange[0].last.chapter is None or \
             (chaprange[0].first.chapter < 2 and len(chaprange) == 1 and \
-                (chaprange[0].last.chapter >= int(chaps[bk]) or chaprange[0].last.chapter == 0)):
-            doc = None
-        else:
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            if doc is not None:
-                doc = doc.getsubbook(chaprange)
+                (chaprange[0].last.chapter >= int(chaps[bk]) or chaprange[0].last.chapter == 0))):
+            passes.append(("doc", "", lambda doc: doc.getsubbook(chaprange)))
 
         if self.interlinear is not None:
-            (dat, doc) = self._getText(dat, doc, bk)
-            linelengths = [len(x) for x in dat.splitlines(True)]
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            if doc is not None:
+            def dointerlinear(doc):
                 self.interlinear.convertBk(bk, doc, keep_punct = self.dict.get("project/interpunc", True))
                 if len(self.interlinear.fails):
                     refs = RefList(self.interlinear.fails)
@@ -1012,61 +1199,44 @@ class TexModel:
                     printer.doError("The following references need to be reapproved: " + str(refs),
                                     show=not printer.get("c_quickRun"))
                     self.interlinear.fails = []
+            passes.append(("doc", "", dointerlinear))
         elif bk.lower().startswith("xx"):
-            (dat, doc) = self._getText(dat, doc, bk, logmsg="flatten the module")
-            doc = self.flattenModule(infpath, outfpath, text=dat)
-            dat = None
+            passes.append(("parse", "flatten the module", lambda dat: self.flattenModule(infpath, outfpath, text=dat)))
 
         if 'default' in self.changes:
-            (dat, doc) = self._getText(dat, doc, bk, logmsg="Unparsing doc to run user changes\n")
-            dat = runChanges(self.changes['default'], bk, dat, errorfn=self._changeError if bkindex == 0 else None)
+            passes.append(("text", "Unparsing doc to run user changes\n", changespass(self.changes['default'], errorfn=errorfn)))
 
         if self.dict['project/canonicalise']:
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            dat = None
+            passes.append(("doc", "", lambda doc: None))
 
         if not self.asBool("document/bookintro") or not self.asBool("document/introoutline"):
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            logger.debug("stripIntro")
-            if doc is not None:
-                doc.stripIntro(not self.asBool("document/bookintro"), not self.asBool("document/introoutline"))
+            passes.append(("doc", "stripIntro", lambda doc: doc.stripIntro(not self.asBool("document/bookintro"),
+                                                                         not self.asBool("document/introoutline"))))
 
         if self.asBool("document/hidemptyverses"):
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            logger.debug("stripEmptyChVs")
-            if doc is not None:
-                doc.stripEmptyChVs(ellipsis=self.asBool("document/elipsizemptyvs"))
+            passes.append(("doc", "stripEmptyChVs", lambda doc: doc.stripEmptyChVs(ellipsis=self.asBool("document/elipsizemptyvs"))))
 
         if self.dict['fancy/endayah'] == "":
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            logger.debug("versesToEnd")
-            if doc is not None:
-                doc.versesToEnd()
+            passes.append(("doc", "versesToEnd", lambda doc: doc.versesToEnd()))
 
         if bk == "GLO" and self.found_glosses is not None:
-            (dat, doc) = self._getDoc(dat, doc, bk, logmsg="Remove filtered gloss entries")
-            if doc is not None:
-                doc.removeGlosses(self.found_glosses)
+            passes.append(("doc", "Remove filtered gloss entries", lambda doc: doc.removeGlosses(self.found_glosses)))
 
         if self.dict["strongsndx/showintext"] and self.dict["notes/xrlistsource"].startswith("strongs") \
                     and self.dict["notes/ifxrexternalist"] and isCanon:
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            logger.debug("Add strongs numbers to text")
-            script = (printer.get("fcb_script") or "").title()
-            try:
-                doc.addStrongs(printer.getStrongs(), self.dict["strongsndx/showall"], script=script)
-            except SyntaxError as e:
-                self.printer.doError("Processing Strongs", secondary=str(e))
+            def dostrongs(doc):
+                script = (printer.get("fcb_script") or "").title()
+                try:
+                    doc.addStrongs(printer.getStrongs(), self.dict["strongsndx/showall"], script=script)
+                except SyntaxError as e:
+                    self.printer.doError("Processing Strongs", secondary=str(e))
+            passes.append(("doc", "Add strongs numbers to text", dostrongs))
 
         if self.asBool("paragraph/ifhyphenate") and self.asBool("document/ifletter") and printer.hyphenation:
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            logger.debug("Insert hyphens manually")
-            if doc is not None:
-                doc.hyphenate(printer.hyphenation, self.dict["paragraph/ifnbhyphens"])
+            passes.append(("doc", "Insert hyphens manually", lambda doc: doc.hyphenate(printer.hyphenation, self.dict["paragraph/ifnbhyphens"])))
 
         if reversify is not None:
-            (dat, doc) = self._getDoc(dat, doc, bk, "Prepare to reversify")
-            if doc is not None:
+            def doreversify(doc):
                 srcvrsf = None
                 srcvrs = None
                 if self.printer.ptsettings.versification is not None:
@@ -1076,52 +1246,38 @@ class TexModel:
                         srcvrs = Versification(srcvrsf)
                 logger.debug(f"Reversify [{srcvrsf}] {getattr(reversify[0], 'name', 'unknown')} -> {getattr(srcvrs, 'name', 'unknown') if srcvrs else 'unknown'}")
                 doc.reversify(srcvrs, *reversify)
+            passes.append(("doc", "Prepare to reversify", doreversify))
 
         adjlist = self.printer.get_adjlist(bk)
         if adjlist is not None and len(adjlist):
-            (dat, doc) = self._getDoc(dat, doc, bk)
-            logger.debug("Apply adjlist")
-            if doc is not None:
-                doc.apply_adjlist(bk, adjlist)
+            passes.append(("doc", "Apply adjlist", lambda doc: doc.apply_adjlist(bk, adjlist)))
             # dat = runChanges(self.changes['adjust'], bk, dat, errorfn=self._changeError if bkindex == 0 else None)
 
         if self.localChanges is not None:
-            (dat, doc) = self._getText(dat, doc, bk, logmsg="Unparsing doc to run local changes\n")
             logger.log(5,self.localChanges)
-            dat = runChanges(self.localChanges, bk, dat)
+            passes.append(("text", "Unparsing doc to run local changes\n", changespass(self.localChanges)))
 
-        logger.debug("Applying final changes: ")
         if 'final' in self.changes:
-            (dat, doc) = self._getText(dat, doc, bk, logmsg="Unparsing doc to run user changes (final)\n")
-            dat = runChanges(self.changes['final'], bk, dat, errorfn=self._changeError if bkindex == 0 else None)
-
-        (dat, doc) = self._getText(dat, doc, bk, logmsg="Unparsing doc to output\n")
-        with open(outfpath, "w", encoding="utf-8") as outf:
-            outf.write(dat)
-        if self.dict['project/processscript'] and self.dict['project/when2processscript'] == "after":
-            bn = os.path.basename(self.runConversion(outfpath, outdir))
-        else:
-            bn = os.path.basename(outfpath)
+            passes.append(("text", "Unparsing doc to run user changes (final)\n", changespass(self.changes['final'], errorfn=errorfn)))
+        return passes
 
-        if '-conv' in bn:
-            newname = re.sub(r"(\{}\-conv|\-conv\{}|\-conv)".format(draft, draft), draft, bn)
-            copyfile(os.path.join(outdir, bn), os.path.join(outdir, newname))
-            os.remove(os.path.join(outdir, bn))
-            return newname
-        else:
-            return bn
-            
     def _makeUSFM(self, txt, bk, reason=""):
         syntaxErrors = []
         doc = Usfm.readfile(txt, grammar=self.printer.get_usfms().grammar, informat="usfm")
         doc.xml.canonicalise(version="3.1")
         if doc.xml.errors:      # (msg, pos, ref)
-            dlgtitle = _("PTXprint [{}] - USFM Text Error!").format(self.VersionStr)
             errors = "\n".join([f"{msg} at line {pos.l} char {pos.c} in {ref}" for msg, pos, ref in doc.xml.errors])
             secondary = errors + "\n\n" + _("These errors were triggered while internally parsing the USFM") + ((_(" for ")+reason) if reason else ".")
-            self.printer.doError(_("Parsing errors: "), secondary=secondary, title=dlgtitle, show=not self.printer.get("c_quickRun"))
+            self.parseErrors.append(secondary)
+            self._showParseErrors(secondary)
         return doc  
 
+    def _showParseErrors(self, secondary):
+        """ Shows the errors from parsing a book, whether just now or when its conversion
+            was cached """
+        dlgtitle = _("PTXprint [{}] - USFM Text Error!").format(self.VersionStr)
+        self.printer.doError(_("Parsing errors: "), secondary=secondary, title=dlgtitle, show=not self.printer.get("c_quickRun"))
+
     def makelocalChanges(self, printer, bk, chaprange=None):
         self.localChanges = []
         script = self.dict["document/script"]
@@ -1,9 +1,8 @@
 #!/usr/bin/python3
 import re, os
 from struct import pack, unpack
-import pickle, bz2, copy
 from ptxprint.unicode.ucd import normal_ucd
-from ptxprint.utils import pycodedir
+from ptxprint.utils import pycodedir, cachedData
 
 NONIGNORE = 0
 BLANK = 1
@@ -13,10 +12,61 @@ SHIFTTRIM = 3
 zeroce = b"\00"*10
 
 
+_cereg = re.compile(r"\[([.*])([0-9a-fA-F]{4})\.([0-9a-fA-F]{4})\.([0-9a-fA-F]{4})\]\s*")
+
+def _readallkeys(inf):
+    """ Parses allkeys.txt into a dict of collation elements and the special values
+        that are calculated from it. """
+    res = {}
+    specials = {'last primary ignorable': (0, 0, 0),
+                'last variable': (0, 0, 0),
+                'first regular': (0xFFFF, 0, 0),
+                'last regular': (0, 0, 0)}
+    for l in inf.readlines():
+        line = l.split("#", 1)[0].rstrip()
+        if not line or line.startswith("@version"):
+            continue
+        if line.startswith("@implicitweights "):
+            chrange, base = line[17:].split(";")
+            start, end = chrange.split("..")
+            basev = pack(">H", int(base, 16))
+            starti = int(start, 16)
+            for i in range(starti, int(end, 16)+1):
+                key = chr(i)
+                res[key] = basev + b"\00\00\00\00" + pack(">H", i - starti + 0x8000) + b"\00\00\00\00"
+            continue
+        k, v = line.split(";", 1)
+        key = "".join(chr(int(x, 16)) for x in k.rstrip().split())
+        vals = []
+        vs = _cereg.findall(v.lstrip())
+        for vm in vs:
+            vals.append(b"".join(pack(">H", int(x, 16)) for x in vm[1:]))
+        res[key] = (b"".join(vals), vs[0][0] == '*')
+        ce = tuple(int(x, 16) for x in vs[0][1:])
+        if vs[0][0] == "*" and ce > specials['last variable']:
+            specials['last variable'] = ce
+        if vs[0][0] == "." and ce < specials['first regular']:
+            specials['first regular'] = ce
+        if ce[0] < 0xFFF0 and ce > specials['last regular']:
+            specials['last regular'] = ce
+        if ce[0] == 0 and ce[1] > specials['last primary ignorable'][1]:
+            specials['last primary ignorable'] = (0, ce[1], 0)
+    return (res, specials)
+
+
 class DUCET(dict):
-    def __init__(self, localfile=None, basedict=None):
+    """ A collation table. The table read from allkeys.txt is cached (see cachedData).
+        A tailored table holds only its own entries and falls back to its base. """
+
+    def __init__(self, localfile=None, basedict=None, base=None):
         if basedict is not None:
             super().__init__(basedict)
+        self.base = base
+        if base is not None:
+            self.implicits = base.implicits
+            self.specials = dict(base.specials)
+            self.parameters = dict(base.parameters)
+            return
         if localfile is None:
             localfile = os.path.join(pycodedir(), "unicode", "allkeys.txt")
         self.implicits = []
@@ -49,40 +99,18 @@ class DUCET(dict):
                           }
         if basedict is not None:
             return
-        with open(localfile) as inf:
-            for l in inf.readlines():
-                line = l.split("#", 1)[0].rstrip()
-                if not line or line.startswith("@version"):
-                    continue
-                if line.startswith("@implicitweights "):
-                    chrange, base = line[17:].split(";")
-                    start, end = chrange.split("..")
-                    basev = pack(">H", int(base, 16))
-                    starti = int(start, 16)
-                    for i in range(starti, int(end, 16)+1):
-                        key = chr(i)
-                        self[key] = basev + b"\00\00\00\00" + pack(">H", i - starti + 0x8000) + b"\00\00\00\00"
-                    continue
-                k, v = line.split(";", 1)
-                key = "".join(chr(int(x, 16)) for x in k.rstrip().split())
-                vals = []
-                vs = re.findall(r"\[([.*])([0-9a-fA-F]{4})\.([0-9a-fA-F]{4})\.([0-9a-fA-F]{4})\]\s*", v.lstrip())
-                for vm in vs:
-                    vals.append(b"".join(pack(">H", int(x, 16)) for x in vm[1:]))
-                self[key] = (b"".join(vals), vs[0][0] == '*')
-                ce = tuple(int(x, 16) for x in vs[0][1:])
-                if vs[0][0] == "*" and ce > self.specials['last variable']:
-                    self.specials['last variable'] = ce
-                if vs[0][0] == "." and ce < self.specials['first regular']:
-                    self.specials['first regular'] = ce
-                if ce[0] < 0xFFF0 and ce > self.specials['last regular']:
-                    self.specials['last regular'] = ce
-                if ce[0] == 0 and ce[1] > self.specials['last primary ignorable'][1]:
-                    self.specials['last primary ignorable'] = (0, ce[1], 0)
-                     
+        (entries, specials) = cachedData(localfile, _readallkeys)
+        self.update(entries)
+        self.specials.update(specials)
+
+    def __contains__(self, k):
+        return super().__contains__(k) or (self.base is not None and k in self.base)
+
     def __getitem__(self, k):
-        if k in self:
+        if super().__contains__(k):
             return super().get(k)
+        elif self.base is not None:
+            return self.base[k]
         elif len(k) == 1:
             return pack(">H", (ord(k) >> 15) + 0xFBC0) + b"\00\00\00\00"
         return None
@@ -170,10 +198,18 @@ def _makekey(bits):
                         for j in range(0, maxe, 2))
     return res
 
+_tailorings = {}
+
 def tailored(tailoring, ducet=None):
+    """ Returns ducet (by default the standard table) with the tailoring rules applied
+        as a table of changes over it. The same tailoring of the same table is only
+        worked out once. """
     if ducet is None:
         ducet = _get_local_ducet()
-    res = copy.copy(ducet)
+    k = (tailoring, id(ducet))
+    if k in _tailorings and _tailorings[k].base is ducet:
+        return _tailorings[k]
+    res = DUCET(base=ducet)
     expressions = tailoring.split('&')
     for exp in expressions:
         e = exp.strip()
@@ -209,6 +245,7 @@ def tailored(tailoring, ducet=None):
                 continue
             base = base[end:].strip()
             (newkey, exp) = base.split("/",1) if "/" in base else (base, "")
+            newkey = normal_ucd(newkey, "NFD")     # sortkey() looks up NFD text
             if lastbase is not None:
                 basebits = _splitkey(lastbase)[:3]
                 if lastcmp == 4:
@@ -240,6 +277,7 @@ def tailored(tailoring, ducet=None):
             else:
                 lastbase = res.sortkey(newkey)
             lastcmp = nextcmp
+    _tailorings[k] = res
     return res
 
 local_ducet = None
@@ -22,7 +22,8 @@ the object interface:
 import array, pickle
 import xml.etree.ElementTree as et
 import os, bz2, zipfile
-from ptxprint.utils import pycodedir
+import numpy as np
+from ptxprint.utils import pycodedir, appdirs, DataVersion
 
 __all__ = ['get_ucd']
 # Unicode data xml attributes
@@ -41,6 +42,8 @@ _fields = ['_b0', 'age', 'na', 'JSN', 'gc', 'ccc', 'dt', 'dm', 'nt', 'nv',
            'scf', 'cf', 'jt', 'jg', 'ea', 'lb', 'sc', 'scx', 'NFKC_CF', 'FC_NFKC', 'InSC',
            'InPC', 'vo', 'blk', 'NFC_QC', 'NFD_QC', 'NFKC_QC', 'NFKD_QC']
 _fieldmap = dict((x, i) for i, x in enumerate(_fields))
+_strfields = _cpfields | {'na'}
+_blockbits = 7
 
 SBase = 0xAC00
 LBase = 0x1100
@@ -49,10 +52,10 @@ TBase = 0x11A7
 LCount = 19
 VCount = 21
 TCount = 28
-NCount = 581 # VCount * TCount
-SCount = 11039 # NCount * LCount
+NCount = 588 # VCount * TCount
+SCount = 11172 # NCount * LCount
 LBaseEnd = 0x1113
-SBaseEnd = 0xD71F
+SBaseEnd = 0xD7A4
 TBaseEnd = 0x11C3
 
 class _Codepoint(tuple):
@@ -265,52 +268,49 @@ class UCD(list):
                 flat.insert(j, flat.pop(i))
         return "".join(flat)
 
-    def _combjamo(self, curr):
-        l = ord(curr[0]) - LBase
-        v = ord(curr[1]) - VBase
-        if len(curr) > 2:
-            t = ord(curr[2]) - TBase
-        else:
-            t = 0
-        code = SBase + (l * VCount + v) * TCount + t
-        return chr(code)
+    def _primaries(self):
+        """ {pair: composite} for each canonical decomposition into two characters whose
+            composite is not excluded from composition """
+        if getattr(self, 'primaries', None) is None:
+            self.primaries = {k: v for k, v in self.comps.items()
+                                if len(k) == 2 and not self.get(ord(v), "Comp_Ex")}
+        return self.primaries
+
+    @staticmethod
+    def _compose(a, b, primaries):
+        """ Returns the composite of a followed by b, or None """
+        (oa, ob) = (ord(a), ord(b))
+        if LBase <= oa < LBaseEnd and VBase <= ob < VBase + VCount:
+            return chr(SBase + ((oa - LBase) * VCount + ob - VBase) * TCount)
+        elif SBase <= oa < SBaseEnd and (oa - SBase) % TCount == 0 and TBase < ob < TBaseEnd:
+            return chr(oa + ob - TBase)
+        return primaries.get(a + b, None)
+
+    def _ccc(self, c):
+        try:
+            return int(self.get(ord(c), "ccc"))
+        except KeyError:
+            return 0
 
     def nfc(self, txt, compat=False):
+        """ Canonical composition of the NFD (or NFKD) of txt. Each character is
+            composed with the last starter, unless something between them blocks it. """
         flat = self.nfd(txt, compat=compat)
-        comps = self.komps if compat else self.comps
-        stack = []
-        curr = ""
+        primaries = self._primaries()
         res = []
-        injamo = False
+        starter = None
+        lastccc = 256
         for c in flat:
-            if injamo and LBaseEnd <= ord(c) < TBaseEnd:
-                curr += c
-                continue
-            elif LBase <= ord(c) < LBaseEnd:
-                if injamo:
-                    res.append(self._combjamo(curr))
-                    curr = ""
-                else:
-                    res.append(curr + "".join(stack))
-                stack.clear()
-                curr = c
-                injamo = True
-                continue
-            elif injamo:
-                res.append(self._combjamo(curr))
-                injamo = False
-                curr = ""
-                # fall through
-
-            if curr + c in comps:
-                curr = comps[curr+c]
-            elif int(self.get(ord(c), 'ccc')) > 0:
-                stack.append(c)
-            else:
-                res.append(curr + "".join(stack))
-                stack.clear()
-                curr = c
-        res.append(curr + "".join(stack))
+            cc = self._ccc(c)
+            if starter is not None and (lastccc < cc or lastccc == 0):
+                comp = self._compose(res[starter], c, primaries)
+                if comp is not None:
+                    res[starter] = comp
+                    continue
+            if cc == 0:
+                starter = len(res)
+            lastccc = cc
+            res.append(c)
         return "".join(res)
 
     def normalize(self, txt, form="NFC"):
@@ -328,23 +328,272 @@ class UCD(list):
         return txt
         
 
+def _codes(txt):
+    return np.frombuffer(txt.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+class UCDTables:
+    """ The same data as UCD, but held as a two stage table per property (strings
+        as a dict per property). Each property is only loaded when it is first used.
+        The tables are built from the full UCD the first time they are needed and
+        kept in the user cache directory, from where they are memory mapped. Lookups
+        can be made for a whole string at once. """
+
+    def __init__(self, cachedir=None):
+        if cachedir is None:
+            cachedir = os.path.join(appdirs.user_cache_dir("ptxprint", "SIL"), "ucd_{}".format(DataVersion))
+        self.cachedir = cachedir
+        self.tables = {}
+        self.lists = {}
+        self.strings = {}
+        self.meta = None
+        self.cccs = None
+        self.primaries = None
+
+    def _full(self):
+        return _Singleton()(UCD)
+
+    def _load(self, fname, loadfn, makefn, savefn):
+        fpath = os.path.join(self.cachedir, fname)
+        try:
+            return loadfn(fpath)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            pass
+        res = makefn()
+        try:
+            os.makedirs(self.cachedir, exist_ok=True)
+            tmppath = "{}.{}.tmp".format(fpath, os.getpid())
+            with open(tmppath, "wb") as outf:
+                savefn(outf, res)
+            os.replace(tmppath, fpath)
+        except OSError:
+            pass
+        return res
+
+    def _loadpickle(self, fname, makefn):
+        def loadfn(fpath):
+            with open(fpath, "rb") as inf:
+                return pickle.load(inf)
+        return self._load(fname, loadfn, makefn, lambda outf, res: pickle.dump(res, outf))
+
+    def _getmeta(self):
+        if self.meta is None:
+            def makefn():
+                full = self._full()
+                return (full.enums, full.comps, full.komps)
+            self.meta = self._loadpickle("meta.pickle", makefn)
+        return self.meta
+
+    @property
+    def enums(self):
+        return self._getmeta()[0]
+
+    @property
+    def comps(self):
+        return self._getmeta()[1]
+
+    @property
+    def komps(self):
+        return self._getmeta()[2]
+
+    def _table(self, key):
+        """ Returns the two stage table for a non string property. The first stage is
+            the offset of the block of 128 values for each block of codepoints, so the
+            value for cp is t[t[cp >> 7] + (cp & 127)]. Undefined codepoints have -1. """
+        res = self.tables.get(key, None)
+        if res is None:
+            res = self._load(key + ".npy", lambda fpath: np.load(fpath, mmap_mode="r"),
+                             lambda: self._maketable(key), np.save)
+            self.tables[key] = res
+        return res
+
+    def _maketable(self, key):
+        i = _fieldmap[key]
+        full = self._full()
+        undef = 0 if key == "_b0" else -1
+        dtype = np.int64 if key == "_b0" else np.int32
+        vals = np.full(0x110000, undef, dtype=dtype)
+        vals[:len(full)] = [undef if x is None else tuple.__getitem__(x, i) for x in full]
+        (blocks, index) = np.unique(vals.reshape(-1, 128), axis=0, return_inverse=True)
+        return np.concatenate((index.reshape(-1).astype(dtype) * 128 + (0x110000 >> 7), blocks.reshape(-1)))
+
+    def _list(self, key):
+        """ The table for key as a list, which is quicker to index one codepoint at a time """
+        res = self.lists.get(key, None)
+        if res is None:
+            self.lists[key] = res = self._table(key).tolist()
+        return res
+
+    def _strings(self, key):
+        res = self.strings.get(key, None)
+        if res is None:
+            i = _fieldmap[key]
+            def makefn():
+                return {cp: tuple.__getitem__(x, i) for cp, x in enumerate(self._full())
+                            if x is not None and tuple.__getitem__(x, i)}
+            self.strings[key] = res = self._loadpickle(key + ".pickle", makefn)
+        return res
+
+    def _value(self, cp, key):
+        t = self._list(key)
+        return t[t[cp >> 7] + (cp & 127)]
+
+    def _values(self, cps, key):
+        t = self._table(key)
+        return t[t[cps >> 7] + (cps & 127)]
+
+    def values(self, txt, key):
+        """ Returns an array of the raw (enum) values of key for each character in txt """
+        return self._values(_codes(txt), key)
+
+    def strvalues(self, txt, key):
+        """ Returns a list of the values of key for each character in txt, with ""
+            for undefined codepoints """
+        m = self.enums.get(key, None)
+        if m is None:
+            return [x if x >= 0 else "" for x in self.values(txt, key).tolist()]
+        return [m[x] if x >= 0 else "" for x in self.values(txt, key).tolist()]
+
+    def defined(self, cp):
+        return self._value(cp, "gc") >= 0
+
+    def get(self, cp, key, noenum=False):
+        """ Looks up a codepoint and returns the value for a given key. This
+            includes mapping enums back to their strings"""
+        if key in _binmap:
+            if not self.defined(cp):
+                raise KeyError("Undefined codepoint {:04X}".format(cp))
+            return True if (self._value(cp, "_b0") >> _binmap[key]) & 1 else False
+        elif key in _strfields:
+            if not self.defined(cp):
+                raise KeyError("Undefined codepoint {:04X}".format(cp))
+            v = self._strings(key).get(cp, "")
+            return v.replace("#", "{:04X}".format(cp)) if key == "na" else v
+        elif key not in _fieldmap or key == "_b0":
+            raise KeyError("Unknown key: {}".format(key))
+        v = self._value(cp, key)
+        if v < 0:
+            raise KeyError("Undefined codepoint {:04X}".format(cp))
+        return v if noenum else self.enumstr(key, v)
+
+    def findall(self, key, val):
+        """ Returns a list of all the codepoints whose key value is value """
+        if key in _strfields:
+            return sorted(cp for cp, v in self._strings(key).items() if v == val)
+        elif key in _binmap:
+            allcps = np.arange(0x110000)
+            vals = (self._values(allcps, "_b0") >> _binmap[key]) & 1
+            return np.flatnonzero((vals == (1 if val else 0)) & (self._values(allcps, "gc") >= 0)).tolist()
+        if key in self.enums:
+            try:
+                val = self.enums[key].index(val)
+            except ValueError:
+                return []
+        return np.flatnonzero(self._values(np.arange(0x110000), key) == val).tolist()
+
+    def enumstr(self, key, v):
+        """ Returns the string for an enum value given enum name and value """
+        if key in self.enums:
+            m = self.enums[key]
+            return m[v] if v < len(m) else v
+        return v
+
+    def _cccs(self):
+        if self.cccs is None:
+            self.cccs = [int(x) for x in self.enums['ccc']] + [0]     # undefined (-1) gives the final 0
+        return self.cccs
+
+    def isnormalized(self, txt, normtype):
+        # Treat MAYBE as NO
+        if not len(txt):
+            return True
+        qck = normtype+'_QC'
+        qcs = self._list(qck)
+        yes = self.enums[qck].index('Y')
+        if any(qcs[qcs[c >> 7] + (c & 127)] != yes for c in map(ord, txt)):
+            return False
+        cccs = self._cccs()
+        t = self._list("ccc")
+        lastccc = 0
+        for c in map(ord, txt):
+            nextccc = cccs[t[t[c >> 7] + (c & 127)]]
+            if nextccc < lastccc and nextccc != 0:
+                return False
+            lastccc = nextccc
+        return True
+
+    def nfd(self, txt, compat=False):
+        dts = self._list("dt")
+        dtnone = self.enums["dt"].index("none")
+        dtcan = self.enums["dt"].index("can")
+        dms = None
+        def expandcode(c):
+            o = ord(c)
+            if SBase <= o < SBaseEnd:
+                i = o - SBase
+                l = LBase + (i // NCount)
+                v = VBase + (i % NCount) // TCount
+                t = TBase + i % TCount
+                return chr(l) + chr(v) + (chr(t) if t > TBase else "")
+            dt = dts[dts[o >> 7] + (o & 127)]
+            if dt == dtcan or (compat and dt > dtnone):
+                dm = dms.get(o, "")
+                if dm != "" and dm != c:
+                    return "".join(expandcode(x) for x in dm)
+            return c
+        flat = []
+        for c in txt:
+            o = ord(c)
+            dt = dts[dts[o >> 7] + (o & 127)]
+            if dt == dtcan or (compat and dt > dtnone) or SBase <= o < SBaseEnd:
+                if dms is None:
+                    dms = self._strings("dm")
+                flat.extend(expandcode(c))
+            else:
+                flat.append(c)
+
+        # sort by ccc order
+        cccs = self._cccs()
+        t = self._list("ccc")
+        ccs = [cccs[t[t[o >> 7] + (o & 127)]] for o in map(ord, flat)]
+        for i in range(1, len(flat)):
+            if ccs[i] < ccs[i-1] and ccs[i] > 0:
+                j = i - 1
+                while j > 0 and ccs[i] < ccs[j-1]:
+                    j -= 1
+                ccs.insert(j, ccs.pop(i))
+                flat.insert(j, flat.pop(i))
+        return "".join(flat)
+
+    def _ccc(self, c):
+        o = ord(c)
+        t = self._list("ccc")
+        return self._cccs()[t[t[o >> 7] + (o & 127)]]
+
+    _primaries = UCD._primaries
+    _compose = staticmethod(UCD._compose)
+    nfc = UCD.nfc
+    normalize = UCD.normalize
+
 local_ucd = None
 def _getucd():
-    return _Singleton()(UCD)
+    return _Singleton()(UCDTables)
 
 def get_ucd(cp, key):
-    lcd = _Singleton()(UCD)
+    lcd = _Singleton()(UCDTables)
     try:
         return lcd.get(cp, key)
     except KeyError:
         return ""
 
 def find_ucd(key, val):
-    lcd = _Singleton()(UCD)
+    lcd = _Singleton()(UCDTables)
     return lcd.findall(key, val)
 
+def strvalues_ucd(txt, key):
+    return _Singleton()(UCDTables).strvalues(txt, key)
+
 def normal_ucd(txt, mode="NFC"):
-    return _Singleton()(UCD).normalize(txt, mode)
+    return _Singleton()(UCDTables).normalize(txt, mode)
 
 if __name__ == '__main__':
     import sys, pickle
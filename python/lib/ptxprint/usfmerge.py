@@ -7,6 +7,8 @@ from usfmtc.usfmparser import Grammar
 import argparse, difflib, sys
 from enum import Enum,Flag
 from itertools import groupby
+from collections import Counter
+from bisect import bisect_left
 from functools import reduce
 import configparser
 import logging
@@ -21,7 +23,16 @@ class MergeF(Flag):
 
 settings= MergeF.NoSplitNB | MergeF.HeadWithChapter 
 logger = logging.getLogger(__name__)
-debugPrint = False
+
+class MergeState:
+    """ The flags and debug setting for one merge. Each call to usfmerge2 has its own, so
+        merges can run side by side. The module level settings are the defaults. """
+    def __init__(self, flags=None, debug=False):
+        self.settings = settings if flags is None else flags
+        self.debug = debug
+
+def debstr(s):
+    return s
 
 class ChunkType(Enum):
     DEFSCORE = 0        # Value for default scores
@@ -244,7 +255,8 @@ class Collector:
             all ChunkTypes if a single value is supplied), then the default score is applied
             according to the rule-set chosen from synchronise
     """
-    def __init__(self, doc=None, primary=True, fsecondary=False, stylesheet=None, colkey=None, scores=None, synchronise=None, protect={}):
+    def __init__(self, doc=None, primary=True, fsecondary=False, stylesheet=None, colkey=None, scores=None, synchronise=None, protect={}, state=None):
+        self.state = state if state is not None else MergeState()
         self.acc = []
         self.loc = {} # Locations to turn position into offset into acc[] array 
         self.lastloc = None # Locations to turn position into offset into acc[] array 
@@ -334,7 +346,7 @@ class Collector:
                   globalcl = True
                 else:
                   if self.waschap:
-                      mode = ChunkType.CHAPTERHEAD if not MergeF.CLwithChapter in settings else ChunkType.CHAPTER
+                      mode = ChunkType.CHAPTERHEAD if not MergeF.CLwithChapter in self.state.settings else ChunkType.CHAPTER
                   else:
                     mode = ChunkType.HEADING
                 logger.log(8, f'cl found for {self.chapter} mode:{mode}')
@@ -448,7 +460,7 @@ class Collector:
                 self.end = e
                 self.counts = {}
                 self.currChunk.hasVerse = True
-                if MergeF.ChunkOnVerses in settings:
+                if MergeF.ChunkOnVerses in self.state.settings:
                     logger.log(7, f"newchunk because ChunkOnVerses")
                     newchunk = True
                 else:
@@ -457,7 +469,7 @@ class Collector:
             if newchunk:
                 self.oldmode = self.mode
                 currChunk = self.makeChunk(c)
-                if MergeF.ChunkOnVerses in settings:
+                if MergeF.ChunkOnVerses in self.state.settings:
                     if c.tag == "verse":
                         currChunk.hasVerse = True # By definition!
                         self.currChunk.label(self.chapter, self.verse, self.end, 0,'')
@@ -534,7 +546,7 @@ class Collector:
         for i in range(1, len(self.acc) - 1):
             if self.acc[i].type is ChunkType.NB:
                 self.acc[i-1].type = ChunkType.NBCHAPTER
-                if MergeF.NoSplitNB in settings:
+                if MergeF.NoSplitNB in self.state.settings:
                     self.acc[i-1].extend(self.acc[i])
                     self.acc[i].deleteme = True
                     #print("NB met",self.acc[i-2].type ,self.acc[i-1].type ,self.acc[i].type )
@@ -606,20 +618,20 @@ class Collector:
         for i in range(1, len(self.acc)):
           #logger.debug(debstr(self.acc[i].type));
           if  self.acc[i].type == ChunkType.CHAPTER and self.acc[i-1].type == ChunkType.HEADING:
-              if not MergeF.SwapChapterHead in settings:
+              if not MergeF.SwapChapterHead in self.state.settings:
                 self.acc[i-1].type = ChunkType.CHAPTERHEAD
                 self.acc[i].extend(self.acc[i-1])
                 self.acc[i-1].deleteme = True
                 logger.debug(f"Merged.7: {'deleteme' in self.acc[i]}, {self.acc[i]}")
           elif self.acc[i-1].type == ChunkType.CHAPTER and self.acc[i].type == ChunkType.CHAPTERHEAD:
-              if MergeF.SwapChapterHead in settings:
+              if MergeF.SwapChapterHead in self.state.settings:
                 logger.debug("SwapChapterHead");
                 tmp=self.acc[i-1]
                 self.acc[i-1] = self.acc[i]
                 self.acc[i] = tmp
                 logger.debug(f"Merged.7b: {'deleteme' in self.acc[i]}, {self.acc[i]}")
               else:
-                if MergeF.HeadWithChapter in settings:
+                if MergeF.HeadWithChapter in self.state.settings:
                     self.acc[i-1].extend(self.acc[i])
                     self.acc[i].deleteme = True
                     logger.debug(f"SwapMerged.7c: {'deleteme' in self.acc[i-1]}, {self.acc[i-1]=}")
@@ -629,7 +641,7 @@ class Collector:
                 if self.acc[i-1].type == ChunkType.CHAPTER and not self.acc[i].hasVerse:
                     self.acc[i-1].extend(self.acc[i])
                     self.acc[i].deleteme = True
-                    if debugPrint:
+                    if self.state.debug:
                         logger.debug(f"Merged.8: {deleteme in self.acc[i-1]}, {self.acc[i-1]}")
         logger.debug("Chunks before reordering: {}".format(len(self.acc)))
         self.acc = [x for x in self.acc if not getattr(x, 'deleteme', False)]
@@ -644,7 +656,6 @@ class Collector:
         """Calculate the scores for each chunk, returning an array of non-zero scores (potential break points)
         If the results parameter is given, then the return value is a summation
         """
-        global debugPrint
         logger.debug("SCORES")
         for i in range(0, len(self.acc)):
             t=self.acc[i].type.value
@@ -657,10 +668,10 @@ class Collector:
             self.loc[pos] = i
             if pos in results:
                 results[pos] += scval
-                logger.debug("%s(%s)  + %d = %d" % (pos,self.acc[i][0].get('style', ''), scval, results[pos]))
+                logger.debug("%s(%s)  + %d = %d", pos, self.acc[i][0].get('style', ''), scval, results[pos])
             else:
                 results[pos] = scval
-                logger.debug(f"{pos}({self.acc[i][0].get('style', '')}) = {scval}")
+                logger.debug("%s(%s) = %d", pos, self.acc[i][0].get('style', ''), scval)
         return results
 
     def getofs(self,pos, incremental=True):
@@ -725,6 +736,135 @@ def appendpairs(pairs, pchunks, schunks):
         sc = None
     pairs.append([pc, sc])
 
+def _increasing(pairs):
+    """ Returns the longest subsequence of pairs, which are in increasing order of their
+        first element, whose second elements are also increasing. """
+    tails = []
+    tailidx = []
+    prev = [None] * len(pairs)
+    for i, (a, b) in enumerate(pairs):
+        j = bisect_left(tails, b)
+        if j == len(tails):
+            tails.append(b)
+            tailidx.append(i)
+        else:
+            tails[j] = b
+            tailidx[j] = i
+        prev[i] = tailidx[j-1] if j > 0 else None
+    res = []
+    i = tailidx[-1] if len(tailidx) else None
+    while i is not None:
+        res.append(pairs[i])
+        i = prev[i]
+    return res[::-1]
+
+def keyOpcodes(akeys, bkeys):
+    """ Returns the same opcodes as difflib.SequenceMatcher(None, akeys, bkeys).get_opcodes().
+        SequenceMatcher repeatedly takes the longest matching block in what is left, which
+        means searching the whole stretch each time. Chunk keys run in chapter and verse
+        order, so the keys found just once on each side and in order (anchors) say where
+        most blocks are: a block holding an anchor is that anchor's run grown over the equal
+        keys either side. When such a block is longer than any stretch of keys without an
+        anchor, it must be the one SequenceMatcher would find, and no search is needed.
+        Otherwise SequenceMatcher searches that stretch itself. """
+    matcher = difflib.SequenceMatcher(None, akeys, bkeys)
+    # SequenceMatcher cannot start a match on a key that is popular in bkeys
+    seeds = set(bkeys) - matcher.bpopular
+    acount = Counter(akeys)
+    bcount = Counter(bkeys)
+    bpos = {k: i for i, k in enumerate(bkeys) if bcount[k] == 1}
+    anchors = _increasing([(i, bpos[k]) for i, k in enumerate(akeys) if acount[k] == 1 and k in bpos])
+    runs = []           # runs of anchors on one diagonal, as [start in a, start in b, length]
+    for (a, b) in anchors:
+        if len(runs) and runs[-1][0] + runs[-1][2] == a and runs[-1][1] + runs[-1][2] == b:
+            runs[-1][2] += 1
+        else:
+            runs.append([a, b, 1])
+    runstarts = [r[0] for r in runs]
+    # stretches of keys that might start a match without an anchor in it
+    isanchor = set(a for a, b in anchors)
+    free = []
+    for i, k in enumerate(akeys):
+        if i in isanchor or k not in seeds:
+            continue
+        if len(free) and free[-1][1] == i:
+            free[-1][1] = i + 1
+        else:
+            free.append([i, i + 1])
+    freestarts = [f[0] for f in free]
+
+    def grow(a, b, n, alo, ahi, blo, bhi):
+        """ Returns the block (a, b, n) extended over the equal keys either side, in range """
+        while a > alo and b > blo and akeys[a-1] == bkeys[b-1]:
+            (a, b, n) = (a-1, b-1, n+1)
+        while a + n < ahi and b + n < bhi and akeys[a+n] == bkeys[b+n]:
+            n += 1
+        return (a, b, n)
+
+    def seed(a, b, n):
+        """ Returns how SequenceMatcher ranks a block: the longest run in it with no
+            popular keys, and then where that run starts, earliest first """
+        best = (0, 0, 0)
+        i = a
+        while i < a + n:
+            j = i
+            while j < a + n and akeys[j] in seeds:
+                j += 1
+            if j - i > best[0]:
+                best = (j - i, -i, -(i + b - a))
+            i = j + 1
+        return best
+
+    grown = [grow(a, b, n, 0, len(akeys), 0, len(bkeys)) for (a, b, n) in runs]
+    ranks = [seed(*g) for g in grown]
+    matches = []
+    queue = [(0, len(akeys), 0, len(bkeys))]
+    while len(queue):
+        (alo, ahi, blo, bhi) = queue.pop()
+        best = None
+        for r in range(bisect_left(runstarts, alo), bisect_left(runstarts, ahi)):
+            (a, b, n) = runs[r]
+            if a + n > ahi or b < blo or b + n > bhi:
+                continue
+            (ga, gb, gn) = g = grown[r]
+            if ga < alo or gb < blo or ga + gn > ahi or gb + gn > bhi:
+                g = grow(a, b, n, alo, ahi, blo, bhi)
+                rank = seed(*g)
+            else:
+                rank = ranks[r]
+            if best is None or rank > best[0]:
+                best = (rank, g)
+        longest = 0
+        for f in range(max(0, bisect_left(freestarts, alo) - 1), bisect_left(freestarts, ahi)):
+            longest = max(longest, min(free[f][1], ahi) - max(free[f][0], alo))
+        if best is not None and best[0][0] > longest:
+            (i, j, k) = x = best[1]
+        else:
+            (i, j, k) = x = matcher.find_longest_match(alo, ahi, blo, bhi)
+        if k:
+            matches.append(x)
+            if alo < i and blo < j:
+                queue.append((alo, i, blo, j))
+            if i+k < ahi and j+k < bhi:
+                queue.append((i+k, ahi, j+k, bhi))
+    matches.sort()
+    res = []
+    ai = bi = 0
+    for (a, b, n) in matches + [(len(akeys), len(bkeys), 0)]:
+        if ai < a and bi < b:
+            res.append(("replace", ai, a, bi, b))
+        elif ai < a:
+            res.append(("delete", ai, a, bi, b))
+        elif bi < b:
+            res.append(("insert", ai, a, bi, b))
+        if n:
+            if len(res) and res[-1][0] == "equal":
+                res[-1] = ("equal", res[-1][1], a+n, res[-1][3], b+n)
+            else:
+                res.append(("equal", a, a+n, b, b+n))
+        ai, bi = a+n, b+n
+    return res
+
 def alignChunks(primary, secondary):
     pchunks, pkeys = primary
     schunks, skeys = secondary
@@ -736,10 +876,10 @@ def alignChunks(primary, secondary):
     logger.debug(f"alignChunks: {len(pchunks)}, {len(schunks)}")
     logger.log(7, "Primary:" + ", ".join(pkeys));
     logger.log(7, "Secondary:" + ", ".join(skeys));
-    diff = difflib.SequenceMatcher(None, pkeys, skeys)
-    for op in diff.get_opcodes():
+    for op in keyOpcodes(pkeys, skeys):
         (action, ab, ae, bb, be) = op
-        logger.debug(f"{op}, {debstr(pkeys[ab:ae])}, {debstr(skeys[bb:be])}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{op}, {debstr(pkeys[ab:ae])}, {debstr(skeys[bb:be])}")
         if action == "equal":
             pairs.extend([[pchunks[ab+i], schunks[bb+i]] for i in range(ae-ab)])
         elif action == "delete":
@@ -782,30 +922,35 @@ def alignSimple(primary, *others):
     runindices = list(range(numkeys))
     for ochunks, okeys in others:
         runs = [x + [None] for x in runs]
-        diff = difflib.SequenceMatcher(None, pkeys, okeys)
-        for op in diff.get_opcodes():
+        # Deleting the run for key c moves the runs of all the keys from c on down one.
+        # Rather than update runindices each time, count the deletions (which come in key
+        # order) and apply them to runindices once at the end.
+        deleted = [0] * numkeys
+        numdeleted = 0
+        for op in keyOpcodes(pkeys, okeys):
             (action, ab, ae, bb, be) = op
-            logger.log(7,f"{op}, {debstr(pkeys[ab:ae])}, {debstr(okeys[bb:be])}")
+            if logger.isEnabledFor(7):
+                logger.log(7,f"{op}, {debstr(pkeys[ab:ae])}, {debstr(okeys[bb:be])}")
             if action == "equal":
                 for i in range(ae-ab):
-                    ri = runindices[ab+i]
+                    ri = runindices[ab+i] - numdeleted
                     if runs[ri][-1] is None:
                         runs[ri][-1] = [bb+i, bb+i]
                     else:
                         runs[ri][-1][1] = bb+i
             if action in ("delete", "replace"):
-                ai = runindices[ab]
+                ai = runindices[ab] - numdeleted
                 for c in range(ab, ae):
-                    ri = runindices[c]
+                    ri = runindices[c] - numdeleted
                     if ri > ai:
                         for j in len(runs[0]):
                             runs[ai][j][1] = runs[ri][j][1]
-                    for j in range(c, numkeys):
-                        runindices[j] -= 1
+                    deleted[c] += 1
+                    numdeleted += 1
                     runs = runs[:ri] + runs[ri+1:]
             if action in ("insert", "replace"):
                 if (ab<numkeys):
-                  ai = runindices[ab]
+                  ai = runindices[ab] - numdeleted + (ae - ab - 1 if action == "replace" else 0)
                   runs[ai][-1] = [bb, be-1]
                 else: # This might be wrong, but it *seems* to work
                   ai=len(runs)-1
@@ -813,6 +958,10 @@ def alignSimple(primary, *others):
                 #logger.log(7,f"{debstr(runs)}")
                 runs[ai][-1] = [bb, be-1]
                 #logger.log(7,f"{debstr(runs)}")
+        numdeleted = 0
+        for j in range(numkeys):
+            numdeleted += deleted[j]
+            runindices[j] -= numdeleted
     results = []
     for r in runs:
         res = [Chunk(*sum(pchunks[r[0][0]:r[0][1]+1], []), mode=pchunks[r[0][1]].type)]
@@ -822,6 +971,7 @@ def alignSimple(primary, *others):
     return results
 
 def alignScores(*columns):
+    settings = columns[0][0].state.settings
     # get the basic scores.
     merged={}
     for ochunks, okeys in columns:
@@ -904,27 +1054,32 @@ def alignScores(*columns):
         coln[c] = columns[i][0]
         acc[c] = coln[c].acc
     syncpositions.append((999,999,999))
+    # Only build the trace messages if they are wanted, since they turn chunks into text
+    trace = logger.isEnabledFor(7)
     for posn in syncpositions:
         chunks = blank.copy()
-        logger.log(7, f"CHUNK: {posn}, {merged[posn] if posn in merged else '-'}")
+        if trace:
+            logger.log(7, f"CHUNK: {posn}, {merged[posn] if posn in merged else '-'}")
         for c,i in colkeys.items():
             nxt = coln[c].getofs(posn) # Get the next offset.
-            logger.log(7, f"{c=}, {ofs[c]=} ,{posn=}, {nxt=}, {lim[c]=}")
-            if ofs[c] == nxt and nxt < lim[c]:
-                logger.log(7, f"not yet: {nxt} = {acc[c][nxt].position}")
+            if trace:
+                logger.log(7, f"{c=}, {ofs[c]=} ,{posn=}, {nxt=}, {lim[c]=}")
+                if ofs[c] == nxt and nxt < lim[c]:
+                    logger.log(7, f"not yet: {nxt} = {acc[c][nxt].position}")
             if nxt > lim[c]:
                 raise ValueError(f"This shouldn't happen, {nxt} > {lim[c]}!")
             p = merged
             while ofs[c] < lim[c] and ofs[c] < nxt: 
-                thispos = acc[c][ofs[c]].position
-                logger.log(7,f"{ofs[c]}={thispos} {merged[thispos] if thispos in merged else '0'}")  
+                if trace:
+                    thispos = acc[c][ofs[c]].position
+                    logger.log(7,f"{ofs[c]}={thispos} {merged[thispos] if thispos in merged else '0'}")  
                 if chunks[c]:
                     chunks[c].append(acc[c][ofs[c]])
                 else:
                     chunks[c] = [acc[c][ofs[c]]]
                 ofs[c] += 1
             #print()
-            if chunks[c]:
+            if chunks[c] and trace:
                 logger.log(7,"".join(map(str,chunks[c])))
         results.append({c: chunks[c] for c in colkeys})
     return results
@@ -940,11 +1095,12 @@ modes = {
     "scores" : alignScores
 }
 
-def WriteSyncPoints(mergeconfigfile,variety,confname,scores,synchronise):
+def WriteSyncPoints(mergeconfigfile,variety,confname,scores,synchronise,state=None):
+    flags = state.settings if state is not None else settings
     config = {}#configparser.ConfigParser()
     flaga = {}
     for k in MergeF:
-      flaga[k.name] = k in settings
+      flaga[k.name] = k in flags
     config['FLAGS'] = flaga
     config['DEFAULT'] = {k:(scores[k] if k in scores else  0) for k in ChunkType if k != ChunkType.DEFSCORE}
     config['L'] = {'WEIGHT': 51}
@@ -954,7 +1110,9 @@ def WriteSyncPoints(mergeconfigfile,variety,confname,scores,synchronise):
     if confname != "":
         config[confname] = {}
     logger.debug(f"Writing default configuration to {mergeconfigfile}")
-    with open(mergeconfigfile,'w') as configfile:
+    # Other merges may be reading it, so write it under another name and then move it into place
+    tmpfile = "{}.{}.tmp".format(mergeconfigfile, os.getpid())
+    with open(tmpfile,'w') as configfile:
         configfile.write("# Custom merge configuration file.\n")
         configfile.write(f"# This was written because no merge-{synchronise}.cfg file could be found.\n")
         configfile.write(f"# As generated it contains all potential break-points the program expects,\n")
@@ -997,11 +1155,14 @@ def WriteSyncPoints(mergeconfigfile,variety,confname,scores,synchronise):
                 else:
                     configfile.write(f"{k} = {v}\n")
         #config.write(configfile)
+    os.replace(tmpfile, mergeconfigfile)
 
-def ReadSyncPoints(mergeconfigfile,column,variety,confname,fallbackweight=51.0):
+def ReadSyncPoints(mergeconfigfile,column,variety,confname,fallbackweight=51.0,state=None):
     """ Given a specified filepath, column (or None if this is a generic config), custime-variety and config name, find the relevant sycnpoints for a given file.
+        Any [FLAGS] are set in state.
     """
-    global settings
+    if state is None:
+        state = MergeState()
     logger.debug(f"Reading config file {mergeconfigfile} for ({column if column is not None else ''}, {variety}, {confname})")
     config = configparser.ConfigParser()
     config.read(mergeconfigfile)
@@ -1011,9 +1172,9 @@ def ReadSyncPoints(mergeconfigfile,column,variety,confname,fallbackweight=51.0):
           tf = config.getboolean("FLAGS", key.name)
           logger.debug(f"Flag {key} is set to {tf}")
           if tf:
-            settings = settings | key
+            state.settings = state.settings | key
           else:
-            settings = settings & (~key)
+            state.settings = state.settings & (~key)
     if not config.has_section('zzzDEFAULT'):
         config['zzzDEFAULT'] = {} # make it possible to access the DEFAULT values.
     if column is None:
@@ -1048,10 +1209,13 @@ def ReadSyncPoints(mergeconfigfile,column,variety,confname,fallbackweight=51.0):
     logger.debug(f"Did not find expected custom merge section(s) ' {keys} '. Resorting {synchronise}.")
     return(SyncPoints[{synchronise}])
     
-def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode="doc", debug=False, scorearr={}, synchronise="normal", protect={}, configarr=None, changes=[], book=None):
-    global debugPrint, debstr,settings
+def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode="doc", debug=False, scorearr={}, synchronise="normal", protect={}, configarr=None, changes=[], book=None, docs=None):
+    """ Merges the USFM files in infilearr, one per column key in keyarr, into outfile.
+        docs, if given, holds an already parsed Usfm (or None) for each file, which is then
+        used rather than reading the file. The file names are still used to find any merge
+        configuration files. """
+    state = MergeState(debug=debug)
     if debug:
-      debugPrint = True
       logger.debug("Writing debug files")
     else:
       logger.debug("Not Writing debug files")
@@ -1113,19 +1277,17 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
         #   res = 'versetext'
         return res
 
-    debstr = lambda s: s
-
     def myGroupChunks(*a, **kw):
         return groupChunks(*a, texttype, **kw)
     chunks={}
     chunklocs={}
     colls={}
     if (mode == "scores") or ("verse"  in syncarr) or ("chapter" in syncarr) : #Score-based splitting may force the break-up of an NB, the others certainly will.
-        settings =  settings & (~MergeF.NoSplitNB)
+        state.settings =  state.settings & (~MergeF.NoSplitNB)
     if (mode in ("scores") or ("verse"  in syncarr)):
-        settings = settings | MergeF.ChunkOnVerses
+        state.settings = state.settings | MergeF.ChunkOnVerses
     if (mode == "scores"):
-        settings = settings & (~MergeF.HeadWithChapter) #  scores needs them initially separated
+        state.settings = state.settings & (~MergeF.HeadWithChapter) #  scores needs them initially separated
         priconfname = None
         priptpath = None
         priconfpath = None
@@ -1166,24 +1328,28 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
                     (confpath,useLR)=searchpair
                     logger.debug(f"Checking if {colkey} config file {confpath} exists")
                     if (os.path.exists(confpath)):
-                        scorearr[colkey]=ReadSyncPoints(confpath,(colkey if useLR else None),variety,confname)
+                        scorearr[colkey]=ReadSyncPoints(confpath,(colkey if useLR else None),variety,confname,state=state)
                         logger.debug(f"found {confpath}!")
                         done=1
                         break
                 if (not done):
                     logger.debug(f"Did not find expected custom merge file. Resorting to normal.")
                     if os.path.exists(priconfpath):
-                        WriteSyncPoints(os.path.join(priconfpath,cfile),variety,confname,SyncPoints[synchronise],synchronise)
+                        WriteSyncPoints(os.path.join(priconfpath,cfile),variety,confname,SyncPoints[synchronise],synchronise,state=state)
                     else:
-                        WriteSyncPoints(os.path.join(prifilepath,cfile),variety,confname,SyncPoints[synchronise],synchronise)
+                        WriteSyncPoints(os.path.join(prifilepath,cfile),variety,confname,SyncPoints[synchronise],synchronise,state=state)
 
-    for colkey,infile in zip(keyarr,infilearr):
-        logger.debug(f"Reading {colkey}: {infile}")
-        with open(infile, encoding="utf-8") as inf:
-            if (colkey not in sheets):
-              sheets[colkey]=[]
+    if docs is None:
+        docs = [None] * len(infilearr)
+    for colkey,infile,doc in zip(keyarr,infilearr,docs):
+        if (colkey not in sheets):
+          sheets[colkey]=[]
+        if doc is None:
+            logger.debug(f"Reading {colkey}: {infile}")
             doc = Usfm.readfile(infile, sheet=sheets[colkey])
-            colls[colkey] = Collector(doc=doc, colkey=colkey, primary=(colkey=='L'), fsecondary=fsecondary, stylesheet=sheets[colkey], scores=scorearr[colkey],synchronise=syncarr[colkey],protect=protect)
+        else:
+            logger.debug(f"Using the converted {colkey}: {infile}")
+        colls[colkey] = Collector(doc=doc, colkey=colkey, primary=(colkey=='L'), fsecondary=fsecondary, stylesheet=sheets[colkey], scores=scorearr[colkey],synchronise=syncarr[colkey],protect=protect,state=state)
         chunks[colkey] = {c.ident: c for c in colls[colkey].acc}
         chunklocs[colkey] = ["_".join(str(x) for x in c.ident) for c in colls[colkey].acc]
 
@@ -1191,7 +1357,7 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
     pairs = f(*((colls[k], chunklocs[k]) for k in keyarr))
 
     debugf={}
-    if debugPrint:
+    if state.debug:
       logger.debug("opening debug files")
       for col in keyarr:
         if outfile is None:
@@ -1213,7 +1379,7 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
                     for d in data:
                         s=re.sub(r"\\zcolsync.*?\\\*","",str(d))
                         outf.write(s)
-                        if debugPrint:
+                        if state.debug:
                           debugf[col].write(str(d))
             outf.write("\n\\polyglotendcols\n")
     else:
@@ -1223,7 +1389,7 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
                 #outf.write("\\rem " + str(p[0].ident) + str(p[0].type) + "\n")
                 outf.write("\\polyglotcolumn L\n")
                 outf.write(str(p[0]))
-                if debugPrint:
+                if state.debug:
                   debugf['L'].write(str(p[0]))
                 if not (p[0].type in  (ChunkType.PREVERSEHEAD, ChunkType.HEADING, ChunkType.TITLE, ChunkType.CHAPTERHEAD)):
                     outf.write("\\p\n")
@@ -1231,7 +1397,7 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
                 outf.write("\\polyglotcolumn R\n")
                 isright = True
                 outf.write(str(p[1]))
-                if debugPrint:
+                if state.debug:
                   debugf['R'].write(str(p[1]))
                 if not (p[1].type in  (ChunkType.PREVERSEHEAD, ChunkType.HEADING, ChunkType.TITLE, ChunkType.CHAPTERHEAD)):
                     outf.write("\\p\n")
@@ -1245,5 +1411,7 @@ def usfmerge2(infilearr, keyarr, outfile, stylesheets={}, fsecondary=False, mode
                 outf.write(text)
         else:
             print(text)
-
-
+    elif outf is not sys.stdout:
+        outf.close()
+    for f in debugf.values():
+        f.close()
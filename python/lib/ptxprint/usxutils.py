@@ -8,7 +8,7 @@ from usfmtc.xmlutils import ParentElement, hastext, isempty
 from usfmtc.usxmodel import iterusx, addesids
 from ptxprint.changes import readChanges
 from ptxprint.ptsettings import PTEnvironment
-from ptxprint.unicode.ucd import get_ucd
+from ptxprint.unicode.ucd import strvalues_ucd
 from copy import deepcopy
 
 logger = logging.getLogger(__name__)
@@ -482,7 +482,15 @@ class Usfm:
         hyphenchar = "\u2011" if nbhyphens else hyph.get_hyphen_char()
         def dohyphenate(txt, parent):
             return hyph.hyphenate(txt, hyphenchar)
+        if not hasattr(hyph, "stats"):
+            modifytext(self.getroot(), dohyphenate, blocks=self.nonvernacular)
+            return
+        start = (time.time(), hyph.hits, hyph.misses)
         modifytext(self.getroot(), dohyphenate, blocks=self.nonvernacular)
+        t = time.time() - start[0]
+        hyph.time += t
+        logger.debug(f"Hyphenated {self.book}: {hyph.hits - start[1]} cached and {hyph.misses - start[2]} new words in {t:.3f}s."
+                     f" So far {hyph.stats()}")
 
     tagmapping = {"chapter": "c", "verse": "v", "ref": "ref"}
 
@@ -700,8 +708,7 @@ class Usfm:
             t = x.text if isin else x.tail
             if isempty(t):
                 continue
-            for c in t:
-                cs = get_ucd(ord(c), 'sc')
+            for cs in strvalues_ucd(t, 'sc'):
                 if cs not in ("Zyyy", "Zinh"):
                     stats[cs] = stats.get(cs, 0) + 1
                     if stats[cs] > 100:
@@ -728,46 +735,38 @@ class Usfm:
             if r is not None and r != currstate[0]:
                 currstate = [r, set(strongs.getstrongs(r))]
                 found = {}
-            for st in list(currstate[1]):
-                regs = strongs.regexes[st] if st in strongs.regexes else strongs.addregexes(st, script=script)
-                if not len(regs):
-                    currstate[1].remove(st)
-                    continue
-                matched = False
-                try:
-                    regre = regex.compile(regs, regex.I | regex.F)
-                except regex._regex_core.error as e:
-                    raise SyntaxError(f"Faulty regex in {regs}: {e}")
-                b = regre.split(t)
-                if len(b) > 1:
+            if not len(currstate[1]):
+                continue
+            # one pass over the text for all the verse's numbers, so each word is marked once
+            spans = strongs.findStrongs(currstate[1], t, script=script)
+            if logger.isEnabledFor(6):
+                logger.log(6, f"{r} {sorted(currstate[1])} matched {[sp[2] for sp in spans]}")
+            if not len(spans):
+                continue
+            if isin:
+                x.text = t[:spans[0][0]] + "\u200B"
+                i = 0
+            else:
+                x.tail = t[:spans[0][0]] + "\u200B"
+                i = list(x.parent).index(x) + 1
+            lastw = x
+            for a, (s, e, st) in enumerate(spans):
+                w = t[s:e]
+                following = t[e:spans[a+1][0] if a < len(spans) - 1 else len(t)]
+                if showall or st not in found.get(w, []):
+                    ms = self.factory("ms", parent=x, attrib={"style": "xts", "strongs": st.lstrip("GH"), "align": "r"})
+                    ms.tail = "\u2064\u200A" + w + following
+                    found.setdefault(w, []).append(st)
                     if isin:
-                        x.text = b[0] + "\u200B"
-                        i = 0
+                        x.insert(i, ms)
                     else:
-                        x.tail = b[0] + "\u200B"
-                        # if x.parent is None:
-                            # breakpoint()
-                        i = list(x.parent).index(x) + 1
-                    lastw = x
-                    for a in range(1, len(b), 2):
-                        if showall or st not in found.get(b[a], []):
-                            e = self.factory("ms", parent=x, attrib={"style": "xts", "strongs": st.lstrip("GH"), "align": "r"})
-                            e.tail = "\u2064\u200A" + b[a]
-                            found.setdefault(b[a], []).append(st)
-                            if a < len(b) - 1:
-                                e.tail += b[a+1]
-                            if isin:
-                                x.insert(i, e)
-                            else:
-                                x.parent.insert(i, e)
-                            i += 1
-                            lastw = e
-                        elif isin and i == 0:
-                            x.text += b[a] + (b[a+1] if a < len(b) - 2 else "")
-                        else:
-                            lastw.tail += b[a] + (b[a+1] if a < len(b) - 2 else "")
-                    matched = True
-                logger.log(6, f"{r}{'*' if matched else ''} {regs=} {st=}")
+                        x.parent.insert(i, ms)
+                    i += 1
+                    lastw = ms
+                elif isin and i == 0:
+                    x.text += w + following
+                else:
+                    lastw.tail += w + following
 
     def getcvpara(self, c, v):
         if all(x in "0123456789" for x in c):
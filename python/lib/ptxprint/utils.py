@@ -7,7 +7,7 @@ from ptxprint.pdfrw.uncompress import uncompress
 from shutil import copy2
 from inspect import currentframe
 from struct import unpack
-import contextlib, pickle, gzip
+import contextlib, pickle, gzip, zlib
 import regex
 from subprocess import check_output, call
 import logging
@@ -21,7 +21,7 @@ except ModuleNotFoundError:
 logger = logging.getLogger(__name__)
 
 # Bump this number up in order to reset everyone's Cached files
-DataVersion = 7
+DataVersion = 8
 
 # For future Reference on how Paratext treats this list:
 # G                                     M M                         RT                P        X      FBO    ICGTND          L  OT X NT DC  -  X Y  -  Z  --  L
@@ -575,24 +575,111 @@ def ustr(x):
     res = re.sub(r"\\U([0-9A-Fa-f]{4})", lambda m:chr(int(m.group(1), 16)), res)
     return res
 
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse, sre_constants
+
+_literalflags = regex.M | regex.S | regex.U | regex.V0 | regex.V1
+_fuzzyreg = re.compile(r"\{[^}]*[deis][^}]*\}")      # regex fuzzy constraints look like literals to sre
+_literalprefixes = {}
+
+def _parsedPrefix(items):
+    """ Returns the literal text any match of the parsed items must start with and
+        whether all the items were literal. """
+    res = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            res.append(chr(av))
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue                # zero width
+        elif op is sre_constants.SUBPATTERN and not av[1] and not av[2]:
+            (sub, complete) = _parsedPrefix(av[-1])
+            res.append(sub)
+            if not complete:
+                return ("".join(res), False)
+        else:
+            return ("".join(res), False)
+    return ("".join(res), True)
+
+def literalPrefix(reg):
+    """ Returns text that must occur in any string reg can match, or "" if we
+        can't tell. Patterns the standard parser can't handle give "". """
+    k = (reg.pattern, reg.flags)
+    if k not in _literalprefixes:
+        res = ""
+        if isinstance(reg.pattern, str) and not (reg.flags & ~_literalflags) \
+                and not _fuzzyreg.search(reg.pattern):
+            try:
+                parsed = sre_parse.parse(reg.pattern)
+            except Exception:
+                parsed = None
+            if parsed is not None and not (parsed.state.flags & (re.I | re.X)):
+                res = _parsedPrefix(parsed)[0]
+        _literalprefixes[k] = res
+    return _literalprefixes[k]
+
+def changeBook(c):
+    """ Returns the only book a change applies to, or None if it can apply to any """
+    if isinstance(c[0], str):
+        return c[0]
+    return getattr(c[0], "book", None)
+
+class ChangePlan:
+    """ A list of changes compiled for running: changes are grouped by the book
+        they apply to and each has a literal that must be present for it to match. """
+
+    def __init__(self, changes):
+        self.changes = changes
+        self.size = len(changes)
+        self.books = [changeBook(c) for c in changes]
+        self.prefixes = [literalPrefix(c[1]) if hasattr(c[1], "pattern") else "" for c in changes]
+        self.bybook = {}
+
+    def isfor(self, changes):
+        return changes is self.changes and len(changes) == self.size
+
+    def forbook(self, bk):
+        if bk not in self.bybook:
+            self.bybook[bk] = [(c, self.prefixes[i]) for i, c in enumerate(self.changes)
+                                    if self.books[i] is None or self.books[i] == bk]
+        return self.bybook[bk]
+
+_changeplans = {}
+
+def changePlan(changes):
+    if not isinstance(changes, list):
+        return ChangePlan(list(changes))
+    res = _changeplans.get(id(changes), None)
+    if res is None or not res.isfor(changes):
+        res = ChangePlan(changes)
+        if len(_changeplans) > 64:
+            del _changeplans[next(iter(_changeplans))]
+        _changeplans[id(changes)] = res
+    return res
+
 def runChanges(changes, bk, dat, errorfn=None):
     if dat is None:
         return dat
+    trace = logger.isEnabledFor(5)
     def wrap(t, l):
+        if not trace:
+            return t
         def proc(m):
             res = m.expand(t) if isinstance(t, str) else t(m)
             logger.log(5, "match({0},{1})={2}->{3} at {4}".format(m.start(), m.end(), m.string[m.start():m.end()], res, l))
             return res
         return proc
-    for c in changes:
-        if bk is not None:
+    debug = bk is not None and logger.isEnabledFor(logging.DEBUG)
+    for c, prefix in changePlan(changes).forbook(bk):
+        if debug:
             logger.debug("at {} Change: {}".format(bk, c))
+        if prefix and prefix not in dat:
+            continue
         try:
-            if c[0] is None:
+            if c[0] is None or isinstance(c[0], str):
                 dat = c[1].sub(wrap(c[2], c[3]), dat)
-            elif isinstance(c[0], str):
-                if c[0] == bk:
-                    dat = c[1].sub(wrap(c[2], c[3]), dat)
             else:
                 def simple(s):
                     return c[1].sub(wrap(c[2], c[3]), s)
@@ -636,15 +723,28 @@ def regex_localiser(r, script=None):
     specials = "|".join(special_regexes.keys())
     return re.sub(r"\\({})".format(specials), lambda m:special_regexes.get(m.group(1), "\\"+m.group(1)), r)
 
+def fileStamp(filepath):
+    """ Returns what changes when filepath is edited, or None if it cannot be read """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
 def cachedData(filepath, fn):
+    """ Returns fn(open(filepath)), keeping the result in a pickle in the user's cache
+        directory. The pickle is remade when filepath changes. """
     cfgdir = appdirs.user_cache_dir("ptxprint", "SIL")
     os.makedirs(cfgdir, exist_ok=True)
     cfgfilepath = os.path.join(cfgdir, os.path.basename("{}.pickle_{}.gz".format(filepath, DataVersion)))
+    stamp = fileStamp(filepath)
     logger.debug(f"Reading cache file {cfgfilepath}")
     if os.path.exists(cfgfilepath):
         with contextlib.closing(gzip.open(cfgfilepath, "rb")) as inf:
             try:
-                return pickle.load(inf)
+                oldstamp = pickle.load(inf)
+                if stamp is None or oldstamp == stamp:
+                    return pickle.load(inf)
             except:
                 pass        # if the pickle loading fails, rebuild the pickle file
     testbase = os.path.basename("{}.pickle".format(filepath))
@@ -655,9 +755,100 @@ def cachedData(filepath, fn):
     with open(filepath, "r", encoding="utf8") as inf:
         res = fn(inf)
     with contextlib.closing(gzip.open(cfgfilepath, "wb")) as outf:
+        pickle.dump(stamp, outf)
         pickle.dump(res, outf)
     return res
 
+class BookCache:
+    """ The per book data made from a file by cachedBooks. Each book is read from the
+        cache file the first time it is asked for. If that fails, reread() is called
+        to make the data for all the books from the source. """
+
+    def __init__(self, fpath, base, index, data=None, reread=None):
+        self.fpath = fpath
+        self.base = base
+        self.index = index
+        self.data = data if data is not None else {}
+        self.reread = reread
+
+    def __getitem__(self, bk):
+        if bk not in self.data:
+            (offset, length) = self.index[bk]
+            try:
+                with open(self.fpath, "rb") as inf:
+                    inf.seek(self.base + offset)
+                    self.data[bk] = pickle.loads(zlib.decompress(inf.read(length)))
+            except Exception as e:
+                if self.reread is None:
+                    raise
+                logger.debug(f"Failed to read {bk} from {self.fpath}: {e}")
+                self.data = self.reread()
+                self.index = dict.fromkeys(self.data)
+                self.reread = None
+        return self.data[bk]
+
+    def get(self, bk, default=None):
+        return self[bk] if bk in self.index else default
+
+    def __contains__(self, bk):
+        return bk in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def items(self):
+        return ((bk, self[bk]) for bk in self.index)
+
+def cachedBooks(filepath, fn):
+    """ Like cachedData for a fn that returns {book: data}, except that only the books
+        that are used are read back from the cache. The cache is an index of where
+        each book's compressed pickle is, followed by those pickles. It is remade when
+        filepath changes. """
+    cfgdir = appdirs.user_cache_dir("ptxprint", "SIL")
+    os.makedirs(cfgdir, exist_ok=True)
+    cfgfilepath = os.path.join(cfgdir, os.path.basename("{}.books_{}.idx".format(filepath, DataVersion)))
+    stamp = fileStamp(filepath)     # None means use whatever is cached
+    def reread():
+        with open(filepath, "r", encoding="utf8") as inf:
+            return fn(inf)
+    logger.debug(f"Reading cache file {cfgfilepath}")
+    if os.path.exists(cfgfilepath):
+        try:
+            with open(cfgfilepath, "rb") as inf:
+                (oldstamp, index) = pickle.load(inf)
+                base = inf.tell()
+            if stamp is None or oldstamp == stamp:
+                return BookCache(cfgfilepath, base, index, reread=reread)
+        except Exception:
+            pass        # if the index cannot be read, rebuild the cache file
+    testbase = os.path.basename("{}.books".format(filepath))
+    for l in os.listdir(cfgdir):
+        if l.startswith(testbase):
+            os.unlink(os.path.join(cfgdir, l))
+    logger.debug(f"Writing cache file {cfgfilepath}")
+    res = reread()
+    index = {}
+    blobs = []
+    offset = 0
+    for bk, v in res.items():
+        blobs.append(zlib.compress(pickle.dumps(v, pickle.HIGHEST_PROTOCOL)))
+        index[bk] = (offset, len(blobs[-1]))
+        offset += len(blobs[-1])
+    tmppath = "{}.{}.tmp".format(cfgfilepath, os.getpid())
+    with open(tmppath, "wb") as outf:
+        pickle.dump((stamp, index), outf)
+        base = outf.tell()
+        for b in blobs:
+            outf.write(b)
+    os.replace(tmppath, cfgfilepath)
+    return BookCache(cfgfilepath, base, index, data=res, reread=reread)
+
 def extraDataDir(base, dirname, create=False):
     uddir = os.path.join(appdirs.user_data_dir("ptxprint", "SIL"), base)
     if not os.path.exists(uddir):
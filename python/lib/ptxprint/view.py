@@ -1697,7 +1697,7 @@ class ViewModel:
     def finished(self, passed=True):
         pass
 
-    def incrementProgress(self, inproc=False, stage="pr", run=0):
+    def incrementProgress(self, inproc=False, stage="pr", run=0, detail=None, advance=True):
         pass
 
     def getStyleSheets(self, cfgname=None, generated=False, prj=None, subdir=""):
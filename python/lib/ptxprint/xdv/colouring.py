@@ -2,9 +2,11 @@
 
 from collections import namedtuple
 from ptxprint.font import TTFont
-from ptxprint.xdv.xdv import XDViReader, XDViWriter, XDViFilter
+from ptxprint.xdv.xdv import XDViReader, XDViWriter, XDViFilter, procpages
 from itertools import groupby
-import logging
+from shutil import copyfile
+from copy import deepcopy
+import logging, mmap
 
 logger = logging.getLogger(__name__)
 
@@ -27,9 +29,14 @@ class DiaSet:
     def addgname(self, gname):
         self.gnames.add(gname)
 
+    def __eq__(self, other):
+        return vars(self) == vars(other)
+
 DiaInstance = namedtuple("DiaInstance", ["font", "colour", "gids"])
 
 class PTXPxdviFilter(XDViFilter):
+    stateops = ("xxx", "font")
+
     def __init__(self, rdr, wrtr):
         super().__init__(rdr, wrtr)
         self.diasets = {}
@@ -37,7 +44,14 @@ class PTXPxdviFilter(XDViFilter):
         self.currdias = set()
         self.currfont = -1
         self.currcolour = [0]
-        self.pauses = []
+        self.paused = []
+
+    def getstate(self):
+        return deepcopy((self.diasets, self.currdias, self.currfont, self.currcolour, self.paused))
+
+    def setstate(self, state):
+        (self.diasets, self.currdias, self.currfont, self.currcolour, self.paused) = deepcopy(state)
+        self.font(None, self.currfont)
 
     def _getfont(self, k):
         if k not in self.rdr.fonts:
@@ -106,7 +120,7 @@ class PTXPxdviFilter(XDViFilter):
         elif cmd == "ptxp:pause":
             paused = list(self.currdias)
             self.paused.append(paused)
-            self.currdias.clear
+            self.currdias.clear()
             return None
         elif cmd == "ptxp:unpause":
             try:
@@ -156,7 +170,8 @@ class PTXPxdviFilter(XDViFilter):
                     break
             else:
                 colours.append([0])
-        gorder = sorted(range(len(glyphs)), key=lambda i:(colours[i] == self.currcolour, colours[i], i))
+        # no colour is [0], so compare colours as strings
+        gorder = sorted(range(len(glyphs)), key=lambda i:(colours[i] == self.currcolour, [str(x) for x in colours[i]], i))
         logger.debug(f"xglyphs {self.currfont} for {self.currdias} is {[colours[g] for g in gorder]}")
         if not any(colours[g] != self.currcolour for g in gorder):
             return (parm, width, pos, glyphs, txt)
@@ -165,20 +180,25 @@ class PTXPxdviFilter(XDViFilter):
         for i, (col, grange) in enumerate(groups):
             ids = list(grange)
             self._setColour(col)
-            poso = [pos[j] for j in grange]
-            glypho = [glyphs[j] for j in grange]
+            poso = [pos[j] for j in ids]
+            glypho = [glyphs[j] for j in ids]
             if i == len(groups) - 1:
                 self.wrtr.xglyphs(opcode, parm, width, poso, glypho, txt)
             else:
                 self.wrtr.xglyphs(opcode, 1, 0, poso, glypho, "")
         return None
 
-def procxdv(inxdv, outxdv):
-    reader = XDViReader(inxdv)
-    writer = XDViWriter(outxdv)
-    filt = PTXPxdviFilter(reader, writer)
-    filt.process()
-    writer.finish()
+def procxdv(inxdv, outxdv, jobs=1):
+    with open(inxdv, "rb") as inf:
+        try:
+            with mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ) as dat:
+                hasptxp = dat.find(b"ptxp:") >= 0
+        except (ValueError, OSError):
+            hasptxp = True
+    if not hasptxp:         # nothing to colour
+        copyfile(inxdv, outxdv)
+        return
+    procpages(inxdv, outxdv, PTXPxdviFilter, jobs=jobs)
 
 def main():
     import sys
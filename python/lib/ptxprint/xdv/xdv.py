@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
 # Parses xdv
-from struct import unpack, pack
+import os, sys, mmap, tempfile, multiprocessing
+import logging
+from array import array
+from struct import unpack, pack, Struct, error as struct_error
+
+logger = logging.getLogger(__name__)
+
 class Font:
     def __init__(self, fname):
         self.name = fname
@@ -77,6 +83,55 @@ opcodes += [
 
 packings = ("bhxi", "BHxI")
 
+def _opstruct(sizes):
+    """ Returns a precompiled Struct for an opcode's parameters and a list of
+        (index, signed) for any 3 byte parameters, which struct can't do. """
+    fmt = ">"
+    threes = []
+    for i, x in enumerate(sizes):
+        if abs(x) == 3:
+            fmt += "3s"
+            threes.append((i, x < 0))
+        else:
+            fmt += packings[1 if x > 0 else 0][abs(x)-1]
+    return (Struct(fmt), threes)
+
+opstructs = [_opstruct(o[1]) for o in opcodes]
+valstructs = {(s, u): Struct(">"+packings[1 if u else 0][s-1]) for s in (1, 2, 4) for u in (False, True)}
+_bigendian = sys.byteorder == "big"
+
+def _bearray(typecode, dat):
+    """ Makes an array from big endian data """
+    res = array(typecode)
+    res.frombytes(dat)
+    if not _bigendian:
+        res.byteswap()
+    return res
+
+
+class GlyphPositions:
+    """ The (x, y) offsets of a glyph run, held as a flat array """
+    def __init__(self, coords):
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return (self.coords[2*i], self.coords[2*i+1])
+
+    def __iter__(self):
+        c = iter(self.coords)
+        return zip(c, c)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+
 class XDViReader:
     def __init__(self, fname, diffable=False):
         self.fonts = {}
@@ -84,12 +139,24 @@ class XDViReader:
         self.diffable = diffable
         self.pageno = 0
         self.file = None
+        self.buf = None
+        self.pos = 0
+        self.pageoffsets = None
+        self.prelude = False
 
     def __enter__(self):
         self.file = open(self.fname, "rb")
+        try:
+            self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):       # empty files and special filesystems
+            self.buf = self.file.read()
+        self.pos = 0
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.buf = None
         if self.file is not None:
             self.file.close()
             self.file = None
@@ -98,40 +165,155 @@ class XDViReader:
         return self
 
     def __next__(self):
-        op = self.readval(1, uint=True)
+        if self.pos >= len(self.buf):
+            raise struct_error("Unexpected end of xdv file at {}".format(self.pos))
+        op = self.buf[self.pos]
         opc = opcodes[op]
-        data = [self.readval((x if x>0 else -x), uint=x>0) for x in opc[1]]
+        (s, threes) = opstructs[op]
+        self.pos += 1
+        if not s.size:
+            return (op, opc, [])
+        data = list(s.unpack_from(self.buf, self.pos))
+        self.pos += s.size
+        for i, signed in threes:
+            data[i] = int.from_bytes(data[i], "big", signed=signed)
         return (op, opc, data)
 
     def readbytes(self, num):
-        return self.file.read(num)
+        res = self.buf[self.pos:self.pos+num]
+        if len(res) < num:
+            raise struct_error("Unexpected end of xdv file at {}".format(self.pos))
+        self.pos += num
+        return res
 
     def readval(self, size, uint=False):
-        d = self.readbytes(size)
         if size == 3:
-            if uint:
-                s = unpack(">"+packings[1][1]+packings[1][0], d)
-                res = s[0] * 256 + s[1]
-            else:
-                s = unpack(">"+packings[0][1]+packings[1][0], d)
-                res = s[0] * 256 + (s[1] if s[0] > 0 else -s[1])
-        else:
-            res = unpack(">"+packings[1 if uint else 0][size-1], d)[0]
+            return int.from_bytes(self.readbytes(3), "big", signed=not uint)
+        s = valstructs[(size, uint)]
+        res = s.unpack_from(self.buf, self.pos)[0]
+        self.pos += size
         return res
 
-    def parse(self):
+    def parse(self, numpages=None):
+        """ Yields (opcode, result) for each op from the current position. If numpages
+            is given, stops (leaving the reader at it) before the bop after that many
+            pages or before the post. """
         selfopen = False
         if self.file is None:
             selfopen = True
             self.__enter__()
         for (op, opc, data) in self:
+            if numpages is not None and op in (139, 248):
+                if op == 248 or numpages == 0:
+                    self.pos -= 1 + opstructs[op][0].size
+                    break
+                numpages -= 1
             res = getattr(self, opc[0])(op, opc[2], data) 
             yield (op, res)
             if opc[2] == "postpost":
                 break
         if selfopen:
             self.__exit__(None, None, None)
-            self.file = None
+
+    def _postamble(self):
+        """ Returns the offset of the post opcode, found from the postpost at the end
+            of the file, or None if the file is incomplete """
+        end = len(self.buf)
+        while end > 0 and self.buf[end-1] == 0xDF:
+            end -= 1
+        if end < 6 or self.buf[end-6] != 249:
+            return None
+        post = valstructs[(4, True)].unpack_from(self.buf, end-5)[0]
+        if post >= end or self.buf[post] != 248:
+            return None
+        return post
+
+    def pageindex(self):
+        """ Returns a list of the file offsets of the bop of each page, in file order.
+            Uses the chain of back pointers from the postamble, so no page is parsed.
+            The file must be open. """
+        if self.pageoffsets is not None:
+            return self.pageoffsets
+        res = []
+        post = self._postamble()
+        if post is not None:
+            ptr = valstructs[(4, True)].unpack_from(self.buf, post+1)[0]
+            while ptr != 0xFFFFFFFF and ptr < post and self.buf[ptr] == 139:
+                res.append(ptr)
+                ptr = valstructs[(4, True)].unpack_from(self.buf, ptr+41)[0]
+            res.reverse()
+        else:           # no postamble, so scan the file
+            pos = self.pos
+            self.pos = 0
+            try:
+                for (op, opc, data) in self:
+                    if op == 139:
+                        res.append(self.pos - 45)
+                    elif op == 249:
+                        break
+                    elif opc[0] in ("xxx", "fontdef", "pre", "xfontdef", "xglyphs"):
+                        self.skipop(op, data)
+            except struct_error:
+                pass
+            self.pos = pos
+        self.pageoffsets = res
+        return res
+
+    def skipop(self, op, data):
+        """ Moves past the variable length data of an op without processing it """
+        kind = opcodes[op][0]
+        if kind == "xxx":
+            self.pos += data[0]
+        elif kind == "fontdef":
+            self.pos += data[4] + data[5]
+        elif kind == "pre":
+            self.pos += data[4]
+        elif kind == "xfontdef":
+            flags = data[2]
+            plen = self.readval(1, uint=True)
+            self.pos += plen + 4
+            if flags & 0x200:
+                self.pos += 4
+            if flags & 0x800:
+                nvars = self.readval(2)
+                self.pos += 4 * nvars
+            for f in (0x1000, 0x2000, 0x4000):
+                if flags & f:
+                    self.pos += 4
+        elif kind == "xglyphs":
+            if opcodes[op][2] == 0:
+                tlen = self.readval(2)
+                self.pos += 2 * tlen
+            self.pos += 4
+            slen = self.readval(2, uint=True)
+            self.pos += 10 * slen
+
+    def numpages(self):
+        return len(self.pageindex())
+
+    def seekpage(self, n):
+        """ Positions the reader at the bop of the nth (0 based) page in the file, so
+            that parse() starts from there. The preamble and the font definitions in
+            the postamble are processed first, so fonts used on the page are known. """
+        if self.file is None:
+            self.__enter__()
+        offsets = self.pageindex()
+        if not self.prelude:
+            self.prelude = True
+            self.pos = 0
+            (op, opc, data) = next(self)
+            if op == 247:
+                self.pre(op, opc[2], data)
+            post = self._postamble()
+            if post is not None:
+                self.pos = post
+                for (op, opc, data) in self:
+                    if op == 249:
+                        break
+                    elif opc[0] in ("fontdef", "xfontdef"):
+                        getattr(self, opc[0])(op, opc[2], data)
+        self.pos = offsets[n]
+        return self.pos
 
     def out(self, txt):
         # print(("pg[{}] ".format(self.pageno) + txt).encode("utf-8"))
@@ -222,8 +404,8 @@ class XDViReader:
             txt = b""
         width = self.readval(4)
         slen = self.readval(2, uint=True)
-        pos = [(self.readval(4), self.readval(4)) for i in range(slen)]
-        glyphs = [self.readval(2) for i in range(slen)]
+        pos = GlyphPositions(_bearray("i", self.readbytes(8*slen)))
+        glyphs = _bearray("H", self.readbytes(2*slen))
         return (parm, width, pos, glyphs, txt)
         # res = ["{}@({},{})".format(glyphs[i], *pos[i]) for i in range(slen)]
         # self.out("xglyphs: {}".format(res))
@@ -302,29 +484,29 @@ class XDViWriter:
         self.fname = fname
         self.outf = open(fname, "wb")
         self.lastbop = 0xFFFFFFFF
+        self.bops = []
 
     def outbytes(self, b):
         self.outf.write(b)
 
     def outval(self, size, val, uint=False):
         if size == 3:
-            if uint:
-                d = pack(">"+packings[1][1]+packings[1][0], val // 256, val & 255)
-            else:
-                d = pack(">"+packings[0][1]+packings[1][0], -(-val // 256) if val < 0 else val // 256, 
-                                                            (-val & 255) if val < 0 else (val & 255))
+            d = val.to_bytes(3, "big", signed=not uint)
         else:
-            d = pack(">"+packings[1 if uint else 0][size-1], val)
+            d = valstructs[(size, uint)].pack(val)
         self.outf.write(d)
 
     def outopcode(self, opcode):
         self.outval(1, opcode, uint=True)
 
     def outop(self, opcode, data):
-        opc = opcodes[opcode]
+        (s, threes) = opstructs[opcode]
         self.outopcode(opcode)
-        for x, d in zip(opc[1], data):
-            self.outval((x if x > 0 else -x), d, uint=x>0)
+        if threes:
+            data = list(data)
+            for i, signed in threes:
+                data[i] = data[i].to_bytes(3, "big", signed=signed)
+        self.outbytes(s.pack(*data[:len(opcodes[opcode][1])]))
 
     def push(self, opcode, parm, data):
         self.outval(1, opcode, uint=True)
@@ -340,10 +522,14 @@ class XDViWriter:
             extra = 8 - l
         self.outbytes(b"\xDF"*extra)
         self.outf.close()
+
+    def close(self):
+        """ Closes a file that holds only pages, without a postamble """
+        self.outf.close()
         
 
     def setchar(self, opcode, char):
-        if char < 129:
+        if char < 128:
             self.outop(char, [])
         else:
             self.outop(opcode, [char])
@@ -366,6 +552,7 @@ class XDViWriter:
         res = list(data)
         res[-1] = self.lastbop
         self.lastbop = self.outf.tell()
+        self.bops.append(self.lastbop)
         self.outop(opcode, [pageno] + res)
 
     def font(self, opcode, fontnum):
@@ -420,7 +607,7 @@ class XDViWriter:
             self.outval(4, font.color)
         if flags & 0x800:
             self.outval(2, len(font.variations))
-            for v in self.variations:
+            for v in font.variations:
                 self.outval(4, v)
         if flags & 0x1000:
             self.outval(4, font.ext)
@@ -439,20 +626,27 @@ class XDViWriter:
         self.outval(4, width)
         slen = len(glyphs)
         self.outval(2, slen, uint=True)
-        for p in pos:
-            self.outval(4, p[0])
-            self.outval(4, p[1])
-        for g in glyphs:
-            self.outval(2, g)
+        coords = pos.coords if isinstance(pos, GlyphPositions) else [v for p in pos for v in p]
+        self.outbytes(pack(">{}i{}H".format(2*slen, slen), *coords, *glyphs))
 
 
 class XDViFilter:
+    # Op kinds whose handlers change state that carries from one page to the next
+    stateops = ()
+
     def __init__(self, rdr, wrtr):
         self.rdr = rdr
         self.wrtr = wrtr
 
-    def process(self):
-        for (opcode, data) in self.rdr.parse():
+    def getstate(self):
+        """ Returns a copy of the state that carries across pages, for procpages """
+        return None
+
+    def setstate(self, state):
+        pass
+
+    def process(self, numpages=None):
+        for (opcode, data) in self.rdr.parse(numpages=numpages):
             opc = opcodes[opcode]
             if hasattr(self, opc[0]):
                 data = getattr(self, opc[0])(opcode, *data)
@@ -461,6 +655,97 @@ class XDViFilter:
             getattr(self.wrtr, opc[0])(opcode, *data)
 
 
+def _prescan(rdr, filt, starts):
+    """ Runs just the filter's stateops over the file, without output, and returns
+        the filter's state at the start of each page in starts """
+    res = []
+    want = [rdr.pageindex()[s] for s in starts]
+    rdr.pos = 0
+    for (op, opc, data) in rdr:
+        kind = opc[0]
+        if op == 139 and rdr.pos - 45 == want[len(res)]:
+            res.append(filt.getstate())
+            if len(res) == len(want):
+                break
+        elif op == 248:
+            break
+        if kind in filt.stateops:
+            data = getattr(rdr, kind)(op, opc[2], data)
+            getattr(filt, kind)(op, *data)
+        elif kind in ("pre", "fontdef", "xfontdef"):
+            getattr(rdr, kind)(op, opc[2], data)
+        elif kind in ("xxx", "xglyphs"):
+            rdr.skipop(op, data)
+    return res
+
+def _filterpages(inxdv, filtercls, readercls, start, numpages, state, outfname):
+    """ Filters numpages pages from start into a file holding just those pages.
+        Returns the offsets of the bops in it and the filter's final state """
+    wrtr = XDViWriter(outfname)
+    with readercls(inxdv) as rdr:
+        rdr.seekpage(start)
+        filt = filtercls(rdr, wrtr)
+        filt.setstate(state)
+        filt.process(numpages=numpages)
+    wrtr.close()
+    return (wrtr.bops, filt.getstate())
+
+_pooljob = None
+def _filterPoolPages(i):
+    (inxdv, filtercls, readercls, chunks, states, tmpdir) = _pooljob
+    return _filterpages(inxdv, filtercls, readercls, *chunks[i], states[i],
+                        os.path.join(tmpdir, "{}.xdv".format(i)))
+
+def procpages(inxdv, outxdv, filtercls, readercls=XDViReader, jobs=1, minpages=20):
+    """ Runs filtercls(reader, writer) over inxdv to make outxdv. With more than one
+        job, the pages are split into ranges that are filtered by forked workers and
+        then joined, with the bop and post back pointers fixed up. Each range starts
+        from the filter's state at that page, found by a prescan of its stateops. If a
+        range ends in a different state from the one the next range assumed, that
+        next range is filtered again. """
+    global _pooljob
+    with readercls(inxdv) as rdr:
+        post = rdr._postamble()
+        numpages = rdr.numpages() if post is not None else 0
+        jobs = min(jobs, numpages // minpages)
+        if jobs < 2 or "fork" not in multiprocessing.get_all_start_methods():
+            wrtr = XDViWriter(outxdv)
+            filtercls(rdr, wrtr).process()
+            wrtr.finish()
+            return
+        size = -(-numpages // jobs)
+        chunks = [(s, min(size, numpages - s)) for s in range(0, numpages, size)]
+        states = _prescan(rdr, filtercls(rdr, None), [c[0] for c in chunks])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _pooljob = (inxdv, filtercls, readercls, chunks, states, tmpdir)
+            pool = multiprocessing.get_context("fork").Pool(len(chunks))
+            try:
+                results = pool.map(_filterPoolPages, range(len(chunks)))
+            finally:
+                pool.close()
+                pool.join()
+                _pooljob = None
+            for i in range(1, len(chunks)):
+                if results[i-1][1] != states[i]:
+                    logger.debug("Refiltering xdv pages from {}".format(chunks[i][0]))
+                    results[i] = _filterpages(inxdv, filtercls, readercls, *chunks[i],
+                                    results[i-1][1], os.path.join(tmpdir, "{}.xdv".format(i)))
+            wrtr = XDViWriter(outxdv)
+            rdr.pos = 0
+            filtercls(rdr, wrtr).process(numpages=0)
+            for i, (bops, state) in enumerate(results):
+                base = wrtr.outf.tell()
+                with open(os.path.join(tmpdir, "{}.xdv".format(i)), "rb") as inf:
+                    dat = bytearray(inf.read())
+                for b in bops:
+                    valstructs[(4, True)].pack_into(dat, b + 41, wrtr.lastbop)
+                    wrtr.lastbop = base + b
+                wrtr.outbytes(dat)
+            rdr.pos = post
+            filtercls(rdr, wrtr).process()
+            wrtr.finish()
+
+
 def main():
     import sys
 
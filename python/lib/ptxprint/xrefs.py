@@ -1,5 +1,5 @@
 
-from ptxprint.utils import cachedData, pycodedir, regex_localiser, nonSpacingScripts
+from ptxprint.utils import cachedData, cachedBooks, pycodedir, regex_localiser, nonSpacingScripts
 from usfmtc.reference import RefList, RefRange, Ref
 from ptxprint.unicode.ducet import get_sortkey, SHIFTTRIM, tailored, get_ces
 from usfmtc.versification import cached_versification
@@ -112,7 +112,7 @@ class XrefFileXrefs(BaseXrefs):
         super().__init__(env, rtl, shortrefs=shortrefs)
         self.filters = filters
         self.xrlistsize = listsize
-        self.xrefdat = cachedData(xrfile, self.readdat)
+        self.xrefdat = cachedBooks(xrfile, self.readdat)
 
     def readdat(self, inf):
         xrefdat = {}
@@ -191,7 +191,7 @@ class XMLXrefs(BaseXrefs):
         self.filters = filters
         self.context = context or BaseBooks
         self.shownums = shownums
-        self.xmldat = cachedData(xrfile, self.readxml)
+        self.xmldat = cachedBooks(xrfile, self.readxml)
         self.ptsettings = ptsettings
 
     def _unpackxml(self, xr):
@@ -307,6 +307,19 @@ class XMLXrefs(BaseXrefs):
         return triggers
 
 
+strongsinfo = None
+
+def readStrongsInfo(inf):
+    """ Returns {ref: (attributes, {lang: (gloss, translation)})} from strongs_info.xml """
+    res = {}
+    langattrib = "{http://www.w3.org/XML/1998/namespace}lang"
+    for s in et.parse(inf).findall(".//strong"):
+        trans = {}
+        for le in s.iter('trans'):
+            trans.setdefault(le.get(langattrib), (le.get('gloss', None), le.text))
+        res[s.get('ref')] = ({k: s.get(k) for k in ('btid', 'lemma', 'head', 'translit')}, trans)
+    return res
+
 components = [
     ("c_strongsSrcLg", r"\w{_lang} {lemma}\w{_lang}*", "lemma"),
     ("c_strongsTranslit", r"\wl {translit}\wl*", "translit"),
@@ -322,6 +335,7 @@ class StrongsXrefs(XMLXrefs):
         super().__init__(xrfile, filters, localfile=localfile, ptsettings=ptsettings, env=env,
                  context=context, shownums=shownums, rtl=rtl, shortrefs=shortrefs)
         self.regexes = {}
+        self.matchers = {}
         self.btmap = None
         self.revwds = None
         self.strongs = None
@@ -342,24 +356,24 @@ class StrongsXrefs(XMLXrefs):
         return [x[0] for x in self.xmldat.get(ref.first.book, {}).get(ref,[])]
 
     def loadinfo(self, lang):
+        global strongsinfo
         if lang is None:
             lang = 'und'
         if self.btmap is not None and len(self.btmap) and lang == self.lang:
             return
-        strongsdoc = et.parse(os.path.join(os.path.dirname(__file__), "xrefs", "strongs_info.xml"))
+        if strongsinfo is None:
+            strongsinfo = cachedData(os.path.join(os.path.dirname(__file__), "xrefs", "strongs_info.xml"), readStrongsInfo)
         self.lang = lang
         if self.strongs is None:
             self.strongs = {}
             self.btmap = {}
-        for s in strongsdoc.findall(".//strong"):
-            sref = s.get('ref')
-            le = s.find('.//trans[@{{http://www.w3.org/XML/1998/namespace}}lang="{}"]'.format(self.lang))
-            self.strongs.setdefault(sref, {}).update({k: s.get(k) for k in ('btid', 'lemma', 'head', 'translit')})
-            self.btmap[s.get('btid')] = sref
-            if le is not None:
-                d = le.get('gloss', None)
+        for sref, (attribs, trans) in strongsinfo.items():
+            self.strongs.setdefault(sref, {}).update(attribs)
+            self.btmap[attribs['btid']] = sref
+            if self.lang in trans:
+                (d, t) = trans[self.lang]
                 self.strongs[sref]['def'] = [d] if d is not None else None
-                self.strongs[sref]['trans'] = le.text or ""
+                self.strongs[sref]['trans'] = t or ""
             else:
                 self.strongs[sref]['def'] = None
                 self.strongs[sref]['trans'] = ""
@@ -464,6 +478,37 @@ class StrongsXrefs(XMLXrefs):
         self.regexes[st] = res
         return res
 
+    def matcher(self, st, script=None):
+        """ Returns the compiled regex for the renderings of st, or None if it has none.
+            Each is compiled once, however many verses use it. """
+        if st not in self.matchers:
+            regs = self.regexes[st] if st in self.regexes else self.addregexes(st, script=script)
+            if not len(regs):
+                self.matchers[st] = None
+            else:
+                try:
+                    self.matchers[st] = regex.compile(regs, regex.I | regex.F)
+                except regex._regex_core.error as e:
+                    raise SyntaxError(f"Faulty regex in {regs}: {e}")
+        return self.matchers[st]
+
+    def findStrongs(self, sts, txt, script=None):
+        """ Returns [(start, end, st)] for the renderings of each of sts in txt, leftmost
+            first and not overlapping, with the longer match taken where two start at the
+            same place. Any of sts that has no renderings is removed from sts. """
+        spans = []
+        for k, st in enumerate(sorted(sts)):
+            regre = self.matcher(st, script=script)
+            if regre is None:
+                sts.discard(st)
+                continue
+            spans.extend((m.start(), -m.end(), k, st) for m in regre.finditer(txt) if m.end() > m.start())
+        res = []
+        for (s, e, k, st) in sorted(spans):
+            if not len(res) or s >= res[-1][1]:
+                res.append((s, -e, st))
+        return res
+
     def generateStrongsIndex(self, bkid, cols, outfile, onlylocal, view):
         lang = view.get('fcb_strongsMajorLg')
         self.loadinfo(lang)
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+
+import unittest, os, tempfile, shutil
+from ptxprint.booksplit import readPages, planParts, pageStartTex
+from ptxprint.pdfrw import PdfReader, PdfWriter
+from ptxprint.pdfrw.objects import PdfDict, PdfArray, PdfName, PdfObject, PdfString, IndirectPdfDict
+from ptxprint.pdf.pdfstitch import stitch_pdfs
+
+# (book, first page, last page) as the previous run placed them. LEV starts on the page EXO
+# ends on, so no part may start with it.
+layout = [("GEN", 1, 15), ("EXO", 16, 25), ("LEV", 25, 30), ("NUM", 31, 40)]
+
+def parlocs(layout, pgnums=None):
+    """ The lines of a .parlocs for books laid out on pages, two paragraphs a page """
+    res = [r"\@colstart{0}{1}{L}{30000000}{20000000}"]
+    numpages = max(l[2] for l in layout)
+    for p in range(1, numpages + 1):
+        res.append(r"\@pgstart{{{}}}{{{}}}{{48000000}}{{25000000}}".format(pgnums[p-1] if pgnums else p, p))
+        for bk, first, last in layout:
+            if first <= p <= last:
+                for v in (1, 2):
+                    res.append(r"\@parstart{{{}{}.{}}}{{p}}{{p}}{{12.0pt}}{{100}}{{{}}}".format(bk, p, v, 3000000 * v))
+                    res.append(r"\@parlines{12}")
+    return res
+
+class TestPlanParts(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def pages(self, layout, pgnums=None):
+        fname = os.path.join(self.tdir, "test.parlocs")
+        with open(fname, "w", encoding="utf-8") as outf:
+            outf.write("\n".join(parlocs(layout, pgnums)) + "\n")
+        return readPages(fname)
+
+    def test_readpages(self):
+        pages = self.pages(layout)
+        self.assertEqual(len(pages), 40)
+        self.assertEqual([p.pageno for p in pages], list(range(1, 41)))
+        self.assertEqual(pages[0].books, {"GEN"})
+        self.assertEqual(pages[24].books, {"EXO", "LEV"})
+        self.assertIsNone(readPages(os.path.join(self.tdir, "missing.parlocs")))
+        # page numbers that are not numbers follow on from the one before
+        pages = self.pages(layout, ["i", "ii"] + list(range(1, 39)))
+        self.assertEqual([p.pageno for p in pages[:4]], [1, 2, 1, 2])
+
+    def test_parts(self):
+        pages = self.pages(layout)
+        bookids = [l[0] for l in layout]
+        parts = planParts(pages, bookids, 3)
+        self.assertEqual([p.bookindices for p in parts], [[0], [1, 2], [3]])
+        self.assertEqual([(p.totalpages, p.pageno) for p in parts], [(0, 1), (15, 16), (30, 31)])
+        self.assertEqual([(p.first, p.last, p.pagereset) for p in parts],
+                         [(True, False, False), (False, False, True), (False, True, True)])
+        self.assertEqual(pageStartTex(parts[1]), "\\catcode`\\@=11 \\global\\totalp@ges=15 \\catcode`\\@=12 \\pageno=16\n")
+        # never more parts than asked for, and none too short
+        parts = planParts(pages, bookids, 2)
+        self.assertEqual([p.bookindices for p in parts], [[0, 1, 2], [3]])
+        parts = planParts(pages, bookids, 8)
+        self.assertEqual([p.bookindices for p in parts], [[0], [1, 2], [3]])
+
+    def test_fresh_page(self):
+        # LEV and NUM both start on a page another book ends on, so there is no boundary
+        pages = self.pages([("GEN", 1, 15), ("EXO", 16, 25), ("LEV", 25, 30), ("NUM", 30, 40)])
+        parts = planParts(pages, ["GEN", "EXO", "LEV", "NUM"], 4)
+        self.assertEqual([p.bookindices for p in parts], [[0], [1, 2, 3]])
+        pages = self.pages([("GEN", 1, 15), ("EXO", 15, 25)])
+        self.assertIsNone(planParts(pages, ["GEN", "EXO"], 2))
+
+    def test_nosplit(self):
+        pages = self.pages(layout)
+        bookids = [l[0] for l in layout]
+        self.assertIsNone(planParts(None, bookids, 3))
+        self.assertIsNone(planParts(pages, bookids, 1))
+        self.assertIsNone(planParts(pages, ["GEN"], 3))
+        self.assertIsNone(planParts(pages, bookids + ["DEU"], 3))
+        self.assertIsNone(planParts(pages, bookids + ["MOD"], 3))
+
+    def test_frontmatter(self):
+        pages = self.pages([("FRT", 1, 14), ("MAT", 15, 30), ("MRK", 31, 40)])
+        parts = planParts(pages, ["FRT", "MAT", "MRK"], 3)
+        self.assertEqual([p.bookindices for p in parts], [[0], [1], [2]])
+        # only the pages after the first scripture book carry on from it
+        self.assertEqual([p.pagereset for p in parts], [False, False, True])
+
+def pdfpage(contents):
+    return IndirectPdfDict(Type=PdfName.Page, MediaBox=PdfArray([0, 0, 200, 300]),
+                           Contents=IndirectPdfDict(stream=contents))
+
+def makepdf(fname, numpages, dests, labels, outline):
+    """ Writes a PDF of numpages pages with named destinations (name, page index), page
+        labels (page index, style, prefix) and a flat outline of (title, page index) """
+    pages = [pdfpage("BT /F1 12 Tf 10 10 Td ({} {}) Tj ET".format(os.path.basename(fname), i)) for i in range(numpages)]
+    kids = IndirectPdfDict(Type=PdfName.Pages, Kids=PdfArray(pages), Count=PdfObject(numpages))
+    for p in pages:
+        p.Parent = kids
+    root = IndirectPdfDict(Type=PdfName.Catalog, Pages=kids)
+    if dests:
+        root.Names = PdfDict(Dests=IndirectPdfDict(Names=PdfArray(
+                    [x for n, i in dests for x in (PdfString.encode(n), PdfArray([pages[i], PdfName.Fit]))])))
+    if labels:
+        root.PageLabels = PdfDict(Nums=PdfArray([x for i, s, p in labels
+                    for x in (PdfObject(i), PdfDict(S=PdfName(s), P=PdfString.encode(p)))]))
+    if outline:
+        outlines = IndirectPdfDict(Type=PdfName.Outlines, Count=PdfObject(len(outline)))
+        items = [IndirectPdfDict(Title=PdfString.encode(t), Parent=outlines, Dest=PdfArray([pages[i], PdfName.Fit]))
+                    for t, i in outline]
+        for a, b in zip(items, items[1:]):
+            (a.Next, b.Prev) = (b, a)
+        (outlines.First, outlines.Last) = (items[0], items[-1])
+        root.Outlines = outlines
+    PdfWriter(fname, trailer=PdfDict(Root=root)).write()
+
+class TestStitch(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.inpdfs = [os.path.join(self.tdir, "part{}.pdf".format(i)) for i in range(2)]
+        makepdf(self.inpdfs[0], 3, [("GEN.1.1", 0), ("GEN.2.1", 2)], [(0, "r", ""), (2, "D", "")],
+                [("Genesis", 0)])
+        makepdf(self.inpdfs[1], 2, [("EXO.1.1", 0), ("GEN.2.1", 1)], [(0, "D", "E-")],
+                [("Exodus", 0), ("Exodus 2", 1)])
+        self.outpdf = os.path.join(self.tdir, "out.pdf")
+        PdfWriter(self.outpdf, trailer=stitch_pdfs(self.inpdfs)).write()
+        self.res = PdfReader(self.outpdf)
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def pageindex(self, dest):
+        return [id(p) for p in self.res.pages].index(id(dest[0]))
+
+    def test_pages(self):
+        self.assertEqual(len(self.res.pages), 5)
+        texts = [p.Contents.stream for p in self.res.pages]
+        self.assertEqual(texts, ["BT /F1 12 Tf 10 10 Td (part{}.pdf {}) Tj ET".format(f, i)
+                                    for f, i in ((0, 0), (0, 1), (0, 2), (1, 0), (1, 1))])
+        self.assertEqual(int(self.res.Root.Pages.Count), 5)
+
+    def test_labels(self):
+        nums = self.res.Root.PageLabels.Nums
+        self.assertEqual([int(nums[i]) for i in range(0, len(nums), 2)], [0, 2, 3])
+        self.assertEqual([nums[i].S for i in range(1, len(nums), 2)], ["/r", "/D", "/D"])
+        self.assertEqual(nums[5].P.to_unicode(), "E-")
+
+    def test_outline(self):
+        outlines = self.res.Root.Outlines
+        items = []
+        o = outlines.First
+        while o is not None:
+            items.append((o.Title.to_unicode(), self.pageindex(o.Dest)))
+            self.assertIs(o.Parent, outlines)
+            o = o.Next
+        self.assertEqual(items, [("Genesis", 0), ("Exodus", 3), ("Exodus 2", 4)])
+        self.assertEqual(outlines.Last.Title.to_unicode(), "Exodus 2")
+        self.assertEqual(int(outlines.Count), 3)
+
+    def test_dests(self):
+        names = self.res.Root.Names.Dests.Names
+        dests = {names[i].to_unicode(): self.pageindex(names[i+1]) for i in range(0, len(names), 2)}
+        # the earlier part wins a name both have
+        self.assertEqual(dests, {"GEN.1.1": 0, "GEN.2.1": 2, "EXO.1.1": 3})
+        self.assertEqual([names[i].to_unicode() for i in range(0, len(names), 2)], ["EXO.1.1", "GEN.1.1", "GEN.2.1"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+
+import unittest, os, tempfile, shutil, time
+from unittest.mock import patch
+from ptxprint.utils import cachedBooks, BookCache
+from ptxprint.piclist import FigureIndex, newBase
+
+xrfpath = "../python/lib/ptxprint/xrefs/ubs_gnt.xrf"
+
+def readbooks(inf):
+    """ Groups the lines of an xrf file by the book they are for """
+    res = {}
+    for l in inf.readlines():
+        if "=" in l or not l.strip():
+            continue
+        res.setdefault(l.split(".")[0].strip("{}"), []).append(l.split())
+    return res
+
+class TestBookCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tdir, "cache")
+        self.fpath = os.path.join(self.tdir, "test.xrf")
+        shutil.copy(xrfpath, self.fpath)
+        self.patcher = patch("ptxprint.utils.appdirs.user_cache_dir", return_value=self.cachedir)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.tdir)
+
+    def direct(self):
+        with open(self.fpath, encoding="utf8") as inf:
+            return readbooks(inf)
+
+    def assertSameBooks(self, books, expected):
+        self.assertIsInstance(books, BookCache)
+        self.assertEqual(sorted(books.keys()), sorted(expected.keys()))
+        self.assertEqual(dict(books.items()), expected)
+
+    def test_cache(self):
+        expected = self.direct()
+        self.assertGreater(len(expected), 20)
+        self.assertSameBooks(cachedBooks(self.fpath, readbooks), expected)
+        # read back from the cache file, one book at a time
+        books = cachedBooks(self.fpath, lambda inf: self.fail("should not reread"))
+        self.assertEqual(books.data, {})
+        self.assertEqual(books["JHN"], expected["JHN"])
+        self.assertEqual(list(books.data.keys()), ["JHN"])
+        self.assertIn("ROM", books)
+        self.assertNotIn("XXA", books)
+        self.assertIsNone(books.get("XXA"))
+        self.assertSameBooks(books, expected)
+
+    def test_changed(self):
+        cachedBooks(self.fpath, readbooks)
+        with open(self.fpath, "a", encoding="utf8") as outf:
+            outf.write("\nXXA.1.1 JHN.1.1\n")
+        books = cachedBooks(self.fpath, readbooks)
+        self.assertEqual(books["XXA"], [["XXA.1.1", "JHN.1.1"]])
+        self.assertSameBooks(books, self.direct())
+
+    def test_damaged(self):
+        expected = self.direct()
+        cachedBooks(self.fpath, readbooks)
+        (cfile,) = os.listdir(self.cachedir)
+        cfile = os.path.join(self.cachedir, cfile)
+        size = os.path.getsize(cfile)
+        with open(cfile, "r+b") as outf:
+            outf.seek(size - 200)
+            outf.write(b"\0" * 200)
+        books = cachedBooks(self.fpath, readbooks)
+        self.assertSameBooks(books, expected)
+
+imageexts = ("jpg", "jpeg", "png", "tif", "tiff", "bmp", "pdf")
+
+def images(sources):
+    """ Only the entries getFigureSources can pick, since it skips other extensions """
+    res = {}
+    for nB, files in sources.items():
+        files = [x for x in files if x[1] in imageexts]
+        if len(files):
+            res[nB] = files
+    return res
+
+def oldSources(srchdirs, filt=newBase, recurse=True):
+    """ How getFigureSources found the files in srchdirs before there was an index """
+    res = {}
+    for srchdir in srchdirs:
+        if not recurse:
+            search = [(srchdir, [], os.listdir(srchdir))]
+        else:
+            search = os.walk(srchdir, followlinks=True, topdown=True)
+        for subdir, dirs, files in search:
+            for f in files:
+                doti = f.rfind(".")
+                res.setdefault(filt(f), []).append((os.path.join(subdir, f), f[doti+1:].lower() if doti >= 0 else ""))
+    return res
+
+class TestFigureIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.figs = os.path.join(self.tdir, "figures")
+        self.other = os.path.join(self.tdir, "other")
+        for d, files in ((self.figs, ["CN01684b.jpg", "CO00659B.TIF", "readme"]),
+                         (os.path.join(self.figs, "hires"), ["CN01684b.png", "lb00296c.pdf"]),
+                         (os.path.join(self.figs, "hires", "old"), ["CN01684b.jpg"]),
+                         (self.other, ["WW00123.jpg", "cn01684B.png"])):
+            os.makedirs(d)
+            for f in files:
+                with open(os.path.join(d, f), "w") as outf:
+                    outf.write(f)
+        os.symlink(self.other, os.path.join(self.figs, "linked"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def test_walk(self):
+        index = FigureIndex()
+        old = [(d, files) for d, dirs, files in os.walk(self.figs, followlinks=True)]
+        self.assertEqual(list(index.walk(self.figs)), old)
+        self.assertEqual(list(index.walk(self.figs)), old)
+        self.assertEqual(list(index.walk(self.figs, recurse=False)), old[:1])
+
+    def test_sources(self):
+        index = FigureIndex()
+        for recurse in (True, False):
+            (res, stamps) = index.sources([self.figs, None, self.other], newBase, recurse=recurse)
+            self.assertEqual(images(res), images(oldSources([self.figs, self.other], recurse=recurse)))
+            self.assertTrue(index.current(stamps))
+        self.assertEqual(len(res["cn01684"]), 2)
+
+    def test_changed(self):
+        index = FigureIndex()
+        (res, stamps) = index.sources([self.figs], newBase)
+        time.sleep(0.01)
+        with open(os.path.join(self.figs, "hires", "AB00001.jpg"), "w") as outf:
+            outf.write("new")
+        self.assertFalse(index.current(stamps))
+        (res, stamps) = index.sources([self.figs], newBase)
+        self.assertEqual(images(res), images(oldSources([self.figs])))
+        self.assertIn("ab00001", res)
+        self.assertTrue(index.current(stamps))
+
+    def test_loop(self):
+        # a link back up the tree is only followed once
+        os.symlink(self.figs, os.path.join(self.figs, "hires", "up"))
+        index = FigureIndex()
+        dirs = [d for d, files in index.walk(self.figs)]
+        self.assertEqual(len(dirs), len(set(os.path.realpath(d) for d in dirs)))
+        self.assertEqual(len(dirs), 4)
+
+if __name__ == "__main__":
+    unittest.main()
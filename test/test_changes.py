@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+import unittest, os, tempfile
+import regex
+from ptxprint.changes import RefSpans, readChanges
+from ptxprint.utils import literalPrefix, changePlan, runChanges
+
+testdatpath = "projects/WSGBTpub/44JHNWSGBTpub.SFM"
+
+def oldRunChanges(changes, bk, dat):
+    """ runChanges as it was before changes were planned by book and literal prefix """
+    for c in changes:
+        if c[0] is None:
+            dat = c[1].sub(c[2], dat)
+        elif isinstance(c[0], str):
+            if c[0] == bk:
+                dat = c[1].sub(c[2], dat)
+        else:
+            def simple(s):
+                return c[1].sub(c[2], s)
+            dat = c[0](simple, bk, dat)
+    return dat
+
+def oldAtRegex(chapter, verse=None):
+    """ The regex an at rule used to compile for a chapter or verse """
+    if verse is None:
+        return regex.compile(r"(?<=\\c {}\D).*?(?=$|\\c\s)".format(chapter), flags=regex.S)
+    elif verse == "":
+        return regex.compile(r"(?<=\\c {}\D).*?(?=$|\\[cv]\s)".format(chapter), flags=regex.S)
+    return regex.compile(r"\\c {}\D(?:[^\\]|\\(?!c\s))*?\K\\v {}\D.*?(?=$|\\[cv]\s)".format(chapter, verse),
+                         flags=regex.S|regex.V1)
+
+changesfile = r"""
+"\\nd\s" > "\\+nd "
+in "\\f .*?\\f\*": "Jesus" > "JESUS"
+at JHN 3:16 "loving" > "LOVING"
+at JHN 3 "world" > "WORLD"
+at JHN 1:0 "\\s" > "\\s1"
+at JHN 11:35 'tears' > 'TEARS'
+at MAT 5:3 "Blessed" > "BLESSED"
+at JHN 21:25-26 "books" > "BOOKS"
+"(?i)god" > "GOD"
+"(?<=\s)the(?=\s)" > "THE"
+"xyzzy" > "plugh"
+"(Peter|Simon) said" > "\1 SAID"
+"\\v (\d+) (?=Truly)" > "\\v \1 \u00A0"
+"""
+
+class TestLiteralPrefix(unittest.TestCase):
+
+    def test_prefixes(self):
+        for pat, res in ((r"abc", "abc"), (r"ab?c", "a"), (r"(?:ab)c", "abc"), (r"(ab)c", "abc"),
+                         (r"(a|b)c", ""), (r"(?i)abc", ""), (r"\\v 1\D", "\\v 1"), (r"(?<=x)ab", "ab"),
+                         (r"^\\c 3\b", "\\c 3"), (r"a{1,3}b", ""), (r"\p{L}x", "")):
+            self.assertEqual(literalPrefix(regex.compile(pat, flags=regex.M)), res, pat)
+
+    def test_matches(self):
+        # any text a pattern matches must start with its prefix
+        with open(testdatpath, encoding="utf-8") as inf:
+            dat = inf.read()
+        for pat in (r"\\v 16 ", r"(?:\\v )?(\d+)", r"Jesus(?= )", r"\\f \+ \\fr \d+:\d+", r"(?s)\\c 3.*?\\v 2\D",
+                    r"th[ae]", r"\\(?:nd|w)\s", r"(?<=\\v 3 )\S+"):
+            reg = regex.compile(pat, flags=regex.M)
+            prefix = literalPrefix(reg)
+            for m in reg.finditer(dat):
+                self.assertTrue(m.group(0).startswith(prefix), pat)
+
+class TestRefSpans(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(testdatpath, encoding="utf-8") as inf:
+            cls.dat = inf.read()
+
+    def assertSameSpans(self, s, chapter, verse=None):
+        old = oldAtRegex(chapter, verse)
+        new = RefSpans(chapter, verse)
+        self.assertEqual(new.spans(s), [m.span() for m in old.finditer(s)], f"{chapter}:{verse}")
+        self.assertEqual(new.sub(lambda m: "<" + m.group(0)[:5] + ">", s),
+                         old.sub(lambda m: "<" + m.group(0)[:5] + ">", s), f"{chapter}:{verse}")
+
+    def test_book(self):
+        for c in (1, 2, 3, 11, 21, 22):
+            self.assertSameSpans(self.dat, c)
+            self.assertSameSpans(self.dat, c, "")
+            for v in ("1", "3", "16", "35", "25", "16-17", "99"):
+                self.assertSameSpans(self.dat, c, v)
+
+    def test_edges(self):
+        for s in ("", "\\c 1", "\\c 1\n", "\\c 1 ", "\\c 1 \n", "\\c 1\n\\c 1\n", "\\c 12\n\\v 1 a\n",
+                  "\\c 1\n\\v 1 a\\v 1 b\n\\c 1\n\\v 1 c", "\\c 1\n\\p\n\\v 2 x\n\\c 2\n\\v 1 y\\c 1\\v 1 z",
+                  "\\c 1\n\\v 1\n", "\\c 1\\c 1 \\v 1 q", "\\c 1 \\v 10 a \\v 1 b"):
+            for v in (None, "", "1", "2"):
+                self.assertSameSpans(s, 1, v)
+
+class TestChangePlan(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(testdatpath, encoding="utf-8") as inf:
+            cls.dat = inf.read()
+        with tempfile.TemporaryDirectory() as tdir:
+            fname = os.path.join(tdir, "changes.txt")
+            with open(fname, "w", encoding="utf-8") as outf:
+                outf.write(changesfile)
+            cls.changes = readChanges(fname, "JHN")["default"]
+
+    def test_runchanges(self):
+        for bk in ("JHN", "MAT", None):
+            self.assertEqual(runChanges(self.changes, bk, self.dat), oldRunChanges(self.changes, bk, self.dat), bk)
+        res = runChanges(self.changes, "JHN", self.dat)
+        for s in ("LOVING", "WORLD", "TEARS", "GOD"):
+            self.assertIn(s, res)
+
+    def test_plan(self):
+        plan = changePlan(self.changes)
+        self.assertIs(changePlan(self.changes), plan)
+        for bk in ("JHN", "MAT"):
+            self.assertEqual([c for c, p in plan.forbook(bk)],
+                             [c for c in self.changes if getattr(c[0], "book", None) in (None, bk)])
+        self.assertTrue(any(getattr(c[0], "book", None) == "MAT" for c in self.changes))
+        self.changes.append(self.changes[0])
+        try:
+            self.assertIsNot(changePlan(self.changes), plan)
+        finally:
+            self.changes.pop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+import unittest, os, tempfile, shutil, time
+from types import SimpleNamespace
+import regex
+from ptxprint.texmodel import TexModel
+from ptxprint.changes import readChanges
+from ptxprint.convcache import ConversionCache, ImageCache, TrackingDict, rulesDigest, callableDigest
+from ptxprint.scriptsnippets import mlym
+
+testdatpath = "projects/WSGBTpub/44JHNWSGBTpub.SFM"
+
+def capturing(x):
+    def repl(m):
+        return x
+    return repl
+
+class Model:
+    """ Just enough of a TexModel for conversionDeps """
+    GitVersionStr = "test"
+    conversionDeps = TexModel.conversionDeps
+    rulesDigest = TexModel.rulesDigest
+
+    def __init__(self, cache, changesfile, stylesheet):
+        self.convcache = cache
+        self.changesfiles = [changesfile]
+        self.changes = {"default": readChanges(changesfile, "JHN")["default"]}
+        self.localChanges = []
+        self.ptsettings = {"Encoding": 65001}
+        self._hyphdigest = None
+        sheets = SimpleNamespace(files=[stylesheet])
+        self.printer = SimpleNamespace(hyphenation=None, get_adjlist=lambda bk: None,
+                                       get_usfms=lambda: SimpleNamespace(sheets=sheets))
+
+class TestConversionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tdir, "44JHN.SFM")
+        shutil.copy(testdatpath, self.source)
+        self.changesfile = os.path.join(self.tdir, "changes.txt")
+        self.write(self.changesfile, '"Jesus" > "JESUS"\n')
+        self.stylesheet = os.path.join(self.tdir, "custom.sty")
+        self.write(self.stylesheet, "\\Marker p\n\\FirstLineIndent 0.5\n")
+        self.settings = TrackingDict({"paragraph/linespacing": "14", "document/toc": True})
+        self.cache = ConversionCache(os.path.join(self.tdir, "cache"))
+        self.outfpath = os.path.join(self.tdir, "out.usfm")
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def write(self, fpath, txt, mode="w"):
+        with open(fpath, mode, encoding="utf-8") as outf:
+            outf.write(txt)
+        # so a rewrite in the same tick still looks like a new file
+        st = os.stat(fpath)
+        os.utime(fpath, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+    def convert(self, model=None):
+        """ Returns True if the conversion came from the cache, else converts and stores it """
+        if model is None:
+            model = Model(self.cache, self.changesfile, self.stylesheet)
+        deps = model.conversionDeps("JHN", self.source)
+        if self.cache.fetch("JHN-test", deps, self.settings, self.outfpath) is not None:
+            return True
+        self.settings.track()
+        self.settings.get("paragraph/linespacing")
+        with open(self.source, encoding="utf-8") as inf:
+            dat = inf.read()
+        with open(self.outfpath, "w", encoding="utf-8") as outf:
+            outf.write(dat)
+        self.cache.store("JHN-test", deps, self.settings, self.settings.track(False), self.outfpath)
+        return False
+
+    def test_unchanged(self):
+        self.assertFalse(self.convert())
+        self.assertTrue(self.convert())
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        with open(self.outfpath, encoding="utf-8") as inf, open(self.source, encoding="utf-8") as sinf:
+            self.assertEqual(inf.read(), sinf.read())
+
+    def test_changesfile(self):
+        self.convert()
+        self.write(self.changesfile, '"Jesus" > "JESU"\n')
+        self.assertFalse(self.convert())
+        self.assertTrue(self.convert())
+
+    def test_stylesheet(self):
+        self.convert()
+        self.write(self.stylesheet, "\\Marker p\n\\FirstLineIndent 0.25\n")
+        self.assertFalse(self.convert())
+        self.assertTrue(self.convert())
+
+    def test_settings(self):
+        self.convert()
+        self.settings["document/toc"] = False       # not read by the conversion
+        self.assertTrue(self.convert())
+        self.settings["paragraph/linespacing"] = "12"
+        self.assertFalse(self.convert())
+        self.assertTrue(self.convert())
+
+    def test_source(self):
+        self.convert()
+        self.write(self.source, "\\rem changed\n", mode="a")
+        self.assertFalse(self.convert())
+        self.assertTrue(self.convert())
+
+    def test_encoding(self):
+        self.convert()
+        model = Model(self.cache, self.changesfile, self.stylesheet)
+        model.ptsettings["Encoding"] = 1252
+        self.assertFalse(self.convert(model))
+
+    def test_rules(self):
+        model = Model(self.cache, self.changesfile, self.stylesheet)
+        model.localChanges = [(None, regex.compile("Jesus"), capturing("JESUS"), "test")]
+        self.assertFalse(self.convert(model))
+        self.assertTrue(self.convert(model))
+        model.localChanges = [(None, regex.compile("Jesus"), capturing("Jesu"), "test")]
+        self.assertFalse(self.convert(model))
+
+class TestRulesDigest(unittest.TestCase):
+
+    def test_callables(self):
+        self.assertEqual(callableDigest(capturing("a")), callableDigest(capturing("a")))
+        self.assertNotEqual(callableDigest(capturing("a")), callableDigest(capturing("b")))
+        self.assertIsNone(callableDigest(capturing(object())))
+        self.assertIsNone(callableDigest(len))
+        reg = regex.compile("a")
+        self.assertIsNone(rulesDigest([(None, reg, capturing(object()), "test")]))
+        self.assertIsNotNone(rulesDigest([(None, reg, capturing(reg), "test")]))
+
+    def test_snippets(self):
+        plain = mlym.regexes({"c_scrindicSyllable": True})
+        shown = mlym.regexes({"c_scrindicSyllable": True, "c_scrindicshowhyphen": True})
+        self.assertIsNotNone(rulesDigest(plain))
+        self.assertNotEqual(rulesDigest(plain), rulesDigest(shown))
+
+    def test_contexts(self):
+        # closures made by readChanges for at and in rules carry their book and regexes
+        with tempfile.TemporaryDirectory() as tdir:
+            fname = os.path.join(tdir, "changes.txt")
+            digests = []
+            for rule in ('at JHN 3:16 "a" > "b"', 'at JHN 3:17 "a" > "b"', 'at MAT 3:16 "a" > "b"',
+                         'in "\\\\f .*?\\\\f\\*": "a" > "b"', 'in "\\\\x .*?\\\\x\\*": "a" > "b"'):
+                with open(fname, "w", encoding="utf-8") as outf:
+                    outf.write(rule + "\n")
+                changes = readChanges(fname, "JHN")["default"]
+                self.assertFalse(isinstance(changes[0][0], str), rule)
+                digests.append(rulesDigest(changes))
+            self.assertNotIn(None, digests)
+            self.assertEqual(len(set(digests)), len(digests))
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tdir, "cache")
+        self.pics = {}
+        for n in ("a", "b", "c"):
+            src = os.path.join(self.tdir, n + ".png")
+            with open(src, "w") as outf:
+                outf.write(n)
+            self.pics[n] = src
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def convert(self, cache, n):
+        """ Returns True if the picture came from the cache, else makes and stores it """
+        key = cache.key(self.pics[n], "jpg", 0.5)
+        tgt = os.path.join(self.tdir, n + ".jpg")
+        if cache.fetch(key, tgt):
+            return True
+        if os.path.exists(tgt):
+            os.remove(tgt)
+        with open(tgt, "w") as outf:
+            outf.write(n + " converted")
+        cache.store(key, tgt)
+        return False
+
+    def test_prune(self):
+        cache = ImageCache(self.cachedir)
+        self.assertEqual([self.convert(cache, n) for n in "abc"], [False] * 3)
+        self.assertEqual(cache.prune(), 0)
+        # the next job only uses two of the pictures, one of them changed
+        with open(self.pics["c"], "w") as outf:
+            outf.write("c changed")
+        cache = ImageCache(self.cachedir)
+        self.assertEqual([self.convert(cache, n) for n in "ac"], [True, False])
+        self.assertEqual(len(os.listdir(self.cachedir)), 4)
+        self.assertEqual(cache.prune(), 2)
+        self.assertEqual(len(os.listdir(self.cachedir)), 2)
+        cache = ImageCache(self.cachedir)
+        self.assertEqual([self.convert(cache, n) for n in "abc"], [True, False, True])
+        with open(os.path.join(self.tdir, "a.jpg")) as inf:
+            self.assertEqual(inf.read(), "a converted")
+        self.assertEqual(ImageCache(os.path.join(self.tdir, "none")).prune(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
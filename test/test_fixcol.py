@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+import unittest, re
+from ptxprint.pdfrw import PdfReader, PdfTokens, PdfArray, PdfDict, PdfObject, PdfString
+from ptxprint.pdfrw.objects.pdfname import BasePdfName
+from ptxprint.pdf.fixcol import PdfStreamParser
+
+testpdf = "standards/minitests/minitests_Default_GEN-GLO_ptxp.pdf"
+
+def parsestrtok(s):
+    if not isinstance(s, str):
+        return s
+    return PdfObject(s)
+
+def oldParsestream(self, rdr, strm, **kw):
+    """ parsestream as it was when it ran every token through PdfTokens """
+    self.kw = kw
+    res = []
+    operands = []
+    toks = PdfTokens(strm)
+    for t in toks:
+        func = rdr.special.get(t)
+        if func is not None:
+            val = func(toks)
+            if isinstance(val, PdfArray):
+                val = PdfArray([parsestrtok(x) for x in val])
+            elif isinstance(val, PdfDict):
+                val = PdfDict({k: parsestrtok(v) for k, v in val.items()})
+            operands.append(val)
+        elif isinstance(t, (PdfString, BasePdfName)):
+            operands.append(t)
+        elif re.match(r"^[+-]?(\d+(\.\d*)?|\.\d+)", t):
+            operands.append(t)
+        elif t in ("true", "false", "null"):
+            operands.append(t)
+        else:       # must be an operator
+            fn = getattr(self, self.opmap.get(t, t), None)
+            if fn is None:
+                res.append(" ".join(str(x) for x in (operands + [t])))
+            else:
+                res.append(" ".join(fn(t, operands, **kw)))
+            operands = []
+    return "\r\n".join(res)
+
+class Recorder(PdfStreamParser):
+    """ Records the operands of the colour operators and rewrites them """
+    opmap = {'RG': 'rg', 'G': 'g', 'K': 'k'}
+
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+
+    def rg(self, op, operands, **kw):
+        self.seen.append((op, [str(x) for x in operands]))
+        return ["{:.2f}".format(1 - float(x)) for x in operands] + [op]
+
+    def g(self, op, operands, **kw):
+        return self.rg(op, operands, **kw)
+
+    def k(self, op, operands, **kw):
+        self.seen.append((op, [str(x) for x in operands]))
+        return [str(x) for x in operands[:3]] + ["0", op]
+
+    def gs(self, op, operands, **kw):
+        self.seen.append((op, [str(x) for x in operands]))
+        return [str(operands[0]) + "x", op]
+
+streams = [
+    "q 1 0 0 RG 0.5 g BT /F1 12 Tf (Hello) Tj ET Q",
+    # strings with escapes and nested brackets, which must not be taken as operators
+    r"BT (a \(1 0 0 rg\) b) Tj (nested (0 0 1 rg (deep)) text) Tj (back\\) Tj 0 1 0 rg (\)) Tj ET",
+    r"(\\\)rg) Tj (\061\062 k) Tj 0.2 0.3 0.4 0.5 k [(A) -120 (B\)) 30 (C)] TJ",
+    # hex strings and dictionaries
+    "<48656C6C6F> Tj <4 8 6 5> Tj /P <</MCID 3 /Alt (x rg) >> BDC 1 1 0 rg EMC <> Tj 0 0 0 RG",
+    # comments, with operators in them that must be ignored
+    "% 1 0 0 rg\n0 0 1 rg % a comment (with a bracket\n/GS1 gs %end\n 1 0 0 1 10 20 cm\r\n0.25 G",
+    # inline images, whose data must be skipped
+    "q 10 0 0 10 0 0 cm BI /W 2 /H 2 /CS /G /BPC 8 /F /AHx ID 00FF rg 7F80 > EI Q 1 0 0 rg",
+    "BI /W 4 /H 1 /BPC 8 /CS /RGB ID \x01\x02rg\x03 0 g 1 K (\xff EI 0.5 g",
+    # arrays of operands and numbers in all their forms
+    "[1 2] 0 d -.5 +1. 0.0 rg [/Pattern /CS0] 0 cs .1 .2 .3 RG true null false 1 Tz",
+    "/GS2 gs 0 0 0 1 K 1 0 0 0 k /Span <</ActualText <FEFF0041>>> BDC (A) Tj EMC",
+    ""
+]
+
+def tokens(strm):
+    return [str(t) for t in PdfTokens(strm)]
+
+class TestParseStream(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rdr = PdfReader(testpdf)
+
+    def assertSameParse(self, strm):
+        old = Recorder()
+        oldres = oldParsestream(old, self.rdr, strm)
+        new = Recorder()
+        newres = new.parsestream(self.rdr, strm)
+        self.assertEqual(new.seen, old.seen, strm)
+        self.assertEqual(tokens(newres), tokens(oldres), strm)
+        return new
+
+    def test_streams(self):
+        for s in streams:
+            if "BI" not in s:       # see test_inlineimages
+                self.assertSameParse(s)
+
+    def test_operators(self):
+        new = self.assertSameParse(streams[1])
+        self.assertEqual(new.seen, [("rg", ["0", "1", "0"])])
+        new = self.assertSameParse(streams[4])
+        self.assertEqual([s[0] for s in new.seen], ["rg", "gs", "G"])
+        new = self.assertSameParse(streams[7])
+        self.assertEqual(new.seen, [("rg", ["-.5", "+1.", "0.0"]), ("RG", [".1", ".2", ".3"])])
+
+    def test_untouched(self):
+        # anything that is not a handled operator is left exactly as it was
+        for s in streams:
+            self.assertEqual(PdfStreamParser().parsestream(self.rdr, s), s)
+        self.assertEqual(Recorder().parsestream(self.rdr, streams[1]),
+                         streams[1].replace("0 1 0 rg", "1.00 0.00 1.00 rg"))
+
+    def test_inlineimages(self):
+        # the old tokenizer took operators out of the image data, so there is nothing to
+        # compare with. The data must be passed through whole and only the operators
+        # around it seen.
+        new = Recorder()
+        res = new.parsestream(self.rdr, streams[5])
+        self.assertEqual(new.seen, [("rg", ["1", "0", "0"])])
+        self.assertIn("ID 00FF rg 7F80 > EI Q", res)
+        new = Recorder()
+        res = new.parsestream(self.rdr, streams[6])
+        self.assertEqual(new.seen, [("g", ["0.5"])])
+        self.assertTrue(res.startswith("BI /W 4 /H 1 /BPC 8 /CS /RGB ID \x01\x02rg\x03 0 g 1 K (\xff EI "))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+import unittest, os, tempfile, shutil
+from ptxprint.rerun import RerunPlanner, TocAux, ParlocsAux, MarginNotesAux, PicPagesAux, \
+        LAYOUT, VALUES, INERT
+
+def tocline(bk, title, page):
+    return "\\doTOCline{{{}}}{{{}}}{{}}{{{}}}{{{}}}".format(bk, title, bk[:3], page)
+
+toc = [tocline("GEN", "Genesis", 1), tocline("EXO", "Exodus", 9), tocline("LEV", "Leviticus", 97)]
+
+parlocs = [r"\@pgstart{1}{1}{48000000}{25000000}",
+           r"\@colstart{0}{1}{L}{30000000}{20000000}",
+           r"\@parlines{12}",
+           r"\@pgstart{2}{2}{48000000}{25000000}"]
+
+delayed = [r"\ParPos{p}{GEN1.1}{2}",
+           r"\DelayedItem{chapter}{GEN2.0}{1}{2}",
+           r"\HistoricDelays{GEN2.0}{1}{2}{1}"]
+
+def desc(planner, ext):
+    return [a.desc for a in planner.auxfiles if a.ext == ext][0]
+
+class TestRerunPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.basepath = os.path.join(self.tdir, "ptxprint-test")
+        self.writeall(toc, parlocs, delayed, ["mnote 1"], ["pic 1"])
+
+    def tearDown(self):
+        shutil.rmtree(self.tdir)
+
+    def write(self, ext, lines):
+        with open(self.basepath + "." + ext, "w", encoding="utf-8") as outf:
+            outf.write("\n".join(lines) + "\n")
+
+    def writeall(self, tocl, parl, dell, mnotes, picpages):
+        for ext, lines in (("toc", tocl), ("parlocs", parl), ("delayed", dell),
+                           ("marginnotes", mnotes), ("picpages", picpages)):
+            self.write(ext, lines)
+
+    def planner(self):
+        res = RerunPlanner(self.basepath)
+        res.startrun()
+        return res
+
+    def test_nochange(self):
+        planner = self.planner()
+        self.assertEqual(planner.endrun(), (False, []))
+        self.assertEqual(planner.runs[-1]["changes"], [])
+        self.assertIsNone(planner.rerunmessage())
+
+    def test_toc_pages(self):
+        planner = self.planner()
+        self.write("toc", toc[:2] + [tocline("LEV", "Leviticus", 98)])
+        self.assertEqual(planner.endrun(), (True, []))
+        self.assertEqual([(c.ext, c.kind) for c in planner.runs[-1]["changes"]], [("toc", VALUES)])
+        self.assertFalse(planner.runs[-1]["layout"])
+        self.assertIn(desc(planner, "toc"), planner.rerunmessage())
+        # the rerun was only for values, so it is expected to be the last
+        planner.startrun()
+        self.assertEqual(planner.endrun(), (False, []))
+        self.assertTrue(planner.runs[-1]["predicted"])
+
+    def test_toc_layout(self):
+        planner = self.planner()
+        self.write("toc", toc[:2] + [tocline("LEV", "Leviticus", 101)])
+        self.assertEqual(planner.endrun(), (True, []))
+        self.assertEqual(planner.runs[-1]["changes"][0].kind, LAYOUT)
+        self.assertTrue(planner.runs[-1]["layout"])
+        planner.startrun()
+        self.write("toc", toc + [tocline("NUM", "Numbers", 130)])
+        self.assertTrue(planner.endrun()[0])
+        self.assertNotIn("predicted", planner.runs[-1])
+
+    def test_parlocs_moved(self):
+        # positions moving without the delayed settings changing does not call for a rerun
+        planner = self.planner()
+        self.write("parlocs", parlocs[:2] + [r"\@parlines{13}"] + parlocs[3:])
+        self.write("delayed", delayed[:2] + [r"\HistoricDelays{GEN2.0}{2}{2}{1,1}"])
+        self.assertEqual(planner.endrun(), (False, []))
+        self.assertEqual([(c.ext, c.kind) for c in planner.runs[-1]["changes"]], [("parlocs", INERT)])
+
+    def test_delayed_changed(self):
+        planner = self.planner()
+        self.write("delayed", delayed[:1] + [r"\DelayedItem{chapter}{GEN2.0}{2}{2}"] + delayed[2:])
+        self.assertEqual(planner.endrun(), (True, []))
+        self.assertEqual(planner.runs[-1]["triggers"], ["parlocs"])
+        self.assertTrue(planner.runs[-1]["layout"])
+
+    def test_delayed_rerun(self):
+        planner = self.planner()
+        self.write("delayed", delayed + [r"\Rerun{GEN2.0}{T}{Position changed}"])
+        self.assertEqual(planner.endrun(), (True, []))
+        self.assertEqual(planner.runs[-1]["triggers"], ["delayed"])
+        self.assertEqual(planner.rerunmessage(), "Rerunning because the delayed file asked us to")
+        # it asks again while the request is still there
+        planner.startrun()
+        self.assertTrue(planner.endrun()[0])
+        self.assertEqual(planner.runs[-1]["triggers"], ["delayed"])
+
+    def test_marginnotes(self):
+        planner = self.planner()
+        self.write("marginnotes", ["mnote 2"])
+        self.assertEqual(planner.endrun(), (True, []))
+        self.assertEqual(planner.runs[-1]["changes"][0].kind, VALUES)
+        planner.startrun()
+        self.assertEqual(planner.endrun(tidied=True), (True, []))
+        self.assertEqual(planner.runs[-1]["triggers"], ["tidied"])
+
+    def test_picpages(self):
+        # image copyrights changing is reported but never reruns
+        planner = self.planner()
+        self.write("picpages", ["pic 2"])
+        self.assertEqual(planner.endrun(), (False, [desc(planner, "picpages")]))
+
+    def test_maxruns(self):
+        planner = self.planner()
+        self.write("toc", toc[:2] + [tocline("LEV", "Leviticus", 98)])
+        self.write("delayed", delayed + [r"\Rerun{GEN2.0}{T}{Position changed}"])
+        self.assertEqual(planner.endrun(logrerun=True, final=True), (False, [desc(planner, "toc")]))
+        self.assertEqual(planner.runs[-1]["triggers"], ["log", "delayed"])
+        self.assertFalse(planner.runs[-1]["rerun"])
+
+    def test_ignore(self):
+        planner = RerunPlanner(self.basepath, ignore=("toc",))
+        planner.startrun()
+        self.write("toc", [])
+        self.assertEqual(planner.endrun(), (False, []))
+
+    def test_summary(self):
+        planner = self.planner()
+        self.write("toc", toc[:2])
+        planner.endrun()
+        planner.startrun()
+        planner.endrun()
+        summary = planner.summary()
+        self.assertEqual(len(summary), 2)
+        self.assertIn("toc (layout: 2 entries, was 3)", summary[0])
+        self.assertTrue(summary[1].endswith("nothing changed"))
+
+class TestAuxFiles(unittest.TestCase):
+
+    def test_toc(self):
+        aux = TocAux("toc")
+        old = aux.parse("\n".join(toc))
+        self.assertEqual(len(old), 3)
+        self.assertIsNone(aux.compare(old, aux.parse("\n".join(toc) + "\n\\relax\n")))
+        self.assertEqual(aux.compare(old, aux.parse("\n".join(toc[:2] + [tocline("LEV", "Leviticus", 96)])))[0], VALUES)
+        self.assertEqual(aux.compare(old, aux.parse("\n".join(toc[:2] + [tocline("LEV", "Leviticus", 100)])))[0], LAYOUT)
+        self.assertEqual(aux.compare(old, aux.parse("\n".join(toc[:2] + [tocline("LEV", "Levitikus", 97)])))[0], LAYOUT)
+
+    def test_parlocs(self):
+        aux = ParlocsAux("parlocs")
+        old = (parlocs, aux.parsedelayed("\n".join(delayed)))
+        self.assertNotIn(delayed[2], old[1])
+        newdelayed = aux.parsedelayed("\n".join(delayed[:2] + [r"\HistoricDelays{GEN2.0}{5}{2}{1}", r"\Rerun{GEN2.0}{F}{Need RaiseItem}"]))
+        self.assertIsNone(aux.compare(old, (parlocs, newdelayed)))
+        self.assertEqual(aux.compare(old, (parlocs[:3], newdelayed))[0], INERT)
+        newdelayed = aux.parsedelayed("\n".join(delayed + [r"\RaiseItem{GEN2.0}{2}{1}"]))
+        self.assertEqual(aux.compare(old, (parlocs, newdelayed))[0], LAYOUT)
+
+    def test_lines(self):
+        for cls in (MarginNotesAux, PicPagesAux):
+            aux = cls("test")
+            old = aux.parse("a\nb\n\n")
+            self.assertIsNone(aux.compare(old, aux.parse("a\nb")))
+            self.assertEqual(aux.compare(old, aux.parse("a\nc\nd")), (VALUES, "2 lines differ"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+import unittest, random, re
+from ptxprint import scriptsnippets
+from ptxprint.utils import runChanges
+
+scripts = ("mlym", "taml", "sinh", "telu", "knda", "orya")
+
+def chars(spec):
+    """ The characters in a regex character class body of \\u escapes and ranges """
+    res = []
+    for a, b in re.findall(r"\\u(....)(?:-\\u(....))?", spec):
+        res.extend(chr(x) for x in range(int(a, 16), int(b or a, 16) + 1))
+    return res
+
+def oldChanges(changes):
+    """ The changes indicSyls gave before syllables were broken a word at a time:
+        each rule applied in turn to the whole of every body line """
+    res = []
+    for c in changes:
+        if isinstance(c[2], scriptsnippets.Syllabifier):
+            res.extend((c[0], r, t, c[3]) for r, t in c[2].rules)
+        else:
+            res.append(c)
+    return res
+
+class TestSyllabifier(unittest.TestCase):
+
+    def lines(self, rng, cls, num=500):
+        pool = chars(cls.wordChars) + chars(cls.cons) * 3 + chars(cls.matras) + chars(cls.viramas) \
+                + ["‌", "‍", "̤", "=", "​", "­", "ൺ", "്", "ന"]
+        seps = [" ", " ", ",", "\\", "-", "a", "(", "ക"]
+        res = []
+        for i in range(num):
+            l = rng.choice(["", "\\v 3 ", "\\id GEN ", "\\h ", "\\p ", "\\w "])
+            for w in range(rng.randint(0, 8)):
+                l += "".join(rng.choice(pool) for j in range(rng.randint(1, 9))) + rng.choice(seps)
+            res.append(l.rstrip() if rng.random() < 0.5 else l)
+        return res
+
+    def test_scripts(self):
+        rng = random.Random(22)
+        for s in scripts:
+            cls = getattr(scriptsnippets, s)
+            for show in (False, True):
+                changes = cls.regexes({"c_scrindicSyllable": True, "c_scrindicshowhyphen": show})
+                self.assertTrue(any(isinstance(c[2], scriptsnippets.Syllabifier) for c in changes), s)
+                old = oldChanges(changes)
+                text = "\n".join(self.lines(rng, cls))
+                for a, b in zip(runChanges(changes, "GEN", text).split("\n"), runChanges(old, "GEN", text).split("\n")):
+                    self.assertEqual(a, b, f"{s} {show}")
+
+    def test_words(self):
+        changes = scriptsnippets.mlym.regexes({"c_scrindicSyllable": True, "c_scrindicshowhyphen": True})
+        old = oldChanges(changes)
+        for s in ("മലയാളം", "\\p മലയാളം മലയാളം.", "\\id GEN മലയാളം", "abc", "", "\\v 1 അവൻ്‍ ആൺകുട്ടി"):
+            self.assertEqual(runChanges(changes, None, s), runChanges(old, None, s), s)
+        self.assertIn("­", runChanges(changes, None, "\\p മലയാളം"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+import unittest, random, re, string
+from ptxprint.texlog import messages, runawaymsgs, summarizeTexLog, summarizeTexLogByPattern, \
+        LogMonitor, _literal, _scanpatterns
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse, sre_constants
+
+_categories = {sre_constants.CATEGORY_DIGIT: "7", sre_constants.CATEGORY_WORD: "w",
+               sre_constants.CATEGORY_SPACE: " ", sre_constants.CATEGORY_NOT_SPACE: "x"}
+
+def _inset(items, c):
+    for op, av in items:
+        if op is sre_constants.LITERAL and chr(av) == c:
+            return True
+        if op is sre_constants.RANGE and av[0] <= ord(c) <= av[1]:
+            return True
+        if op is sre_constants.CATEGORY and _categories.get(av) == c:
+            return True
+    return False
+
+def sample(items, rng):
+    """ Returns some text that the parsed pattern items match """
+    res = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            res.append(chr(av))
+        elif op is sre_constants.NOT_LITERAL:
+            res.append("x" if av != ord("x") else "y")
+        elif op is sre_constants.ANY:
+            res.append(rng.choice("abc1 "))
+        elif op is sre_constants.IN:
+            if av[0][0] is sre_constants.NEGATE:
+                res.append(next(c for c in "xq7 ." + string.printable if not _inset(av[1:], c)))
+            else:
+                res.append(next(c for c in "".join(_categories.values()) + string.printable if _inset(av, c)))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            (lo, hi, sub) = av
+            for i in range(rng.randint(lo, min(hi, lo + 3))):
+                res.append(sample(sub, rng))
+        elif op is sre_constants.SUBPATTERN:
+            res.append(sample(av[-1], rng))
+        elif op is sre_constants.BRANCH:
+            res.append(sample(rng.choice(av[1]), rng))
+        elif op is sre_constants.AT:
+            continue
+        else:
+            raise ValueError(f"Can't make a sample for {op}")
+    return "".join(res)
+
+def samples(pattern, rng, num=5):
+    parsed = sre_parse.parse(pattern)
+    return [sample(parsed, rng) for i in range(num)]
+
+class TestLogScan(unittest.TestCase):
+
+    def test_literal(self):
+        # the text a pattern is looked for by must be in everything it matches
+        rng = random.Random(15)
+        for p in _scanpatterns:
+            lit = _literal(p)
+            for s in samples(p, rng):
+                self.assertIsNotNone(re.fullmatch(p, s), f"{p}: {s}")
+                if lit is not None:
+                    self.assertIn(lit, s, p)
+        self.assertEqual(_literal(r"Cannot re-use undefined variable .+"), "Cannot re-use undefined variable ")
+        self.assertEqual(_literal(r"Fractional part (\S*) of paragraph skip"), " of paragraph skip")
+        self.assertEqual(_literal(r"a+bcdefg?"), "bcdef")
+        self.assertIsNone(_literal(r"Rotating spine\s(anti clockwise|clockwise)|x"))
+
+    def test_summary(self):
+        # summarizeTexLog must find what matching every pattern over the whole log does
+        rng = random.Random(150)
+        lines = []
+        for i in range(4):
+            for _, _, p in messages:
+                for s in samples(p, rng, num=2):
+                    lines.append(rng.choice(["", "l.123 ", "[12] ", "(./41MATWSG.SFM "]) + s
+                                 + rng.choice(["", " [13]", ")", "\n\n"]))
+            lines.append("Underfill[A]: [{}] xyz".format(rng.randint(1, 40)))
+            lines.extend("Overfull \\hbox ({}pt too wide)".format(j) for j in range(20))
+        rng.shuffle(lines)
+        log = "\n".join(lines)
+        self.assertEqual(summarizeTexLog(log), summarizeTexLogByPattern(log))
+        self.assertEqual(summarizeTexLog(""), summarizeTexLogByPattern(""))
+
+class TestLogMonitor(unittest.TestCase):
+
+    def output(self, rng):
+        """ Returns (terminal output, pages shipped, message counts) """
+        msgs = []
+        for _, _, p in messages:
+            if "\\s" in p or "(?s)" in p or p in runawaymsgs:
+                continue
+            s = samples(p, rng, num=1)[0]
+            if sum(1 for _, _, q in messages if re.search(q, s)) == 1 and "[" not in s and "(" not in s:
+                msgs.append(s)
+        out = ["This is XeTeX, Version 3.141592653-2.6-0.999995 (TeX Live 2023)", "(./test.tex"]
+        pages = 0
+        for bk in ("41MAT", "42MRK"):
+            out.append(f"(./{bk}WSG-Default.SFM")
+            for i in range(30):
+                page = "[{}]".format(pages + 1)
+                pages += 1
+                out.append(rng.choice(["", "Overfull \\hbox in paragraph ", "l.12 \\p "]) + page)
+                if rng.random() < 0.5:
+                    out.append(rng.choice(msgs))
+        out.append(") )\nOutput written on test.xdv ({} pages).".format(pages))
+        text = "\n".join(out) + "\n"
+        counts = {"I": 0, "W": 0, "E": 0}
+        for c, n in summarizeTexLogByPattern(text)[0].items():
+            counts[c] += n
+        return (text, pages, counts)
+
+    def test_chunks(self):
+        rng = random.Random(14)
+        (text, pages, counts) = self.output(rng)
+        whole = LogMonitor()
+        whole.feed(text)
+        whole.close()
+        for i in range(20):
+            mon = LogMonitor()
+            pos = 0
+            while pos < len(text):
+                n = rng.randint(1, 60)
+                mon.feed(text[pos:pos+n])
+                pos += n
+            mon.close()
+            self.assertEqual((mon.pages, mon.pageno, mon.book, mon.counts, mon.seen),
+                             (whole.pages, whole.pageno, whole.book, whole.counts, whole.seen))
+        self.assertEqual(whole.pages, pages)
+        self.assertEqual(whole.book, "MRK")
+        self.assertEqual(whole.counts, counts)
+        self.assertIsNone(whole.abort)
+
+    def test_progress(self):
+        seen = []
+        mon = LogMonitor(progress=lambda m: seen.append((m.book, m.pageno)))
+        mon.feed("(./41MATWSG.SFM [1] [2")
+        self.assertEqual(seen, [("MAT", "1")])
+        mon.feed("] [3]\n")
+        self.assertEqual((seen[-1], mon.pages), (("MAT", "3"), 3))
+        mon.feed("Missing figure: [4]\n(./42MRKWSG.SFM\n")
+        self.assertEqual((seen[-1], mon.pages), (("MRK", "3"), 3))
+
+    def test_runaway(self):
+        mon = LogMonitor(maxpages=10)
+        for i in range(11):
+            mon.feed("[{}]\n".format(i+1))
+        self.assertIsNotNone(mon.abort)
+        mon = LogMonitor(repeats=5)
+        for i in range(4):
+            self.assertIsNone(mon.feed("No space for text on page!\n"))
+        self.assertIsNotNone(mon.feed("No space for text on page!\n"))
+
+if __name__ == "__main__":
+    unittest.main()
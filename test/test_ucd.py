@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+import unittest, unicodedata, random
+from ptxprint.unicode.ucd import normal_ucd, get_ucd
+
+def defined(cp):
+    """ Only test characters known to both our data and python's """
+    return unicodedata.category(chr(cp)) != "Cn" and get_ucd(cp, "gc") != ""
+
+class TestNormalization(unittest.TestCase):
+
+    forms = ("NFD", "NFC", "NFKD", "NFKC")
+
+    def assertNormal(self, txt):
+        for f in self.forms:
+            self.assertEqual(normal_ucd(txt, f), unicodedata.normalize(f, txt),
+                             f"{f} of {' '.join('{:04X}'.format(ord(c)) for c in txt)}")
+
+    def test_hangul(self):
+        self.assertEqual(normal_ucd("한국어", "NFD"), unicodedata.normalize("NFD", "한국어"))
+        for txt in ("한국어", "가힣", "각", "ᄀ", "가", "각",
+                    "힣́"):
+            self.assertNormal(txt)
+        for cp in range(0xAC00, 0xD7A4, 37):
+            self.assertNormal(chr(cp))
+
+    def test_exclusions(self):
+        # composition exclusions, singletons and non-starter decompositions
+        for txt in ("क़", "क़", "̈́", "̈́", "ཱི", "Å", "Ω",
+                    "ʹ", "ä́", "Ḍ̇", "Ạ̊", "Ǻ", "ẛ̣"):
+            self.assertNormal(txt)
+
+    def test_sample(self):
+        rng = random.Random(6)
+        cps = [cp for cp in rng.sample(range(0x20, 0x30000), 8000) if not 0xD800 <= cp < 0xE000 and defined(cp)]
+        for cp in cps:
+            self.assertNormal(chr(cp) + rng.choice(["", "́", "̣́", "̣́", "a"]))
+
+if __name__ == "__main__":
+    unittest.main()
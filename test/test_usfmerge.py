@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+import unittest, difflib, random
+from ptxprint.usfmerge import keyOpcodes
+
+def chapters(rng, numchaps, numverses, poetry=False):
+    """ Chunk keys as usfmerge makes them, with poetry having several lines in a verse """
+    res = []
+    for c in range(1, numchaps+1):
+        for v in range(1, numverses+1):
+            if v == 1 or rng.random() < 0.1:
+                res.append(f"Heading_{c}_{v}")
+            res.extend([f"Para_{c}_{v}"] * (rng.choice([1, 2, 2, 3, 4]) if poetry else 1))
+            if rng.random() < 0.05:
+                res.append(f"Note_{c}_{v}")
+    return res
+
+def variant(rng, keys):
+    """ Drops some keys and splits others, as another translation might """
+    res = []
+    for k in keys:
+        r = rng.random()
+        if r < 0.08:
+            continue
+        res.append(k)
+        if r > 0.93:
+            res.append("Para" + k[k.index("_"):])
+    return res
+
+def matched(ops):
+    return [(a+i, b+i) for (action, a, ae, b, be) in ops if action == "equal" for i in range(ae-a)]
+
+class TestKeyOpcodes(unittest.TestCase):
+
+    def assertSameAsDifflib(self, akeys, bkeys):
+        expected = difflib.SequenceMatcher(None, akeys, bkeys).get_opcodes()
+        res = keyOpcodes(akeys, bkeys)
+        self.assertEqual(matched(res), matched(expected))
+        self.assertEqual(res, expected)
+
+    def test_repeated(self):
+        self.assertSameAsDifflib(["Heading_1_1", "Para_1_1", "Para_1_1", "Heading_1_2", "Para_1_2", "Para_1_3"],
+                                 ["Para_1_1", "Heading_1_2", "Para_1_2", "Para_1_3"])
+        self.assertSameAsDifflib(["Para_1_1", "Note_1_1", "Para_1_2"], ["Note_1_1", "Para_1_1", "Para_1_2"])
+        self.assertSameAsDifflib([], ["Para_1_1"])
+        self.assertSameAsDifflib(["Para_1_1"], [])
+
+    def test_prose(self):
+        rng = random.Random(16)
+        for i in range(200):
+            akeys = chapters(rng, rng.randint(1, 3), rng.randint(3, 30))
+            bkeys = variant(rng, akeys) if i % 3 else chapters(rng, rng.randint(1, 3), rng.randint(3, 30))
+            self.assertSameAsDifflib(akeys, bkeys)
+
+    def test_poetry(self):
+        rng = random.Random(61)
+        for i in range(200):
+            akeys = chapters(rng, rng.randint(1, 3), rng.randint(3, 30), poetry=True)
+            bkeys = variant(rng, akeys) if i % 3 else chapters(rng, rng.randint(1, 3), rng.randint(3, 30), poetry=True)
+            self.assertSameAsDifflib(akeys, bkeys)
+
+    def test_long(self):
+        # long enough for SequenceMatcher to treat popular keys as junk
+        rng = random.Random(160)
+        akeys = chapters(rng, 40, 20, poetry=True) + ["Para_0_0"] * 30
+        self.assertSameAsDifflib(akeys, variant(rng, akeys))
+        self.assertSameAsDifflib(akeys, chapters(rng, 40, 20, poetry=True) + ["Para_0_0"] * 30)
+
+if __name__ == "__main__":
+    unittest.main()
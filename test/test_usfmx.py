@@ -2,6 +2,7 @@
 
 import unittest, re
 from usfmtc.reference import Ref
+from ptxprint.xrefs import StrongsXrefs
 
 testmode = ("usfm", "usx")[1]
 if testmode == "usx":
@@ -19,10 +20,13 @@ class MockHyphen:
         return "-"
 
 class MockStrongs:
+    matcher = StrongsXrefs.matcher
+    findStrongs = StrongsXrefs.findStrongs
     def __init__(self):
         self.regexes = {"G25": r"(lov(ing|ed|e))"}
-    def addregexes(self, st):
-        pass
+        self.matchers = {}
+    def addregexes(self, st, script=None):
+        return ""       # no renderings
     def getstrongs(self, ref):
         if ref.first.chapter==3 and ref.first.verse==16:
             return ["G25"]
@@ -104,5 +108,49 @@ class TestUSFMClass(unittest.TestCase):
         t = str(subdoc[0][0][0])[9:9+len(res)] if self.mode == "usfm" else subdoc[0][0].tail[:len(res)]
         self.assertEqual(t, res)
 
+    def test_strongs_twice(self):
+        # two numbers in one text node are both marked, in the order they come
+        aStrongs = MockStrongs()
+        aStrongs.regexes["G2316"] = r"(God)"
+        aStrongs.getstrongs = lambda ref: ["G25", "G2316"] if ref.first.chapter == 3 and ref.first.verse == 16 else []
+        self.usfmdoc.addStrongs(aStrongs, True)
+        if self.mode == "usfm":
+            return
+        paras = [p for p in self.usfmdoc.getroot().iter("para") if any(c.tag == "ms" for c in p)]
+        self.assertEqual(len(paras), 1)
+        ms = [c for c in paras[0] if c.tag == "ms"]
+        self.assertEqual([m.get("strongs") for m in ms], ["2316", "25"])
+        self.assertEqual(paras[0][0].tail, "\u201CDue to \u200B")
+        self.assertEqual(ms[0].tail, "\u2064\u200AGod ")
+        self.assertTrue(ms[1].tail.startswith("\u2064\u200Aloving the people"))
+
+class TestFindStrongs(unittest.TestCase):
+
+    def setUp(self):
+        self.strongs = MockStrongs()
+        self.strongs.regexes.update({"G2316": r"(God)", "G3962": r"(God the Father|Father)",
+                                     "G3588": r"(the Father)", "G1": ""})
+
+    def test_overlap(self):
+        # the leftmost match wins over one that starts inside it
+        sts = {"G3962", "G3588"}
+        self.assertEqual(self.strongs.findStrongs(sts, "and Father loving the Father"),
+                         [(4, 10, "G3962"), (18, 28, "G3588")])
+        self.assertEqual(self.strongs.findStrongs({"G3588", "G2316"}, "God the Father"),
+                         [(0, 3, "G2316"), (4, 14, "G3588")])
+
+    def test_longest(self):
+        # where two start at the same place the longer is taken
+        txt = "loving God the Father"
+        self.assertEqual(self.strongs.findStrongs({"G2316", "G3962", "G25"}, txt),
+                         [(0, 6, "G25"), (7, 21, "G3962")])
+        self.assertEqual(self.strongs.findStrongs({"G2316"}, txt), [(7, 10, "G2316")])
+
+    def test_norenderings(self):
+        sts = {"G1", "G25", "G99"}
+        self.assertEqual(self.strongs.findStrongs(sts, "Love loved"), [(0, 4, "G25"), (5, 10, "G25")])
+        self.assertEqual(sts, {"G25"})
+        self.assertEqual(self.strongs.findStrongs(sts, "nothing here"), [])
+
 if __name__ == "__main__":
     unittest.main()
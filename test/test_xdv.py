@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+import unittest, os, tempfile, shutil, random
+from ptxprint.xdv.xdv import XDViReader, XDViWriter, XDViFilter, Font, procpages
+from ptxprint.xdv.colouring import PTXPxdviFilter
+
+fontpaths = [os.path.abspath(os.path.join("fonts", f)) for f in ("CharisSIL-Regular.ttf", "Andika-Regular.ttf")]
+
+# ptxp specials by page, so that the colouring state carries across the page ranges
+specials = {
+    0: ["ptxp:diacolour acute rgb 1 0 0", "ptxp:diaglyphs acute U+0301 36",
+        "ptxp:diacolour dots cmyk 0 1 1 0", "ptxp:diaglyphs dots U+0323 /dotbelowcomb 70"],
+    3: ["ptxp:diastart acute"],
+    9: ["ptxp:diastart dots"],
+    14: ["ptxp:pause"],
+    17: ["ptxp:unpause"],
+    26: ["ptxp:diastop acute"],
+    33: ["ptxp:diastop dots", "ptxp:diastart acute"],
+    40: ["ptxp:diastop acute"]
+}
+
+def makexdv(fname, numpages=45, seed=8):
+    """ Writes an xdv file of numpages pages of glyph runs in two fonts """
+    rng = random.Random(seed)
+    fonts = []
+    for i, p in enumerate(fontpaths):
+        f = Font(p)
+        (f.points, f.ident, f.color, f.variations, f.ext, f.slant, f.embolden) = (655360, i, 0xFFFFFFFF, [], 0, 0, 0)
+        fonts.append(f)
+    wrtr = XDViWriter(fname)
+    wrtr.pre(247, 7, 25400000, 473628672, 1000, b" XeTeX output 2026.10.18:1200")
+    for p in range(numpages):
+        wrtr.bop(139, p + 1, *([0] * 10))
+        wrtr.push(141, "push", [])
+        if p == 0:
+            for i, f in enumerate(fonts):
+                wrtr.xfontdef(252, i + 1, f)
+        for s in specials.get(p, []):
+            wrtr.xxx(239, s)
+        wrtr.font(171, 1 if p < 12 or p > 30 else 2)
+        for l in range(rng.randint(2, 6)):
+            wrtr.parmop(160, "down", 786432)
+            glyphs = [rng.choice([36, 68, 69, 70, 2213, 5, 5]) for i in range(rng.randint(1, 12))]
+            pos = [(i * 400000, 0) for i in range(len(glyphs))]
+            wrtr.xglyphs(254, 0, len(glyphs) * 400000, pos, glyphs, "abc")
+            if rng.random() < 0.3:
+                wrtr.xxx(239, "color push rgb 0 0 1")
+                wrtr.xglyphs(253, 1, 400000, [(0, 0)], [68], "")
+                wrtr.xxx(239, "color pop")
+        wrtr.pop(142, "pop", [])
+        wrtr.simple(140, "eop")
+    wrtr.multiparm(248, "post", [0, 25400000, 473628672, 1000, 50000000, 40000000, 3, numpages])
+    for i, f in enumerate(fonts):
+        wrtr.xfontdef(252, i + 1, f)
+    wrtr.multiparm(249, "postpost", [0, 7])
+    wrtr.finish()
+
+class TestProcPages(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tdir = tempfile.mkdtemp()
+        cls.inxdv = os.path.join(cls.tdir, "test.xdv")
+        makexdv(cls.inxdv)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tdir)
+
+    def filtered(self, filtercls, jobs, minpages=5):
+        outxdv = os.path.join(self.tdir, "out_{}_{}.xdv".format(filtercls.__name__, jobs))
+        procpages(self.inxdv, outxdv, filtercls, jobs=jobs, minpages=minpages)
+        with open(outxdv, "rb") as inf:
+            return inf.read()
+
+    def test_copy(self):
+        serial = self.filtered(XDViFilter, 1)
+        with open(self.inxdv, "rb") as inf:
+            self.assertEqual(serial, inf.read())
+        for jobs in (2, 3, 4):
+            self.assertEqual(self.filtered(XDViFilter, jobs), serial, jobs)
+
+    def test_colouring(self):
+        serial = self.filtered(PTXPxdviFilter, 1)
+        self.assertIn(b"color push rgb 1 0 0", serial)
+        self.assertIn(b"color push cmyk 0 1 1 0", serial)
+        self.assertNotIn(b"ptxp:", serial)
+        for jobs in (2, 3, 4, 7):
+            self.assertEqual(self.filtered(PTXPxdviFilter, jobs), serial, jobs)
+
+    def test_pages(self):
+        # the joined pages must still be found by the back pointers from the postamble
+        outxdv = os.path.join(self.tdir, "out_pages.xdv")
+        procpages(self.inxdv, outxdv, PTXPxdviFilter, jobs=3, minpages=5)
+        with XDViReader(outxdv) as rdr:
+            offsets = rdr.pageindex()
+            self.assertEqual(len(offsets), 45)
+            pagenos = []
+            for i in (0, 14, 15, 44):
+                rdr.seekpage(i)
+                (op, opc, data) = next(rdr)
+                pagenos.append(data[0])
+            self.assertEqual(pagenos, [1, 15, 16, 45])
+
+if __name__ == "__main__":
+    unittest.main()